@@ -9,8 +9,6 @@ from __future__ import annotations
 import logging
 import signal
 import sys
-import threading
-from typing import Optional
 
 from vpn_bot.config import load_settings
 from vpn_bot.handlers import BotApp
@@ -28,18 +26,20 @@ def main() -> int:
         interval=60,
         fetch_expired=app.fetch_expired_orders,
         mark_expired=app.mark_expired,
-        get_order_details=app.get_order_details,
         telegram_bot=app.bot,
         make_client=app.make_client,
+        stop_event=app.stop_event,
+        maintenance=app.run_maintenance,
     )
     worker.start()
 
-    stop_event = threading.Event()
-
     def handle_stop(signum: int, frame) -> None:  # pragma: no cover - signal handler
         LOGGER.info("received stop signal %s", signum)
-        stop_event.set()
-        worker.stop()
+        app.stop()
+        if app.waiting_for_updates:
+            # The socket read would otherwise be resumed after this handler
+            # returns and block shutdown until the long poll times out.
+            raise KeyboardInterrupt
 
     signal.signal(signal.SIGINT, handle_stop)
     signal.signal(signal.SIGTERM, handle_stop)
@@ -49,7 +49,7 @@ def main() -> int:
     except KeyboardInterrupt:  # pragma: no cover - interactive use
         LOGGER.info("exiting")
     finally:
-        worker.stop()
+        app.stop()
         worker.join(timeout=5)
     return 0
 
@@ -0,0 +1,5 @@
+-- Migration 003: Composite index for the expiration sweep
+-- The expiration worker looks up active orders whose expires_at has passed
+-- every minute; this index answers that query without a table scan.
+
+CREATE INDEX IF NOT EXISTS idx_orders_status_expires_at ON orders(status, expires_at);
@@ -0,0 +1,6 @@
+-- Migration 004: Indexes for handler lookups
+-- Covers the columns the bot filters on that migration 001 did not index.
+
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_inbounds_server_id ON inbounds(server_id);
+CREATE INDEX IF NOT EXISTS idx_server_pricing_server_id ON server_pricing(server_id, updated_at);
@@ -0,0 +1,89 @@
+"""Tests for configuration loading."""
+import dataclasses
+
+import pytest
+from vpn_bot import config
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    """Provide a clean environment with the required variables set."""
+    monkeypatch.setenv("DOTENV_PATH", str(tmp_path / "missing.env"))
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123:abc")
+    monkeypatch.setenv("BOT_ADMIN_PIN", "1234")
+    config.load_settings.cache_clear()
+    yield monkeypatch
+    config.load_settings.cache_clear()
+
+
+class TestLoadSettings:
+    """Test settings loading and caching."""
+
+    def test_load_settings_reads_environment(self, env):
+        """Test that required values are read from the environment."""
+        settings = config.load_settings()
+        assert settings.bot_token == "123:abc"
+        assert settings.admin_pin == "1234"
+
+    def test_load_settings_is_cached(self, env):
+        """Test that repeated calls return the same instance."""
+        first = config.load_settings()
+        env.setenv("TELEGRAM_BOT_TOKEN", "456:def")
+        assert config.load_settings() is first
+
+    def test_cache_clear_reloads(self, env):
+        """Test that clearing the cache picks up environment changes."""
+        config.load_settings()
+        env.setenv("TELEGRAM_BOT_TOKEN", "456:def")
+        config.load_settings.cache_clear()
+        assert config.load_settings().bot_token == "456:def"
+
+    def test_settings_are_frozen(self, env):
+        """Test that settings cannot be mutated after loading."""
+        settings = config.load_settings()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            settings.bot_token = "other"
+
+    def test_missing_token_raises(self, env):
+        """Test that a missing bot token raises RuntimeError."""
+        env.delenv("TELEGRAM_BOT_TOKEN")
+        env.delenv("BOT_TOKEN", raising=False)
+        with pytest.raises(RuntimeError):
+            config.load_settings()
+
+    def test_optional_settings_defaults(self, env):
+        """Test that unset optional values use their defaults."""
+        settings = config.load_settings()
+        assert settings.poll_interval == 1.0
+        assert settings.rate_limit_per_min == 20
+        assert settings.xui_verify_ssl is False
+        assert settings.default_language == "fa"
+        assert settings.handler_workers == 8
+
+    def test_optional_settings_parsed(self, env):
+        """Test that optional values are parsed to their field types."""
+        env.setenv("POLL_INTERVAL", "2.5")
+        env.setenv("RATE_LIMIT_PER_MIN", "5")
+        env.setenv("XUI_VERIFY_SSL", "1")
+        env.setenv("DEFAULT_LANGUAGE", "en")
+        settings = config.load_settings()
+        assert settings.poll_interval == 2.5
+        assert settings.rate_limit_per_min == 5
+        assert settings.xui_verify_ssl is True
+        assert settings.default_language == "en"
+
+    def test_invalid_optional_values_fall_back(self, env):
+        """Test that unparsable or unsupported values use the defaults."""
+        env.setenv("RATE_LIMIT_PER_MIN", "many")
+        env.setenv("MAX_RECEIPT_SIZE_MB", "big")
+        env.setenv("DEFAULT_LANGUAGE", "de")
+        settings = config.load_settings()
+        assert settings.rate_limit_per_min == 20
+        assert settings.max_receipt_size_mb == 5.0
+        assert settings.default_language == "fa"
+
+    def test_invalid_poll_interval_raises(self, env):
+        """Test that a non-numeric poll interval is rejected."""
+        env.setenv("POLL_INTERVAL", "soon")
+        with pytest.raises(RuntimeError):
+            config.load_settings()
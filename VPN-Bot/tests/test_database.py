@@ -0,0 +1,299 @@
+"""Tests for database helpers."""
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import pytest
+from vpn_bot import database
+
+
+@pytest.fixture
+def conn():
+    """Provide an initialized in-memory database."""
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    database.initialize(connection)
+    yield connection
+    connection.close()
+
+
+class TestConnect:
+    """Test connection setup."""
+
+    def test_connect_enables_wal(self, tmp_path):
+        """Test that file databases are opened in WAL mode with relaxed sync."""
+        connection = database.connect(str(tmp_path / "data" / "bot.db"))
+        try:
+            assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert connection.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert connection.execute("PRAGMA journal_size_limit").fetchone()[0] == 6144000
+        finally:
+            connection.close()
+
+    def test_connect_enables_incremental_vacuum(self, tmp_path):
+        """Test that new database files are created with incremental auto-vacuum."""
+        connection = database.connect(str(tmp_path / "bot.db"))
+        try:
+            database.initialize(connection)
+            assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # INCREMENTAL
+            database.run_maintenance(connection)
+        finally:
+            connection.close()
+
+    def test_connect_creates_parent_once(self, tmp_path):
+        """Test that the parent directory is created on first connect only."""
+        path = tmp_path / "nested" / "bot.db"
+        database.connect(str(path)).close()
+        assert path.parent.is_dir()
+        with patch("vpn_bot.database.Path.mkdir") as mock_mkdir:
+            database.connect(str(path)).close()
+        mock_mkdir.assert_not_called()
+
+    def test_connect_memory_database(self):
+        """Test that in-memory databases skip directory handling."""
+        with patch("vpn_bot.database.Path.mkdir") as mock_mkdir:
+            database.connect(":memory:").close()
+        mock_mkdir.assert_not_called()
+
+    def test_memory_database_is_shared(self):
+        """Test that connections to one memory_uri() share data."""
+        uri = database.memory_uri()
+        first = database.connect(uri)
+        second = database.connect(uri)
+        try:
+            database.initialize(first)
+            first.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+            assert second.execute("SELECT value FROM settings").fetchone()[0] == "1"
+        finally:
+            first.close()
+            second.close()
+
+    def test_memory_databases_are_separate(self):
+        """Test that ":memory:" connections and new URIs get their own databases."""
+        first = database.connect(":memory:")
+        second = database.connect(":memory:")
+        third = database.connect(database.memory_uri())
+        try:
+            database.initialize(first)
+            for other in (second, third):
+                tables = other.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]
+                assert tables == 0
+        finally:
+            first.close()
+            second.close()
+            third.close()
+
+
+class TestGetConnection:
+    """Test per-thread connection reuse."""
+
+    def test_same_thread_reuses_connection(self, tmp_path):
+        """Test that one thread always gets the same connection."""
+        path = str(tmp_path / "bot.db")
+        assert database.get_connection(path) is database.get_connection(path)
+
+    def test_threads_get_separate_connections(self, tmp_path):
+        """Test that another thread opens its own connection."""
+        path = str(tmp_path / "bot.db")
+        main_conn = database.get_connection(path)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.get_connection(path)))
+        thread.start()
+        thread.join()
+        assert other[0] is not main_conn
+
+
+class TestSchema:
+    """Test schema creation."""
+
+    def test_initialize_is_idempotent(self, conn):
+        """Test that initializing an existing database succeeds."""
+        database.initialize(conn)
+
+    def test_initialize_skips_unchanged_schema(self, conn):
+        """Test that an up-to-date database does not rerun the schema script."""
+        with patch.object(database, "_SCHEMA_SCRIPT", "CREATE TABLE broken ("):
+            database.initialize(conn)
+
+    def test_initialize_records_schema_version(self):
+        """Test that a fresh database gets the schema fingerprint."""
+        connection = sqlite3.connect(":memory:")
+        try:
+            database.initialize(connection)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            connection.close()
+        assert version == database._SCHEMA_VERSION
+
+    def test_initialize_is_atomic(self):
+        """Test that a failing schema statement leaves no tables behind."""
+        connection = sqlite3.connect(":memory:")
+        broken = database.CREATE_STATEMENTS + ["CREATE TABLE broken ("]
+        script = "BEGIN;\n" + ";\n".join(broken) + ";\nCOMMIT;"
+        with patch.object(database, "_SCHEMA_SCRIPT", script):
+            with pytest.raises(sqlite3.OperationalError):
+                database.initialize(connection)
+        connection.rollback()
+        tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        assert tables == []
+
+    def test_expired_order_scan_uses_index(self, conn):
+        """Test that the expiration query is answered from an index."""
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE status = ?"
+            " AND expires_at IS NOT NULL AND expires_at <= ? ORDER BY expires_at LIMIT ?",
+            ("ACTIVE", "2024-01-01T00:00:00", 500),
+        ).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_orders_status_expires_at" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_lookup_columns_are_indexed(self, conn):
+        """Test that handler lookup queries do not scan whole tables."""
+        queries = [
+            ("SELECT * FROM orders WHERE user_id = ?", (1,)),
+            ("SELECT * FROM orders WHERE status = ?", ("PENDING_REVIEW",)),
+            ("SELECT * FROM users WHERE telegram_id = ?", ("42",)),
+            ("SELECT * FROM users WHERE role = ?", ("ADMIN",)),
+            ("SELECT * FROM users WHERE username = ?", ("john",)),
+            ("SELECT * FROM plans WHERE server_id = ?", (1,)),
+            ("SELECT inbound_id FROM inbounds WHERE server_id = ? LIMIT 1", (1,)),
+            ("SELECT * FROM server_pricing WHERE server_id = ? ORDER BY updated_at DESC LIMIT 1", (1,)),
+        ]
+        for sql, params in queries:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            details = " ".join(row[-1] for row in plan)
+            assert "USING" in details and "INDEX" in details, sql
+
+
+class TestTransaction:
+    """Test the transaction context manager."""
+
+    def test_begins_immediately(self, conn):
+        """Test that the write transaction is open before any statement runs."""
+        with database.transaction(conn):
+            assert conn.in_transaction
+        assert not conn.in_transaction
+
+    def test_rolls_back_on_error(self, conn):
+        """Test that an exception discards the block's writes."""
+        with pytest.raises(ValueError):
+            with database.transaction(conn) as cur:
+                cur.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+                raise ValueError("boom")
+        assert conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0
+
+    def test_nested_block_joins_outer(self, conn):
+        """Test that a nested block does not commit the outer transaction."""
+        with database.transaction(conn) as outer:
+            with database.transaction(conn) as inner:
+                inner.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+            assert conn.in_transaction
+            outer.execute("INSERT INTO settings (key, value) VALUES ('b', '2')")
+        assert conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 2
+
+    def test_write_lock_taken_on_entry(self, tmp_path):
+        """Test that an open write block holds the write lock before it writes."""
+        path = str(tmp_path / "bot.db")
+        first = database.connect(path)
+        second = sqlite3.connect(path, timeout=0.05, isolation_level=None)
+        try:
+            with database.transaction(first, write=True):
+                with pytest.raises(sqlite3.OperationalError):
+                    with database.transaction(second, write=True):
+                        pass
+        finally:
+            first.close()
+            second.close()
+
+    def test_read_block_takes_no_write_lock(self, tmp_path):
+        """Test that a default block lets another connection write meanwhile."""
+        path = str(tmp_path / "bot.db")
+        first = database.connect(path)
+        database.initialize(first)
+        second = database.connect(path)
+        try:
+            with database.transaction(first) as cur:
+                cur.execute("SELECT COUNT(*) FROM settings").fetchone()
+                with database.transaction(second) as other:
+                    other.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+            assert first.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 1
+        finally:
+            first.close()
+            second.close()
+
+
+class TestFetchHelpers:
+    """Test row conversion helpers."""
+
+    def test_fetch_all_returns_dicts(self, conn):
+        """Test that fetch_all maps every row to a column dict."""
+        conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)", [("a", "1"), ("b", "2")])
+        cursor = conn.execute("SELECT key, value FROM settings ORDER BY key")
+        assert database.fetch_all(cursor) == [{"key": "a", "value": "1"}, {"key": "b", "value": "2"}]
+
+    def test_fetch_all_empty(self, conn):
+        """Test that fetch_all returns an empty list for no rows."""
+        cursor = conn.execute("SELECT key, value FROM settings")
+        assert database.fetch_all(cursor) == []
+
+    def test_fetch_all_restores_row_factory(self, conn):
+        """Test that fetch_all leaves the cursor's row factory unchanged."""
+        conn.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+        cursor = conn.execute("SELECT key, value FROM settings")
+        database.fetch_all(cursor)
+        assert cursor.execute("SELECT key FROM settings").fetchone()["key"] == "a"
+
+    def test_fetch_one_restores_row_factory(self, conn):
+        """Test that fetch_one leaves the cursor's row factory unchanged."""
+        conn.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+        cursor = conn.execute("SELECT key, value FROM settings")
+        database.fetch_one(cursor)
+        assert cursor.execute("SELECT key FROM settings").fetchone()["key"] == "a"
+
+    def test_fetch_one(self, conn):
+        """Test that fetch_one returns a dict or None."""
+        conn.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+        assert database.fetch_one(conn.execute("SELECT * FROM settings")) == {"key": "a", "value": "1"}
+        assert database.fetch_one(conn.execute("SELECT * FROM settings WHERE key = 'z'")) is None
+
+    def test_bulk_insert(self, conn):
+        """Test that bulk_insert writes all rows in one statement."""
+        with database.transaction(conn) as cur:
+            count = database.bulk_insert(cur, "settings", ("key", "value"), [("a", "1"), ("b", "2")])
+        assert count == 2
+        cursor = conn.execute("SELECT key, value FROM settings ORDER BY key")
+        assert database.fetch_all(cursor) == [{"key": "a", "value": "1"}, {"key": "b", "value": "2"}]
+
+    def test_bulk_insert_chunks_rows(self, conn):
+        """Test that bulk_insert writes batches larger than one chunk."""
+        rows = [(f"k{i:03d}", str(i)) for i in range(250)]
+        with database.transaction(conn) as cur:
+            count = database.bulk_insert(cur, "settings", ("key", "value"), rows, chunk_size=100)
+        assert count == 250
+        assert conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 250
+
+    def test_bulk_insert_caps_bound_parameters(self, conn):
+        """Test that an oversized chunk stays within the parameter limit."""
+        rows = [(f"k{i:04d}", str(i)) for i in range(1200)]
+        count = database.bulk_insert(conn.cursor(), "settings", ("key", "value"), rows, chunk_size=5000)
+        assert count == 1200
+
+    def test_fetch_columns(self, conn):
+        """Test that fetch_columns returns one list per result column."""
+        conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)", [("a", "1"), ("b", "2")])
+        cursor = conn.execute("SELECT key, value FROM settings ORDER BY key")
+        assert database.fetch_columns(cursor) == {"key": ["a", "b"], "value": ["1", "2"]}
+
+    def test_fetch_columns_empty(self, conn):
+        """Test that fetch_columns keeps the columns when no rows match."""
+        cursor = conn.execute("SELECT key, value FROM settings")
+        assert database.fetch_columns(cursor) == {"key": [], "value": []}
+
+    def test_iter_rows_streams_all_rows(self, conn):
+        """Test that iter_rows yields every row across fetch batches."""
+        database.bulk_insert(conn.cursor(), "settings", ("key", "value"), [(f"k{i}", str(i)) for i in range(5)])
+        cursor = conn.execute("SELECT key, value FROM settings ORDER BY key")
+        rows = list(database.iter_rows(cursor, arraysize=2))
+        assert [row["key"] for row in rows] == ["k0", "k1", "k2", "k3", "k4"]
+        assert rows[0][1] == "0"
@@ -0,0 +1,412 @@
+"""Tests for update dispatch in the bot application."""
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+
+from vpn_bot import database
+from vpn_bot.config import Settings
+from vpn_bot.handlers import BotApp
+from vpn_bot.telegram import MEDIA_GROUP_LIMIT
+from vpn_bot.xui_api import XUIError
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Yield a BotApp on a fresh database file, with the Telegram bot mocked."""
+    bot_app = BotApp(Settings(bot_token="123:abc", admin_pin="0000", database_path=str(tmp_path / "bot.db")))
+    bot_app.bot = Mock()
+    yield bot_app
+    bot_app._pool.shutdown(wait=True)
+
+
+def message_update(update_id, chat_id):
+    """Build a minimal message update for ``chat_id``."""
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}}}
+
+
+class TestDispatch:
+    """Test concurrent update dispatch."""
+
+    def test_updates_of_one_chat_stay_in_order(self, app):
+        """Test that a chat's updates are handled in arrival order."""
+        handled = []
+        lock = threading.Lock()
+
+        def process(update):
+            time.sleep(0.001)
+            with lock:
+                handled.append(update["update_id"])
+
+        app._process_update = process
+        for update_id in range(30):
+            app._dispatch(message_update(update_id, update_id % 3))
+        app._pool.shutdown(wait=True)
+
+        assert len(handled) == 30
+        for chat_id in range(3):
+            chat_updates = [u for u in handled if u % 3 == chat_id]
+            assert chat_updates == sorted(chat_updates)
+        assert app._chat_queues == {}
+
+    def test_chats_are_handled_concurrently(self, app):
+        """Test that a slow update does not block another chat."""
+        barrier = threading.Barrier(2, timeout=5)
+        app._process_update = lambda update: barrier.wait()
+        app._dispatch(message_update(1, 1))
+        app._dispatch(message_update(2, 2))
+        app._pool.shutdown(wait=True)
+        assert not barrier.broken
+
+    def test_failing_update_does_not_stop_chat(self, app):
+        """Test that an exception is logged and later updates still run."""
+        handled = []
+
+        def process(update):
+            if update["update_id"] == 1:
+                raise ValueError("boom")
+            handled.append(update["update_id"])
+
+        app._process_update = process
+        app._dispatch(message_update(1, 5))
+        app._dispatch(message_update(2, 5))
+        app._pool.shutdown(wait=True)
+        assert handled == [2]
+
+
+def add_menu(app):
+    """Insert one plan and the bank card shown in the purchase menu."""
+    with database.transaction(app.conn) as cur:
+        cur.execute(
+            "INSERT INTO plans (server_id, name, country, inbound_id, volume_gb, duration_days, price)"
+            " VALUES (1, 'Basic', 'DE', 1, 10, 30, 5)"
+        )
+        cur.execute("INSERT INTO settings (key, value) VALUES ('bank_card', '6037')")
+
+
+class TestPurchaseMenu:
+    """Test caching of the purchase menu."""
+
+    def test_menu_is_served_from_cache(self, app):
+        """Test that repeated menus reuse the cached plans and bank card."""
+        add_menu(app)
+        app._show_plans_for_purchase(1)
+        with database.transaction(app.conn) as cur:
+            cur.execute("DELETE FROM plans")
+        app._show_plans_for_purchase(2)
+        first, second = app.bot.send_message.call_args_list
+        assert first.args[1] == second.args[1]
+        assert "Basic" in first.args[1] and "6037" in first.args[1]
+
+    def test_bank_card_update_clears_cache(self, app):
+        """Test that saving a bank card is visible in the next menu."""
+        add_menu(app)
+        app._show_plans_for_purchase(1)
+        app._handle_bank_card({"chat": {"id": 1}, "text": "5022"}, {})
+        app._show_plans_for_purchase(1)
+        assert "5022" in app.bot.send_message.call_args.args[1]
+
+    def test_deleted_plan_leaves_menu(self, app):
+        """Test that deleting a plan through the bot clears the cache."""
+        add_menu(app)
+        app._show_plans_for_purchase(1)
+        app._delete_plan(1, 1)
+        app._show_plans_for_purchase(1)
+        assert app.bot.send_message.call_args.args[1] == "No plans available right now."
+
+    def test_load_overtaken_by_invalidation_is_not_cached(self, app):
+        """Test that a menu loaded before a concurrent change is not stored."""
+        add_menu(app)
+
+        def stale_load():
+            value = app._load_purchase_plans()
+            app._delete_plan(1, 1)
+            return value
+
+        assert "Basic" in app._cached("plans", stale_load)[0]
+        assert app._menu_cache == {}
+        assert app._cached("plans", app._load_purchase_plans)[0] == ""
+
+
+class TestUserOrders:
+    """Test the user's order list."""
+
+    def test_orders_are_listed_newest_first(self, app):
+        """Test that plan and custom orders are both summarised."""
+        add_menu(app)
+        with database.transaction(app.conn) as cur:
+            cur.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '7', 'USER')")
+            cur.execute("INSERT INTO orders (user_id, plan_id, status) VALUES (1, 1, 'ACTIVE')")
+            cur.execute(
+                "INSERT INTO orders (user_id, status, volume_gb, duration_days) VALUES (1, 'PENDING_REVIEW', 20, 60)"
+            )
+        app._show_user_orders(7)
+        text = app.bot.send_message.call_args.args[1]
+        assert text.index("Order #2 - Custom Plan (20GB, 60 days)") < text.index("Order #1 - Basic")
+        assert "Expires: -" in text
+
+    def test_no_orders(self, app):
+        """Test the message shown to a user without orders."""
+        add_menu(app)
+        with database.transaction(app.conn) as cur:
+            cur.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '7', 'USER')")
+        app._show_user_orders(7)
+        app.bot.send_message.assert_called_once_with(7, "You have no orders yet.")
+
+
+# Registry key of the panel client for the test server row
+PANEL_KEY = (1, "https://panel.example", "admin", "secret")
+
+
+def add_server(app):
+    """Insert the menu rows and one panel server row."""
+    add_menu(app)
+    with database.transaction(app.conn) as cur:
+        cur.execute(
+            "INSERT INTO servers (id, title, base_url, username, password)"
+            " VALUES (1, 'de', 'https://panel.example', 'admin', 'secret')"
+        )
+
+
+class TestPanelClients:
+    """Test reuse of panel clients across calls."""
+
+    def test_client_is_reused(self, app):
+        """Test that one client is kept per server."""
+        add_server(app)
+        assert app.make_client(1) is app.make_client(1)
+
+    def test_deleting_server_drops_client(self, app):
+        """Test that a deleted server's client is not reused."""
+        add_server(app)
+        app.make_client(1)
+        app._delete_server(1, 1)
+        assert app._clients == {}
+
+    def test_edited_credentials_get_new_client(self, app):
+        """Test that a changed server password replaces the old client."""
+        add_server(app)
+        old = app.make_client(1)
+        with database.transaction(app.conn) as cur:
+            cur.execute("UPDATE servers SET password = 'changed' WHERE id = 1")
+        new = app.make_client(1)
+
+        assert new is not old
+        assert list(app._clients) == [(1, "https://panel.example", "admin", "changed")]
+
+
+def assert_no_transaction(app):
+    """Fail if the app's connection is inside a transaction."""
+    assert not app.conn.in_transaction
+
+
+class TestAssignRole:
+    """Test assigning staff roles by username."""
+
+    def test_unknown_user_is_reported_after_commit(self, app):
+        """Test that the not-found reply is sent with no transaction open."""
+        add_menu(app)
+        app.bot.send_message.side_effect = lambda *args, **kwargs: assert_no_transaction(app)
+        app._handle_assign_role({"chat": {"id": 1}, "text": "@nobody ADMIN"}, {})
+
+        app.bot.send_message.assert_called_once_with(1, "User not found. Ask them to /start the bot first.")
+
+    def test_role_is_updated(self, app):
+        """Test that a known user gets the new role."""
+        add_menu(app)
+        with database.transaction(app.conn) as cur:
+            cur.execute("INSERT INTO users (id, telegram_id, username, role) VALUES (1, '7', 'john', 'USER')")
+        app._handle_assign_role({"chat": {"id": 1}, "text": "@john accountant"}, {})
+
+        assert app.conn.execute("SELECT role FROM users WHERE id = 1").fetchone()[0] == "ACCOUNTANT"
+
+
+class TestStartPurchase:
+    """Test starting a prebuilt plan purchase."""
+
+    def test_order_is_committed_and_receipt_requested(self, app):
+        """Test that the new order is visible to other connections."""
+        add_menu(app)
+        with database.transaction(app.conn) as cur:
+            cur.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '7', 'USER')")
+        app._start_purchase(7, 1)
+
+        other = database.connect(app.settings.database_path)
+        status = other.execute("SELECT status FROM orders WHERE user_id = 1").fetchone()[0]
+        other.close()
+        assert status == "WAITING_RECEIPT"
+        assert app.states[7]["order_id"] == 1
+        assert not app.conn.in_transaction
+
+
+def add_review_order(app):
+    """Insert a server, one order waiting for approval and a mocked panel client."""
+    add_server(app)
+    with database.transaction(app.conn) as cur:
+        cur.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '7', 'USER')")
+        cur.execute("INSERT INTO orders (id, user_id, plan_id, status) VALUES (1, 1, 1, 'PENDING_REVIEW')")
+    client = app._clients[PANEL_KEY] = Mock()
+    client.create_client.return_value = {"success": True, "obj": {"id": "uuid-1"}}
+    client.get_inbound.return_value = {}
+
+
+def order_status(app):
+    """Return the status of the test order."""
+    return app.conn.execute("SELECT status FROM orders WHERE id = 1").fetchone()[0]
+
+
+def add_pending_orders(app, with_receipt, without_receipt=0):
+    """Insert orders waiting for review, with and without a receipt photo."""
+    with database.transaction(app.conn) as cur:
+        cur.execute("INSERT INTO users (id, telegram_id, username, role) VALUES (1, '7', 'buyer', 'USER')")
+        for number in range(1, with_receipt + without_receipt + 1):
+            receipt = f"photo-{number}" if number <= with_receipt else None
+            cur.execute(
+                "INSERT INTO orders (id, user_id, plan_id, status, receipt_file_id)"
+                " VALUES (?, 1, 1, 'PENDING_REVIEW', ?)",
+                (number, receipt),
+            )
+
+
+def reviewed_ids(keyboard):
+    """Return the order ids offered for approval in a review keyboard."""
+    return [int(row[0]["callback_data"].rsplit(":", 1)[1]) for row in keyboard["inline_keyboard"]]
+
+
+class TestPendingOrders:
+    """Test how pending receipts are shown to reviewers."""
+
+    def test_receipts_are_sent_as_albums_with_a_summary(self, app):
+        """Test that receipts are grouped into albums followed by their buttons."""
+        add_menu(app)
+        add_pending_orders(app, with_receipt=MEDIA_GROUP_LIMIT + 1, without_receipt=1)
+        app._show_pending_orders(5)
+
+        album = app.bot.send_media_group.call_args.args[1]
+        assert [item["media"] for item in album] == [f"photo-{n}" for n in range(1, MEDIA_GROUP_LIMIT + 1)]
+        assert album[0]["caption"] == "Order #1 from @buyer for Basic"
+        summary, no_receipt = app.bot.send_message.call_args_list
+        assert summary.args[1].splitlines()[0] == "Order #1 from @buyer for Basic"
+        assert reviewed_ids(summary.kwargs["reply_markup"]) == list(range(1, MEDIA_GROUP_LIMIT + 1))
+        assert app.bot.send_photo.call_args.args == (5, f"photo-{MEDIA_GROUP_LIMIT + 1}")
+        assert reviewed_ids(no_receipt.kwargs["reply_markup"]) == [MEDIA_GROUP_LIMIT + 2]
+
+    def test_single_receipt_is_sent_as_photo(self, app):
+        """Test that a batch of one falls back to a photo carrying its own buttons."""
+        add_menu(app)
+        add_pending_orders(app, with_receipt=1)
+        app._show_pending_orders(5)
+
+        app.bot.send_media_group.assert_not_called()
+        app.bot.send_message.assert_not_called()
+        args, kwargs = app.bot.send_photo.call_args
+        assert args == (5, "photo-1")
+        assert kwargs["caption"] == "Order #1 from @buyer for Basic"
+        assert reviewed_ids(kwargs["reply_markup"]) == [1]
+
+
+class TestOrderReview:
+    """Test approving and rejecting orders from several admin chats."""
+
+    def test_rejection_during_approval_is_refused(self, app):
+        """Test that an order being approved cannot be rejected meanwhile."""
+        add_review_order(app)
+        app._clients[PANEL_KEY].create_client.side_effect = lambda *args: (
+            app._reject_order(2, 1) or {"success": True, "obj": {"id": "uuid-1"}}
+        )
+        app._approve_order(1, 1)
+
+        assert order_status(app) == "ACTIVE"
+        app.bot.send_message.assert_any_call(2, "Order is not waiting for approval.")
+
+    def test_lost_claim_removes_panel_client(self, app):
+        """Test that an approval that loses its claim removes the new panel client."""
+        add_review_order(app)
+
+        def steal_order(*args):
+            with database.transaction(app.conn) as cur:
+                cur.execute("UPDATE orders SET status = 'REJECTED' WHERE id = 1")
+            return {"success": True, "obj": {"id": "uuid-1"}}
+
+        app._clients[PANEL_KEY].create_client.side_effect = steal_order
+        app._approve_order(1, 1)
+
+        assert order_status(app) == "REJECTED"
+        app._clients[PANEL_KEY].remove_client.assert_called_once_with(1, "uuid-1")
+
+    def test_panel_error_releases_claim(self, app):
+        """Test that a failed panel call leaves the order waiting for approval."""
+        add_review_order(app)
+        app._clients[PANEL_KEY].create_client.side_effect = XUIError("panel down")
+        app._approve_order(1, 1)
+
+        assert order_status(app) == "PENDING_REVIEW"
+
+    def test_failed_activation_releases_claim(self, app):
+        """Test that an error on the final update returns the order and removes its client."""
+        add_review_order(app)
+        app.conn.execute(
+            "CREATE TRIGGER fail_activation BEFORE UPDATE OF status ON orders"
+            " WHEN NEW.status = 'ACTIVE' BEGIN SELECT RAISE(ABORT, 'database is locked'); END"
+        )
+        with pytest.raises(sqlite3.DatabaseError):
+            app._approve_order(1, 1)
+
+        assert order_status(app) == "PENDING_REVIEW"
+        app._clients[PANEL_KEY].remove_client.assert_called_once_with(1, "uuid-1")
+
+    def test_unexpected_panel_error_releases_claim(self, app):
+        """Test that a non-panel exception during approval still releases the claim."""
+        add_review_order(app)
+        app._clients[PANEL_KEY].create_client.side_effect = RuntimeError("boom")
+        with pytest.raises(RuntimeError):
+            app._approve_order(1, 1)
+
+        assert order_status(app) == "PENDING_REVIEW"
+        app._clients[PANEL_KEY].remove_client.assert_not_called()
+
+    def test_startup_releases_interrupted_approvals(self, tmp_path):
+        """Test that orders left in APPROVING by a crash return to review on startup."""
+        db_path = str(tmp_path / "bot.db")
+        conn = database.connect(db_path)
+        database.initialize(conn)
+        conn.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '7', 'USER')")
+        conn.execute("INSERT INTO orders (id, user_id, status) VALUES (1, 1, 'APPROVING')")
+        conn.close()
+
+        app = BotApp(Settings(bot_token="123:abc", admin_pin="0000", database_path=db_path))
+        try:
+            assert order_status(app) == "PENDING_REVIEW"
+        finally:
+            app._pool.shutdown(wait=True)
+
+    def test_second_rejection_is_refused(self, app):
+        """Test that an order is only rejected once."""
+        add_review_order(app)
+        app._reject_order(1, 1)
+        app._reject_order(2, 1)
+
+        assert order_status(app) == "REJECTED"
+        app.bot.send_message.assert_any_call(2, "Order is not waiting for approval.")
+
+
+class TestMemoryDatabase:
+    """Test running the bot on an in-memory database."""
+
+    def test_threads_share_one_named_database(self):
+        """Test that ":memory:" is named once so every thread sees the same data."""
+        app = BotApp(Settings(bot_token="123:abc", admin_pin="0000", database_path=":memory:"))
+        try:
+            assert app.settings.database_path.startswith("file:memdb-")
+            with database.transaction(app.conn) as cur:
+                cur.execute("INSERT INTO settings (key, value) VALUES ('a', '1')")
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                value = pool.submit(
+                    lambda: app.conn.execute("SELECT value FROM settings").fetchone()[0]
+                ).result()
+            assert value == "1"
+        finally:
+            app._pool.shutdown(wait=True)
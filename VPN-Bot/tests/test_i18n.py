@@ -27,12 +27,55 @@ class TestI18n:
         text = i18n.get_text("admin.add_server", lang="fa")
         assert text == "افزودن سرور"
 
+    def test_nested_keys_are_indexed(self):
+        """Test that every nested key resolves with a single dotted lookup."""
+        for section, entries in i18n._TRANSLATIONS["en"].items():
+            if not isinstance(entries, dict):
+                continue
+            for name, value in entries.items():
+                assert i18n._FLAT[("en", f"{section}.{name}")] == value
+
     def test_get_text_with_formatting(self):
         """Test translation with parameter formatting."""
         text = i18n.get_text("admin.role_updated", lang="en", username="@john", role="ADMIN")
         assert "@john" in text
         assert "ADMIN" in text
 
+    def test_get_text_formatting_distinguishes_value_types(self):
+        """Test that cached formatting keeps equal values of different types apart."""
+        first = i18n.get_text("admin.role_updated", lang="en", username="@john", role=1)
+        second = i18n.get_text("admin.role_updated", lang="en", username="@john", role=1.0)
+        assert "1.0" not in first
+        assert "1.0" in second
+
+    def test_get_text_formatting_distinguishes_signed_zero(self):
+        """Test that cached formatting keeps ``0.0`` and ``-0.0`` apart."""
+        negative = i18n.get_text("admin.role_updated", lang="en", username="@john", role=-0.0)
+        positive = i18n.get_text("admin.role_updated", lang="en", username="@john", role=0.0)
+        assert "-0.0" in negative
+        assert "-0.0" not in positive
+
+    def test_get_text_formatting_with_unhashable_value(self):
+        """Test that unhashable format parameters are still interpolated."""
+        text = i18n.get_text("admin.role_updated", lang="en", username="@john", role=["ADMIN"])
+        assert "['ADMIN']" in text
+
+    def test_get_text_formats_mutable_objects_each_time(self):
+        """Test that an argument without value equality is not served from the cache."""
+
+        class Role:
+            name = "ADMIN"
+
+            def __str__(self):
+                return self.name
+
+        role = Role()
+        first = i18n.get_text("admin.role_updated", lang="en", username="@john", role=role)
+        role.name = "ACCOUNTANT"
+        second = i18n.get_text("admin.role_updated", lang="en", username="@john", role=role)
+        assert "ADMIN" in first
+        assert "ACCOUNTANT" in second
+
     def test_get_text_missing_key(self):
         """Test handling of missing translation key."""
         text = i18n.get_text("nonexistent.key", lang="en")
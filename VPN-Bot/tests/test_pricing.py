@@ -48,6 +48,37 @@ class TestPricing:
         assert breakdown["base_volume"] == 20.0
         assert breakdown["extra_months"] == 4.0
 
+    def test_pergb_batch_matches_scalar(self):
+        """Test batch per-GB pricing matches the scalar calculation."""
+        selections = [(10, 1, 1), (10, 3, 1), (25, 2, 3), (1, 6, 2)]
+        volumes, durations, users = zip(*selections)
+        for pricing_config in (
+            {"price_per_gb": 2.0, "additional_user_price": 1.5},
+            {"price_per_gb": 2.0, "extra_month_price_percent": 10.0},
+            {"price_per_gb": 2.0, "extra_month_price_absolute": 5.0},
+        ):
+            totals = pricing.calculate_pergb_price_batch(
+                volumes, durations, users, pricing_config
+            )
+            expected = [
+                pricing.calculate_pergb_price(v, d, u, pricing_config)[0]
+                for v, d, u in selections
+            ]
+            assert totals == expected
+
+    def test_compiled_price_is_reused(self):
+        """Test that equal pricing values share one compiled function."""
+        first = pricing.compile_pergb_price({"id": 1, "price_per_gb": 2.0})
+        second = pricing.compile_pergb_price({"id": 2, "price_per_gb": 2.0})
+        assert first is second
+        assert first(10, 1, 1)[0] == 20.0
+
+    def test_compiled_price_follows_edits(self):
+        """Test that changed pricing values are not served from the cache."""
+        pricing.compile_pergb_price({"id": 1, "price_per_gb": 2.0})
+        edited = pricing.compile_pergb_price({"id": 1, "price_per_gb": 3.0})
+        assert edited(10, 1, 1)[0] == 30.0
+
     def test_pergb_with_extra_months_absolute(self):
         """Test per-GB pricing with absolute extra month pricing."""
         pricing_config = {
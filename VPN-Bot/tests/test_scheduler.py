@@ -0,0 +1,157 @@
+"""Tests for the expiration worker."""
+import sqlite3
+import threading
+import time
+from unittest.mock import Mock
+
+from vpn_bot.scheduler import ExpirationWorker
+from vpn_bot.xui_api import XUIError
+
+
+def make_worker(**overrides):
+    """Build a worker with mocked collaborators."""
+    kwargs = dict(
+        interval=60,
+        fetch_expired=Mock(return_value=[]),
+        mark_expired=Mock(),
+        telegram_bot=Mock(),
+        make_client=Mock(),
+    )
+    kwargs.update(overrides)
+    return ExpirationWorker(**kwargs)
+
+
+class TestExpirationWorker:
+    """Test expiration worker behaviour."""
+
+    def test_shared_stop_event_stops_worker(self):
+        """Test that setting a shared stop event ends the worker loop."""
+        stop_event = threading.Event()
+        worker = make_worker(stop_event=stop_event)
+        worker.start()
+        stop_event.set()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+
+    def test_stop_sets_event(self):
+        """Test that stop() sets the worker's stop event."""
+        stop_event = threading.Event()
+        worker = make_worker(stop_event=stop_event)
+        worker.stop()
+        assert stop_event.is_set()
+
+    def test_tick_removes_config_and_marks_expired(self):
+        """Test that an expired order is removed from the panel and marked."""
+        client = Mock()
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[{
+                "id": 7,
+                "config_id": "uuid-7",
+                "inbound_id": 3,
+                "server_id": 1,
+                "telegram_id": "42",
+            }]),
+            make_client=Mock(return_value=client),
+        )
+        worker._tick()
+        client.remove_client.assert_called_once_with(3, "uuid-7")
+        worker.mark_expired.assert_called_once_with([7])
+        worker.telegram_bot.send_message.assert_called_once()
+
+    def test_tick_removes_configs_concurrently(self):
+        """Test that panel removals for different orders overlap."""
+        barrier = threading.Barrier(2, timeout=5)
+        client = Mock()
+        client.remove_client.side_effect = lambda *args: barrier.wait()
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[
+                {"id": order_id, "config_id": f"uuid-{order_id}", "inbound_id": 3, "server_id": 1}
+                for order_id in (1, 2)
+            ]),
+            make_client=Mock(return_value=client),
+        )
+        worker._tick()
+        assert client.remove_client.call_count == 2
+        worker.mark_expired.assert_called_once_with([1, 2])
+
+    def test_tick_reuses_client_per_server(self):
+        """Test that orders on the same server share one panel client."""
+        make_client = Mock()
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[
+                {"id": 1, "config_id": "a", "inbound_id": 3, "server_id": 1},
+                {"id": 2, "config_id": "b", "inbound_id": 3, "server_id": 1},
+                {"id": 3, "config_id": "c", "inbound_id": 4, "server_id": 2},
+            ]),
+            make_client=make_client,
+        )
+        worker._tick()
+        assert [c.args for c in make_client.call_args_list] == [(1,), (2,)]
+
+    def test_failed_removal_still_marks_expired(self):
+        """Test that a panel error does not stop the order being expired."""
+        client = Mock()
+        client.remove_client.side_effect = XUIError("panel down")
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[{"id": 7, "config_id": "uuid-7", "inbound_id": 3, "server_id": 1}]),
+            make_client=Mock(return_value=client),
+        )
+        worker._tick()
+        worker.mark_expired.assert_called_once_with([7])
+
+    def test_unexpected_removal_error_still_marks_batch(self):
+        """Test that an unexpected panel error does not stop the batch being expired."""
+        client = Mock()
+        client.remove_client.side_effect = [TypeError("bad reply"), None]
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[
+                {"id": order_id, "config_id": f"uuid-{order_id}", "inbound_id": 3, "server_id": 1, "telegram_id": "42"}
+                for order_id in (1, 2)
+            ]),
+            make_client=Mock(return_value=client),
+            max_parallel_removals=1,
+        )
+        worker._tick()
+        worker.mark_expired.assert_called_once_with([1, 2])
+        assert worker.telegram_bot.send_message.call_count == 2
+
+    def test_lookup_error_still_marks_batch(self):
+        """Test that orders are marked expired even if building a client fails."""
+        worker = make_worker(
+            fetch_expired=Mock(return_value=[{"id": 7, "config_id": "uuid-7", "inbound_id": 3, "server_id": 1}]),
+            make_client=Mock(side_effect=sqlite3.OperationalError("locked")),
+        )
+        worker._tick()
+        worker.mark_expired.assert_called_once_with([7])
+
+    def test_maintenance_runs_when_due(self):
+        """Test that maintenance runs once its interval has elapsed."""
+        maintenance = Mock()
+        worker = make_worker(maintenance=maintenance, maintenance_interval=0)
+        worker._maybe_run_maintenance()
+        maintenance.assert_called_once()
+
+    def test_maintenance_waits_for_interval(self):
+        """Test that maintenance does not run before its interval."""
+        maintenance = Mock()
+        worker = make_worker(maintenance=maintenance, maintenance_interval=3600)
+        worker._maybe_run_maintenance()
+        maintenance.assert_not_called()
+
+    def test_maintenance_failure_is_contained(self):
+        """Test that a failing maintenance run does not raise."""
+        worker = make_worker(maintenance=Mock(side_effect=RuntimeError("locked")), maintenance_interval=0)
+        worker._maybe_run_maintenance()
+
+    def test_next_start_keeps_fixed_cadence(self):
+        """Test that the next tick is scheduled from the previous start."""
+        worker = make_worker(interval=60)
+        started_at = time.monotonic() - 10
+        assert worker._next_start(started_at) == started_at + 60
+
+    def test_overrun_tick_is_followed_immediately(self):
+        """Test that a tick longer than the interval does not add a sleep."""
+        worker = make_worker(interval=60)
+        before = time.monotonic()
+        next_start = worker._next_start(before - 100)
+        assert before <= next_start <= time.monotonic()
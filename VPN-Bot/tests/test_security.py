@@ -1,6 +1,19 @@
 """Tests for security utilities."""
+import sqlite3
+from datetime import datetime, timedelta
+
 import pytest
-from vpn_bot import security
+from vpn_bot import database, security
+
+
+@pytest.fixture
+def conn():
+    """Provide an initialized in-memory database with one user."""
+    connection = sqlite3.connect(":memory:")
+    database.initialize(connection)
+    connection.execute("INSERT INTO users (id, telegram_id, role) VALUES (1, '42', 'USER')")
+    yield connection
+    connection.close()
 
 
 class TestSecurity:
@@ -16,6 +29,11 @@ class TestSecurity:
         result = security.sanitize_string("Hello\x00World")
         assert result == "HelloWorld"
 
+    def test_sanitize_string_with_control_chars(self):
+        """Test string sanitization removes control characters but keeps newlines."""
+        result = security.sanitize_string("Hello\x1b[31m\x07\tWorld\nBye\r\n")
+        assert result == "Hello[31m\tWorld\nBye"
+
     def test_sanitize_string_max_length(self):
         """Test string sanitization respects max length."""
         long_string = "A" * 1000
@@ -107,6 +125,12 @@ class TestSecurity:
         assert " " not in result
         assert result == "myfilename.jpg"
 
+    def test_secure_filename_truncates_keeping_extension(self):
+        """Test secure filename truncates long names but keeps the extension."""
+        result = security.secure_filename("a" * 500 + ".png")
+        assert len(result) == security.MAX_FILENAME_LENGTH
+        assert result.endswith(".png")
+
     def test_validate_admin_pin_correct(self):
         """Test admin PIN validation with correct PIN."""
         assert security.validate_admin_pin("12345", "12345") is True
@@ -123,3 +147,55 @@ class TestSecurity:
         """Test admin PIN validation with empty input."""
         assert security.validate_admin_pin("", "12345") is False
         assert security.validate_admin_pin("12345", "") is False
+
+    def test_validate_admin_pin_non_ascii(self):
+        """Test admin PIN validation with non-ASCII input."""
+        assert security.validate_admin_pin("۱۲۳۴", "۱۲۳۴") is True
+        assert security.validate_admin_pin("۱۲۳۴", "1234") is False
+
+
+class TestRateLimit:
+    """Test per-user request rate limiting."""
+
+    def test_allows_requests_up_to_limit(self, conn):
+        """Test that requests within the limit pass and the next is refused."""
+        assert all(security.check_rate_limit(conn, 1, limit_per_minute=3) for _ in range(3))
+        assert security.check_rate_limit(conn, 1, limit_per_minute=3) is False
+
+    def test_refused_request_is_logged_not_counted(self, conn):
+        """Test that a refused request logs an event and leaves the counter."""
+        for _ in range(3):
+            security.check_rate_limit(conn, 1, limit_per_minute=2)
+        count = conn.execute("SELECT rate_limit_count FROM users WHERE id = 1").fetchone()[0]
+        events = conn.execute("SELECT COUNT(*) FROM security_events").fetchone()[0]
+        assert count == 2
+        assert events == 1
+
+    def test_expired_window_resets_counter(self, conn):
+        """Test that a new window starts once the reset time has passed."""
+        past = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+        conn.execute("UPDATE users SET rate_limit_count = 5, rate_limit_reset = ? WHERE id = 1", (past,))
+        assert security.check_rate_limit(conn, 1, limit_per_minute=5)
+        count, reset = conn.execute("SELECT rate_limit_count, rate_limit_reset FROM users WHERE id = 1").fetchone()
+        assert count == 1
+        assert reset > datetime.utcnow().isoformat()
+
+    def test_unknown_user_is_allowed(self, conn):
+        """Test that a missing user row does not block the request."""
+        assert security.check_rate_limit(conn, 99, limit_per_minute=1)
+
+
+class TestSecurityEvents:
+    """Test security event logging."""
+
+    def test_event_is_committed_immediately(self, tmp_path):
+        """Test that a logged event is visible to another connection at once."""
+        db_path = str(tmp_path / "bot.db")
+        conn = database.connect(db_path)
+        database.initialize(conn)
+        security.log_security_event(conn, None, "test", "now", telegram_id="42")
+        other = database.connect(db_path)
+        rows = other.execute("SELECT telegram_id, description FROM security_events").fetchall()
+        assert [tuple(row) for row in rows] == [("42", "now")]
+        other.close()
+        conn.close()
@@ -0,0 +1,228 @@
+"""Tests for the Telegram Bot API wrapper."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from unittest.mock import Mock, patch
+
+from vpn_bot import telegram
+from vpn_bot.telegram import (
+    LONG_POLL_READ_MARGIN,
+    LONG_POLL_TIMEOUT,
+    TelegramAPIError,
+    TelegramBot,
+    json_dumps,
+)
+
+
+def make_response(payload):
+    """Build a mock HTTP response returning ``payload`` as JSON."""
+    response = Mock()
+    response.json.return_value = payload
+    return response
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answer each request with the next ``(status, headers)`` of the server's script."""
+
+    def _reply(self):
+        self.server.methods.append(self.command)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        body = json.dumps({"ok": status == 200, "result": []}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def scripted_bot():
+    """Yield a bot whose adapter talks to a local server, and that server."""
+    server = HTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.script, server.methods = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    bot = TelegramBot("123:abc")
+    bot.session.mount("http://", bot.session.get_adapter("https://api.telegram.org/"))
+    bot.base_url = f"http://127.0.0.1:{server.server_port}/"
+    yield bot, server
+    server.shutdown()
+    server.server_close()
+
+
+class TestTelegramBot:
+    """Test TelegramBot request handling."""
+
+    def test_get_updates_uses_long_poll_timeout(self):
+        """Test that getUpdates long-polls and the read timeout exceeds it."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": True, "result": [{"update_id": 1}]})
+
+        with patch.object(bot.session, "get", return_value=response) as mock_get:
+            updates = bot.get_updates(offset=5)
+
+        assert updates == [{"update_id": 1}]
+        kwargs = mock_get.call_args[1]
+        assert kwargs["params"] == {"timeout": LONG_POLL_TIMEOUT, "offset": 5}
+        assert kwargs["timeout"] == LONG_POLL_TIMEOUT + LONG_POLL_READ_MARGIN
+
+    def test_requests_reuse_session(self):
+        """Test that API calls go through the shared session."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": True, "result": {"message_id": 1}})
+
+        with patch.object(bot.session, "post", return_value=response) as mock_post:
+            bot.send_message(42, "hello")
+            bot.send_message(42, "again")
+
+        assert mock_post.call_count == 2
+
+    def test_error_payload_raises(self):
+        """Test that a non-ok payload raises TelegramAPIError."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": False, "description": "Bad Request"})
+
+        with patch.object(bot.session, "post", return_value=response):
+            with pytest.raises(TelegramAPIError):
+                bot.send_message(42, "hello")
+
+    def test_send_media_group_encodes_media(self):
+        """Test that an album is sent in one sendMediaGroup call."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": True, "result": [{"message_id": 1}, {"message_id": 2}]})
+        media = [{"type": "photo", "media": "a"}, {"type": "photo", "media": "b"}]
+
+        with patch.object(bot.session, "post", return_value=response) as mock_post:
+            bot.send_media_group(42, media)
+
+        assert mock_post.call_args[0][0].endswith("sendMediaGroup")
+        assert json.loads(mock_post.call_args[1]["data"]["media"]) == media
+
+    def test_session_retries_transient_errors(self):
+        """Test that the HTTPS adapter retries rate limits and server errors."""
+        bot = TelegramBot("123:abc")
+        adapter = bot.session.get_adapter("https://api.telegram.org/")
+        assert adapter.max_retries.total == 3
+        assert 429 in adapter.max_retries.status_forcelist
+        assert adapter.max_retries.allowed_methods == {"GET"}
+
+    def test_get_retried_on_server_error_without_retry_after_wait(self, scripted_bot):
+        """Test that getUpdates is retried past a 503 and a 429, ignoring Retry-After."""
+        bot, server = scripted_bot
+        server.script[:] = [(503, {}), (429, {"Retry-After": "600"})]
+
+        started = time.monotonic()
+        assert bot.get_updates(timeout=0) == []
+
+        assert server.methods == ["GET", "GET", "GET"]
+        assert time.monotonic() - started < 5
+
+    def test_post_not_retried_on_server_error(self, scripted_bot):
+        """Test that a POST answered with a 5xx reaches the server only once."""
+        bot, server = scripted_bot
+        server.script[:] = [(502, {})]
+
+        with pytest.raises(TelegramAPIError):
+            bot.send_message(42, "hello")
+
+        assert server.methods == ["POST"]
+
+    def test_get_updates_sends_allowed_updates(self):
+        """Test that the allowed update types are sent as a JSON list."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": True, "result": []})
+
+        with patch.object(bot.session, "get", return_value=response) as mock_get:
+            bot.get_updates(allowed_updates=["message", "callback_query"])
+
+        params = mock_get.call_args[1]["params"]
+        assert json.loads(params["allowed_updates"]) == ["message", "callback_query"]
+
+    def test_send_message_posts_form_body(self):
+        """Test that message text is sent in the body, not the URL."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": True, "result": {"message_id": 1}})
+
+        with patch.object(bot.session, "post", return_value=response) as mock_post:
+            bot.send_message(42, "hello", reply_markup={"inline_keyboard": []})
+
+        kwargs = mock_post.call_args[1]
+        assert kwargs["params"] is None
+        assert kwargs["data"]["text"] == "hello"
+        assert json.loads(kwargs["data"]["reply_markup"]) == {"inline_keyboard": []}
+
+    def test_flood_control_waits_and_resends_once(self):
+        """Test that a 429 reply is retried after retry_after seconds."""
+        bot = TelegramBot("123:abc")
+        flood = make_response({"ok": False, "error_code": 429, "parameters": {"retry_after": 3}})
+        ok = make_response({"ok": True, "result": {"message_id": 1}})
+
+        with patch.object(bot.session, "post", side_effect=[flood, ok]) as mock_post, \
+                patch("vpn_bot.telegram.time.sleep") as mock_sleep:
+            result = bot.send_message(42, "hello")
+
+        assert result == {"message_id": 1}
+        assert mock_post.call_count == 2
+        mock_sleep.assert_called_once_with(3)
+
+    def test_flood_wait_uses_stop_event(self):
+        """Test that the flood-control pause waits on the stop event when given one."""
+        stop_event = Mock()
+        stop_event.wait.return_value = False
+        bot = TelegramBot("123:abc", stop_event=stop_event)
+        flood = make_response({"ok": False, "error_code": 429, "parameters": {"retry_after": 3}})
+        ok = make_response({"ok": True, "result": {"message_id": 1}})
+
+        with patch.object(bot.session, "post", side_effect=[flood, ok]), \
+                patch("vpn_bot.telegram.time.sleep") as mock_sleep:
+            assert bot.send_message(42, "hello") == {"message_id": 1}
+
+        stop_event.wait.assert_called_once_with(3)
+        mock_sleep.assert_not_called()
+
+    def test_flood_wait_ends_on_stop(self):
+        """Test that a stop during the flood-control pause skips the resend."""
+        stop_event = threading.Event()
+        stop_event.set()
+        bot = TelegramBot("123:abc", stop_event=stop_event)
+        flood = make_response({"ok": False, "error_code": 429, "parameters": {"retry_after": 30}})
+
+        with patch.object(bot.session, "post", return_value=flood) as mock_post:
+            with pytest.raises(TelegramAPIError):
+                bot.send_message(42, "hello")
+
+        assert mock_post.call_count == 1
+
+    def test_other_errors_are_not_retried(self):
+        """Test that a 400 reply raises without a second request."""
+        bot = TelegramBot("123:abc")
+        response = make_response({"ok": False, "error_code": 400, "description": "Bad Request"})
+
+        with patch.object(bot.session, "post", return_value=response) as mock_post:
+            with pytest.raises(TelegramAPIError):
+                bot.send_message(42, "hello")
+
+        assert mock_post.call_count == 1
+
+
+class TestJsonDumps:
+    """Test compact JSON encoding."""
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_encodes_compactly(self, monkeypatch, use_orjson):
+        """Test that both encoders produce the same compact output."""
+        if not use_orjson:
+            monkeypatch.setattr(telegram, "orjson", None)
+        encoded = json_dumps({"inline_keyboard": [[{"text": "Buy", "callback_data": "user:buy:1"}]]})
+        assert encoded == '{"inline_keyboard":[[{"text":"Buy","callback_data":"user:buy:1"}]]}'
@@ -1,9 +1,15 @@
 """Tests for XUI API client."""
+import json
+import threading
+import time
+
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from requests.exceptions import ConnectionError, SSLError
+from requests.exceptions import ConnectionError, HTTPError, SSLError
 from http.cookiejar import Cookie
+from urllib3.exceptions import MaxRetryError, NewConnectionError
 
+from vpn_bot import xui_api
 from vpn_bot.xui_api import (
     XUIClient,
     XUIError,
@@ -12,6 +18,63 @@ from vpn_bot.xui_api import (
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_auth_cache():
+    """Keep cached panel sessions from leaking between tests."""
+    xui_api.clear_auth_cache()
+    yield
+    xui_api.clear_auth_cache()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Start every test with closed panel circuit breakers."""
+    xui_api.reset_circuit_breakers()
+    yield
+    xui_api.reset_circuit_breakers()
+
+
+@pytest.fixture(autouse=True)
+def stdlib_json():
+    """Decode via ``response.json()``, which is what the mocks below stub."""
+    with patch.object(xui_api, "orjson", None):
+        yield
+
+
+class FakeResponse:
+    """Lightweight stand-in for ``requests.Response`` in panel API tests."""
+
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = {"Content-Type": "application/json"}
+        self.text = json.dumps(payload)
+        self.content = self.text.encode()
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code} error", response=self)
+
+
+def make_login_response(client, cookie_value="abc"):
+    """Build a successful login response that sets a session cookie."""
+    def post(*args, **kwargs):
+        client.session.cookies.set("3x-ui", cookie_value)
+        response = Mock()
+        response.json.return_value = {"success": True}
+        return response
+    return post
+
+
+def refused_error():
+    """Return the ConnectionError requests raises when a connect is refused."""
+    reason = NewConnectionError(None, "Connection refused")
+    return ConnectionError(MaxRetryError(None, "/panel/api/inbounds/addClient", reason))
+
+
 class TestXUIClient:
     """Tests for XUIClient class."""
 
@@ -31,6 +94,12 @@ class TestXUIClient:
         result = client._build_url("panel/api/test")
         assert result == "https://example.com/panel/panel/api/test"
 
+    def test_build_url_keeps_nested_base_for_leading_slash(self):
+        """Test that a leading slash does not drop the panel's nested path."""
+        client = XUIClient("https://example.com/panel/", "user", "pass")
+        result = client._build_url("/panel/api/inbounds/get/1?x=1")
+        assert result == "https://example.com/panel/panel/api/inbounds/get/1?x=1"
+
     def test_url_without_login_uses_directly_for_login(self):
         """Test that URL without /login is used directly as login URL."""
         client = XUIClient("https://test.irlesson.ir:8080/testpatch/", "user", "pass")
@@ -71,11 +140,33 @@ class TestXUIClient:
         client = XUIClient("https://example.com/", "user", "pass")
         assert client.session.headers.get("Accept") == "application/json"
 
+    def test_session_accepts_compressed_responses(self):
+        """Test that large inbound listings can be sent gzip-compressed."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        assert "gzip" in client.session.headers.get("Accept-Encoding", "")
+
     def test_default_timeout_is_20_seconds(self):
         """Test that default timeout is 20 seconds."""
         client = XUIClient("https://example.com/", "user", "pass")
         assert client.timeout == 20
 
+    def test_clients_share_connection_pool(self):
+        """Test that separate clients reuse the same connection adapter."""
+        first = XUIClient("https://example.com/", "user", "pass")
+        second = XUIClient("http://other.example.com/", "user", "pass")
+        adapter = first.session.get_adapter("https://example.com/")
+        assert second.session.get_adapter("http://other.example.com/") is adapter
+        assert first.session.cookies is not second.session.cookies
+        assert first.session.headers.get("Connection") == "keep-alive"
+
+    def test_custom_pool_size_uses_own_adapter(self):
+        """Test that a custom pool size does not resize the shared pool."""
+        shared = XUIClient("https://example.com/", "user", "pass")
+        custom = XUIClient("https://example.com/", "user", "pass", pool_maxsize=64)
+        adapter = custom.session.get_adapter("https://example.com/")
+        assert adapter is not shared.session.get_adapter("https://example.com/")
+        assert adapter._pool_maxsize == 64
+
 
 class TestSSLErrorDetection:
     """Tests for SSL error detection helper method."""
@@ -164,6 +255,12 @@ class TestLoginMethods:
 class TestXUIConnectionErrors:
     """Tests for connection error handling."""
 
+    @pytest.fixture(autouse=True)
+    def no_backoff(self):
+        """Skip real retry backoff; tests that inspect sleeps patch it themselves."""
+        with patch("vpn_bot.xui_api.time.sleep"):
+            yield
+
     def test_ssl_error_raises_connection_error_with_hint(self):
         """Test that SSL errors are converted to XUIConnectionError with helpful message."""
         client = XUIClient("https://example.com:8080/panel/", "user", "pass")
@@ -257,6 +354,137 @@ class TestXUIConnectionErrors:
         # Should have called sleep for backoff (MAX_RETRIES - 1 times)
         assert mock_sleep.call_count == MAX_RETRIES - 1
 
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_request_retries_only_in_client(self, mock_sleep):
+        """Test that the transport adapter never retries on its own."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+        adapter = client.session.get_adapter("https://example.com:8080/")
+        assert adapter.max_retries.total == 0
+
+        with patch.object(client.session, "request", side_effect=refused_error()) as mock_request:
+            with pytest.raises(XUIConnectionError):
+                client._request("POST", "panel/api/inbounds/addClient", json_body={})
+
+        assert mock_request.call_count == MAX_RETRIES
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        assert len(delays) == MAX_RETRIES - 1
+        assert all(xui_api.RETRY_BACKOFF <= d <= xui_api.RETRY_BACKOFF_CAP for d in delays)
+
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_post_not_replayed_after_reset(self, mock_sleep):
+        """Test that a POST that may have reached the panel is sent only once."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", side_effect=ConnectionError("reset")) as mock_request:
+            with pytest.raises(XUIConnectionError):
+                client._request("POST", "panel/api/inbounds/addClient", json_body={})
+
+        assert mock_request.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_get_retried_after_reset(self, mock_sleep):
+        """Test that a GET is retried whatever stage the connection failed at."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", side_effect=ConnectionError("reset")) as mock_request:
+            with pytest.raises(XUIConnectionError):
+                client._request("GET", "panel/api/inbounds/list")
+
+        assert mock_request.call_count == MAX_RETRIES
+
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_retry_stops_at_deadline(self, mock_sleep):
+        """Test that no retry is scheduled past the retry time budget."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        mock_post = Mock(side_effect=ConnectionError("Connection refused"))
+        clock = iter([0.0, xui_api.RETRY_DEADLINE_SECONDS])
+
+        with patch("vpn_bot.xui_api.time.monotonic", side_effect=lambda: next(clock)):
+            with patch.object(client.session, "post", mock_post):
+                with pytest.raises(XUIConnectionError):
+                    client._login()
+
+        assert mock_post.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @pytest.mark.parametrize("status", [408, 503])
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_server_error_retried_for_get_only(self, mock_sleep, status):
+        """Test that 408 and 5xx responses are retried for GET but not for POST."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+        unavailable = Mock(status_code=status)
+        ok = Mock(status_code=200, text='{"success": true}')
+        ok.json.return_value = {"success": True}
+
+        with patch.object(client.session, "request", side_effect=[unavailable, ok]) as mock_request:
+            assert client._request("GET", "panel/api/inbounds/list") == {"success": True}
+        assert mock_request.call_count == 2
+
+        unavailable.raise_for_status.side_effect = xui_api.requests.HTTPError("503")
+        with patch.object(client.session, "request", return_value=unavailable) as mock_request:
+            with pytest.raises(xui_api.requests.HTTPError):
+                client._request("POST", "panel/api/inbounds/addClient", json_body={})
+        assert mock_request.call_count == 1
+
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_rate_limit_retried_after_retry_after(self, mock_sleep):
+        """Test that a 429 is retried for POST, waiting at least Retry-After."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+        limited = Mock(status_code=429, headers={"Retry-After": "4"})
+        ok = Mock(status_code=200, text='{"success": true}')
+        ok.json.return_value = {"success": True}
+
+        with patch.object(client.session, "request", side_effect=[limited, ok]) as mock_request:
+            assert client._request("POST", "panel/api/inbounds/addClient", json_body={}) == {"success": True}
+        assert mock_request.call_count == 2
+        assert mock_sleep.call_args[0][0] >= 4
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a 4xx other than 401/403/429 raises on the first reply."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+        not_found = Mock(status_code=404)
+        not_found.raise_for_status.side_effect = xui_api.requests.HTTPError("404")
+
+        with patch.object(client.session, "request", return_value=not_found) as mock_request:
+            with pytest.raises(xui_api.requests.HTTPError):
+                client._request("GET", "panel/api/inbounds/get/1")
+        assert mock_request.call_count == 1
+
+    @patch("vpn_bot.xui_api.time.sleep")
+    def test_login_retries_server_errors(self, mock_sleep):
+        """Test that a 5xx login reply is retried instead of failing login."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        unavailable = Mock(status_code=503, headers={})
+        ok = Mock(status_code=200)
+        ok.json.return_value = {"success": True}
+        client.session.cookies.set("session", "abc")
+
+        with patch.object(client.session, "post", side_effect=[unavailable, ok]) as mock_post:
+            client._login()
+        assert mock_post.call_count == 2
+        assert client._authenticated
+        mock_sleep.assert_called_once()
+
+    def test_stop_event_cuts_backoff_short(self):
+        """Test that a set stop event aborts the retry loop without sleeping."""
+        stop_event = threading.Event()
+        stop_event.set()
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass", stop_event=stop_event)
+        mock_post = Mock(side_effect=ConnectionError("Connection refused"))
+
+        with patch.object(client.session, "post", mock_post):
+            with pytest.raises(XUIConnectionError, match="shutting down"):
+                client._login()
+
+        assert mock_post.call_count == 1
+
     def test_successful_login_after_retry(self):
         """Test that login succeeds after a retry."""
         client = XUIClient("https://example.com:8080/panel/", "user", "pass")
@@ -325,6 +553,214 @@ class TestXUIConnectionErrors:
         assert result == {"success": True}
         assert request_call_count[0] == 2  # Initial request + retry after re-auth
 
+    def test_request_reauthenticates_only_once(self):
+        """Test that a session rejected again after login is not renewed again."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=FakeResponse({}, status_code=401)) as mock_request:
+            with patch.object(client.session, "post", side_effect=make_login_response(client)) as mock_post:
+                with pytest.raises(HTTPError):
+                    client._request("GET", "test/path")
+
+        assert mock_post.call_count == 1
+        assert mock_request.call_count == 2
+
+
+class TestAuthCache:
+    """Tests for reusing panel sessions across clients."""
+
+    def test_second_client_reuses_cached_session(self):
+        """Test that a new client for the same account skips the login POST."""
+        first = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(first.session, "post", side_effect=make_login_response(first)):
+            first._login()
+
+        second = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(second.session, "post") as mock_post:
+            second._login()
+
+        mock_post.assert_not_called()
+        assert second._authenticated is True
+        assert second.session.cookies.get("3x-ui") == "abc"
+
+    def test_different_credentials_do_not_share_session(self):
+        """Test that the cache is keyed by panel account."""
+        first = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(first.session, "post", side_effect=make_login_response(first)):
+            first._login()
+
+        other = XUIClient("https://example.com/", "user", "other-pass")
+        with patch.object(other.session, "post", side_effect=make_login_response(other)) as mock_post:
+            other._login()
+
+        assert mock_post.called
+
+    def test_expired_entry_triggers_login(self):
+        """Test that sessions older than the TTL are not reused."""
+        first = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(first.session, "post", side_effect=make_login_response(first)):
+            first._login()
+
+        second = XUIClient("https://example.com/", "user", "pass")
+        later = xui_api.time.monotonic() + xui_api.AUTH_CACHE_TTL + 1
+        with patch("vpn_bot.xui_api.time.monotonic", return_value=later):
+            with patch.object(second.session, "post", side_effect=make_login_response(second)) as mock_post:
+                second._login()
+
+        assert mock_post.called
+
+    def test_rejected_session_is_invalidated(self):
+        """Test that a 401 drops the cached session and logs in again."""
+        first = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(first.session, "post", side_effect=make_login_response(first)):
+            first._login()
+
+        second = XUIClient("https://example.com/", "user", "pass")
+        unauthorized = Mock(status_code=401)
+        ok = Mock(status_code=200, text='{"success": true}')
+        ok.json.return_value = {"success": True}
+        with patch.object(second.session, "request", side_effect=[unauthorized, ok]):
+            with patch.object(
+                second.session, "post", side_effect=make_login_response(second, "fresh")
+            ) as mock_post:
+                assert second._request("GET", "test/path") == {"success": True}
+
+        assert mock_post.call_count == 1
+        third = XUIClient("https://example.com/", "user", "pass")
+        third._login()
+        assert third.session.cookies.get("3x-ui") == "fresh"
+
+
+    def test_concurrent_rejections_renew_session_once(self):
+        """Test that threads rejected with the same session share one new login."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        with patch.object(client.session, "post", side_effect=make_login_response(client)):
+            client._login()
+        barrier = threading.Barrier(4, timeout=5)
+        ok = FakeResponse({"success": True})
+
+        def request(*args, **kwargs):
+            if client.session.cookies.get("3x-ui") == "abc":
+                barrier.wait()
+                return FakeResponse({}, status_code=401)
+            return ok
+
+        results = []
+        with patch.object(client.session, "request", side_effect=request), \
+                patch.object(client.session, "post", side_effect=make_login_response(client, "fresh")) as mock_post:
+            threads = [
+                threading.Thread(target=lambda: results.append(client._request("GET", "test/path")))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        assert mock_post.call_count == 1
+        assert results == [{"success": True}] * 4
+        assert xui_api._AUTH_CACHE[client._auth_key][0] == {"3x-ui": "fresh"}
+
+    def test_concurrent_logins_post_once(self):
+        """Test that clients logging in at the same time share one login POST."""
+        clients = [XUIClient("https://example.com/", "user", "pass") for _ in range(2)]
+        started = threading.Event()
+        posts = []
+
+        def slow_login(client):
+            def post(*args, **kwargs):
+                posts.append(client)
+                started.set()
+                time.sleep(0.2)
+                return make_login_response(client)()
+            return post
+
+        with patch.object(clients[0].session, "post", side_effect=slow_login(clients[0])), \
+                patch.object(clients[1].session, "post", side_effect=slow_login(clients[1])):
+            first = threading.Thread(target=clients[0]._login)
+            first.start()
+            started.wait(timeout=5)
+            clients[1]._login()
+            first.join(timeout=5)
+
+        assert posts == [clients[0]]
+        assert clients[1]._authenticated is True
+
+
+class TestJSONDecoding:
+    """Tests for response decoding."""
+
+    def test_uses_orjson_when_available(self):
+        """Test that responses are decoded from raw bytes by orjson when installed."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        response = Mock(status_code=200, text='{"success": true}', content=b'{"success": true}')
+        fake_orjson = Mock()
+        fake_orjson.loads.return_value = {"success": True, "obj": []}
+
+        with patch.object(xui_api, "orjson", fake_orjson):
+            with patch.object(client.session, "request", return_value=response):
+                assert client.list_inbounds() == []
+
+        fake_orjson.loads.assert_called_once_with(b'{"success": true}')
+        response.json.assert_not_called()
+
+    def test_falls_back_to_response_json(self):
+        """Test that the stdlib decoder is used when orjson is missing."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        response = Mock(status_code=200, text='{"success": true}')
+        response.json.return_value = {"success": True}
+
+        with patch.object(xui_api, "orjson", None):
+            with patch.object(client.session, "request", return_value=response):
+                assert client._request("GET", "test/path") == {"success": True}
+
+
+    def test_html_page_is_not_parsed(self):
+        """Test that an HTML reply is rejected without running the decoder."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        response = Mock(status_code=200, text="<html>login</html>", headers={"Content-Type": "text/html; charset=utf-8"})
+
+        with patch.object(client.session, "request", return_value=response):
+            with pytest.raises(XUIError, match="Invalid JSON"):
+                client._request("GET", "test/path")
+        response.json.assert_not_called()
+
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_create_client_settings_round_trip(self, use_orjson):
+        """Test that the addClient settings string decodes to the client entry."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        ok = FakeResponse({"success": True})
+        encoder = pytest.importorskip("orjson") if use_orjson else None
+
+        with patch.object(xui_api, "orjson", encoder):
+            with patch.object(client.session, "request", return_value=ok) as mock_request:
+                client.create_client(1, {"email": "user@test", "id": "test-uuid"})
+
+        kwargs = mock_request.call_args[1]
+        assert kwargs["headers"]["Content-Type"] == "application/json"
+        settings = json.loads(json.loads(kwargs["data"])["settings"])
+        assert settings["clients"][0]["id"] == "test-uuid"
+        assert settings["clients"][0]["email"] == "user@test"
+
+    def test_create_clients_posts_once(self):
+        """Test that several clients are added with a single addClient call."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=FakeResponse({"success": True})) as mock_request:
+            response = client.create_clients(1, [{"email": "a@test"}, {"email": "b@test"}])
+
+        assert mock_request.call_count == 1
+        settings = json.loads(json.loads(mock_request.call_args[1]["data"])["settings"])
+        assert [entry["email"] for entry in settings["clients"]] == ["a@test", "b@test"]
+        assert response["clients"] == settings["clients"]
+
 
 class TestNewAPIMethods:
     """Tests for new API methods."""
@@ -334,11 +770,7 @@ class TestNewAPIMethods:
         client = XUIClient("https://example.com/", "user", "pass")
         client._authenticated = True
 
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"success": true, "obj": [{"id": 1}, {"id": 2}]}'
-        mock_response.json.return_value = {"success": True, "obj": [{"id": 1}, {"id": 2}]}
-        mock_response.raise_for_status = Mock()
+        mock_response = FakeResponse({"success": True, "obj": [{"id": 1}, {"id": 2}]})
 
         with patch.object(client.session, "request", return_value=mock_response):
             result = client.list_inbounds()
@@ -352,11 +784,7 @@ class TestNewAPIMethods:
         client = XUIClient("https://example.com/", "user", "pass")
         client._authenticated = True
 
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"success": true, "obj": null}'
-        mock_response.json.return_value = {"success": True, "obj": None}
-        mock_response.raise_for_status = Mock()
+        mock_response = FakeResponse({"success": True, "obj": None})
 
         with patch.object(client.session, "request", return_value=mock_response):
             result = client.list_inbounds()
@@ -368,11 +796,7 @@ class TestNewAPIMethods:
         client = XUIClient("https://example.com/", "user", "pass")
         client._authenticated = True
 
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"success": true}'
-        mock_response.json.return_value = {"success": True}
-        mock_response.raise_for_status = Mock()
+        mock_response = FakeResponse({"success": True})
 
         with patch.object(client.session, "request", return_value=mock_response) as mock_request:
             client.delete_client_by_path(1, "test-uuid")
@@ -381,6 +805,19 @@ class TestNewAPIMethods:
         call_args = mock_request.call_args
         assert "panel/api/inbounds/1/delClient/test-uuid" in call_args[0][1]
 
+    def test_client_ids_are_url_encoded(self):
+        """Test that emails used as client ids cannot break the URL."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=FakeResponse({"success": True})) as mock_request:
+            client.delete_client_by_path(1, "a+b@test/x")
+            client.get_client_traffic(1, "a+b@test")
+
+        delete_url, traffic_url = (c[0][1] for c in mock_request.call_args_list)
+        assert delete_url.endswith("panel/api/inbounds/1/delClient/a%2Bb%40test%2Fx")
+        assert traffic_url.endswith("getClientTraffics/1?clientId=a%2Bb%40test")
+
     def test_check_connection_success(self):
         """Test check_connection returns True on success."""
         client = XUIClient("https://example.com/", "user", "pass")
@@ -409,11 +846,7 @@ class TestNewAPIMethods:
         client = XUIClient("https://example.com/", "user", "pass")
         client._authenticated = True
 
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"success": true, "obj": {"up": 100, "down": 200}}'
-        mock_response.json.return_value = {"success": True, "obj": {"up": 100, "down": 200}}
-        mock_response.raise_for_status = Mock()
+        mock_response = FakeResponse({"success": True, "obj": {"up": 100, "down": 200}})
 
         with patch.object(client.session, "request", return_value=mock_response):
             result = client.get_client_traffic_by_id("test-uuid")
@@ -425,11 +858,7 @@ class TestNewAPIMethods:
         client = XUIClient("https://example.com/", "user", "pass")
         client._authenticated = True
 
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"success": true, "obj": [{"up": 100, "down": 200}]}'
-        mock_response.json.return_value = {"success": True, "obj": [{"up": 100, "down": 200}]}
-        mock_response.raise_for_status = Mock()
+        mock_response = FakeResponse({"success": True, "obj": [{"up": 100, "down": 200}]})
 
         with patch.object(client.session, "request", return_value=mock_response):
             result = client.get_client_traffic_by_id("test-uuid")
@@ -437,6 +866,200 @@ class TestNewAPIMethods:
         assert result == {"up": 100, "down": 200}
 
 
+def make_inbounds_response():
+    """Build a panel listing with one client and its embedded traffic stats."""
+    return FakeResponse({
+        "success": True,
+        "obj": [{
+            "id": 1,
+            "settings": '{"clients": [{"id": "test-uuid", "email": "user@test"}]}',
+            "clientStats": [{"email": "user@test", "up": 100, "down": 200}],
+        }],
+    })
+
+
+class TestInboundsCache:
+    """Tests for reusing the inbound listing."""
+
+    def test_list_inbounds_is_cached(self):
+        """Test that a fresh listing is reused without another request."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()) as mock_request:
+            client.list_inbounds()
+            client.list_inbounds()
+
+        assert mock_request.call_count == 1
+
+    def test_callers_cannot_change_cached_listing(self):
+        """Test that changing a returned listing leaves the cached one intact."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()):
+            first = client.list_inbounds()
+            first[0]["remark"] = "changed"
+            first.clear()
+            second = client.list_inbounds()
+
+        assert len(second) == 1
+        assert second[0].get("remark") != "changed"
+
+    def test_write_invalidates_cache(self):
+        """Test that removing a client forces a fresh listing."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        ok = FakeResponse({"success": True})
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()):
+            client.list_inbounds()
+        with patch.object(client.session, "request", return_value=ok):
+            client.remove_client(1, "test-uuid")
+        with patch.object(client.session, "request", return_value=make_inbounds_response()) as mock_request:
+            client.list_inbounds()
+
+        assert mock_request.call_count == 1
+
+    def test_get_client_info_uses_embedded_stats(self):
+        """Test that client info takes traffic from the listing in one request."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()) as mock_request:
+            info = client.get_client_info("test-uuid")
+            traffic = client.get_client_traffic_by_id("test-uuid")
+
+        assert mock_request.call_count == 1
+        assert info["up"] == 100 and info["down"] == 200
+        assert traffic == {"email": "user@test", "up": 100, "down": 200}
+
+    def test_settings_are_decoded_once(self):
+        """Test that repeated lookups do not parse an inbound's settings again."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()):
+            client.get_client_info("test-uuid")
+            with patch("vpn_bot.xui_api._loads", side_effect=AssertionError("decoded again")):
+                assert client.get_client_info("test-uuid") is not None
+
+
+    def test_lookups_leave_listing_settings_encoded(self):
+        """Test that client lookups do not change the shape of the cached listing."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", return_value=make_inbounds_response()):
+            before = client.list_inbounds()[0]["settings"]
+            client.get_client_info("test-uuid")
+            after = client.list_inbounds()[0]["settings"]
+
+        assert isinstance(before, str) and after == before
+
+    def test_client_index_is_reused(self):
+        """Test that lookups share one index until the listing changes."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request", side_effect=lambda *args, **kwargs: make_inbounds_response()):
+            index = client._clients_by_key(client._inbound_listing())
+            assert client._clients_by_key(client._inbound_listing()) is index
+            assert client.get_client_info("user@test")["id"] == "test-uuid"
+            client._inbounds_cache = None
+            assert client._clients_by_key(client._inbound_listing()) is not index
+
+    def test_concurrent_lookups_share_one_index(self):
+        """Test that threads racing on a cold cache agree on one index."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        inbounds = make_inbounds_response().json()["obj"]
+        barrier = threading.Barrier(8, timeout=5)
+        indexes = []
+
+        def lookup():
+            barrier.wait()
+            indexes.append(client._clients_by_key(inbounds))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len({id(index) for index in indexes}) == 1
+        assert indexes[0]["test-uuid"][1]["email"] == "user@test"
+
+
+    def test_get_client_infos_fetches_missing_traffic_concurrently(self):
+        """Test that traffic absent from the listing is fetched in parallel."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        inbounds = [{
+            "id": 1,
+            "settings": '{"clients": [{"id": "a", "email": "a@test"}, {"id": "b", "email": "b@test"}]}',
+        }]
+        barrier = threading.Barrier(2, timeout=5)
+
+        def traffic_by_id(client_id):
+            barrier.wait()
+            return {"email": f"{client_id}@test", "up": 1}
+
+        with patch.object(client, "_inbound_listing", return_value=inbounds):
+            with patch.object(client, "get_client_traffic_by_id", side_effect=traffic_by_id):
+                infos = client.get_client_infos(["a", "b", "missing"])
+
+        assert infos["a"]["up"] == 1 and infos["b"]["up"] == 1
+        assert infos["missing"] is None
+
+
+    def test_get_inbound_records_added_client(self):
+        """Test that a cached inbound reply includes clients added since."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        inbound = FakeResponse({"success": True, "obj": {"id": 1, "port": 443, "settings": '{"clients": []}'}})
+
+        with patch.object(client.session, "request", return_value=inbound):
+            client.get_inbound(1)
+        with patch.object(client.session, "request", return_value=FakeResponse({"success": True})):
+            client.create_client(1, {"email": "user@test", "id": "test-uuid"})
+        with patch.object(client.session, "request") as mock_request:
+            details = client.get_inbound(1)
+
+        mock_request.assert_not_called()
+        assert json.loads(details["obj"]["settings"])["clients"][0]["id"] == "test-uuid"
+
+    def test_get_inbound_returns_a_copy(self):
+        """Test that changing a returned inbound reply leaves the cached one intact."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        inbound = FakeResponse({"success": True, "obj": {"id": 1, "port": 443, "settings": '{"clients": []}'}})
+
+        with patch.object(client.session, "request", return_value=inbound):
+            first = client.get_inbound(1)
+        first["obj"]["port"] = 0
+        first["obj"]["settings"] = {}
+        second = client.get_inbound(1)
+
+        assert second["obj"]["port"] == 443
+        assert second["obj"]["settings"] == '{"clients": []}'
+
+    def test_remove_client_drops_cached_inbound(self):
+        """Test that removing a client fetches the inbound again."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+        inbound = FakeResponse({"success": True, "obj": {"id": 1, "settings": '{"clients": []}'}})
+
+        with patch.object(client.session, "request", return_value=inbound):
+            client.get_inbound(1)
+        with patch.object(client.session, "request", return_value=FakeResponse({"success": True})):
+            client.remove_client(1, "test-uuid")
+        with patch.object(client.session, "request", return_value=inbound) as mock_request:
+            client.get_inbound(1)
+
+        assert mock_request.call_count == 1
+
+
 class TestXUIConnectionErrorException:
     """Tests for the XUIConnectionError exception class."""
 
@@ -453,3 +1076,136 @@ class TestXUIConnectionErrorException:
             pass  # Expected
         except Exception:
             pytest.fail("XUIConnectionError should be caught as XUIError")
+
+
+def make_failing_client():
+    """Build an authenticated client whose requests always fail fast."""
+    client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+    client._authenticated = True
+    client._send_request = Mock(side_effect=XUIConnectionError("down"))
+    return client
+
+
+class TestCircuitBreaker:
+    """Test the per-panel circuit breaker."""
+
+    def test_opens_after_threshold(self):
+        """Test that calls fail without HTTP once the threshold is reached."""
+        client = make_failing_client()
+        for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(XUIConnectionError):
+                client._request("GET", "panel/api/inbounds/list")
+        with pytest.raises(XUIConnectionError, match="unavailable"):
+            client._request("GET", "panel/api/inbounds/list")
+        assert client._send_request.call_count == xui_api.BREAKER_FAILURE_THRESHOLD
+
+    def test_breaker_is_shared_per_panel(self):
+        """Test that a new client for the same panel sees the open breaker."""
+        client = make_failing_client()
+        for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(XUIConnectionError):
+                client._request("GET", "panel/api/inbounds/list")
+        other = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        other._send_request = Mock()
+        with pytest.raises(XUIConnectionError):
+            other._request("GET", "panel/api/inbounds/list")
+        other._send_request.assert_not_called()
+
+    def test_probe_success_closes_breaker(self):
+        """Test that a successful probe after the recovery window closes it."""
+        client = make_failing_client()
+        for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(XUIConnectionError):
+                client._request("GET", "panel/api/inbounds/list")
+        client._send_request = Mock(return_value={"success": True})
+        later = xui_api.time.monotonic() + xui_api.BREAKER_RECOVERY_SECONDS + 1
+        with patch("vpn_bot.xui_api.time.monotonic", return_value=later):
+            assert client._request("GET", "panel/api/inbounds/list") == {"success": True}
+        assert client._request("GET", "panel/api/inbounds/list") == {"success": True}
+
+    def test_probe_hitting_deadline_is_released(self):
+        """Test that a probe cut short by the caller's deadline lets the next probe through."""
+        client = make_failing_client()
+        for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD):
+            with pytest.raises(XUIConnectionError):
+                client._request("GET", "panel/api/inbounds/list")
+        later = xui_api.time.monotonic() + xui_api.BREAKER_RECOVERY_SECONDS + 1
+        with patch("vpn_bot.xui_api.time.monotonic", return_value=later):
+            client._send_request = Mock(side_effect=xui_api.XUIDeadlineError("deadline"))
+            with pytest.raises(xui_api.XUIDeadlineError):
+                client._request("GET", "panel/api/inbounds/list")
+            client._send_request = Mock(return_value={"success": True})
+            assert client._request("GET", "panel/api/inbounds/list") == {"success": True}
+
+    def test_read_timeouts_open_breaker(self):
+        """Test that a hung panel's read timeouts count as failures."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._authenticated = True
+        timeout = xui_api.requests.ReadTimeout("read timed out")
+
+        with patch.object(client.session, "request", side_effect=timeout) as mock_request:
+            for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD):
+                with pytest.raises(xui_api.requests.ReadTimeout):
+                    client._request("GET", "panel/api/inbounds/list")
+            with pytest.raises(XUIConnectionError, match="unavailable"):
+                client._request("GET", "panel/api/inbounds/list")
+
+        assert mock_request.call_count == xui_api.BREAKER_FAILURE_THRESHOLD
+
+    def test_api_errors_do_not_trip_breaker(self):
+        """Test that error replies from a reachable panel are not failures."""
+        client = XUIClient("https://example.com:8080/panel/", "user", "pass")
+        client._send_request = Mock(side_effect=XUIError("API call failed"))
+        for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD + 1):
+            with pytest.raises(XUIError) as excinfo:
+                client._request("GET", "panel/api/inbounds/list")
+            assert not isinstance(excinfo.value, XUIConnectionError)
+
+
+class TestDeadline:
+    """Test caller deadlines for panel calls."""
+
+    def test_attempt_timeout_is_cut_to_deadline(self):
+        """Test that a request gets no more time than the deadline leaves."""
+        client = XUIClient("https://example.com/", "user", "pass", timeout=20)
+        client._authenticated = True
+        ok = FakeResponse({"success": True})
+
+        with patch.object(client.session, "request", return_value=ok) as mock_request:
+            with xui_api.with_deadline(2):
+                client._request("GET", "panel/api/inbounds/list")
+            client._request("GET", "panel/api/inbounds/list")
+
+        first, second = mock_request.call_args_list
+        assert 0 < first[1]["timeout"] <= 2
+        assert second[1]["timeout"] == 20
+
+    def test_expired_deadline_fails_fast(self):
+        """Test that no request is sent once the deadline has passed."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with patch.object(client.session, "request") as mock_request:
+            with xui_api.with_deadline(0):
+                with pytest.raises(xui_api.XUIDeadlineError):
+                    client._request("GET", "panel/api/inbounds/list")
+        mock_request.assert_not_called()
+
+    def test_deadline_errors_do_not_trip_breaker(self):
+        """Test that running out of caller time is not counted against the panel."""
+        client = XUIClient("https://example.com/", "user", "pass")
+        client._authenticated = True
+
+        with xui_api.with_deadline(0):
+            for _ in range(xui_api.BREAKER_FAILURE_THRESHOLD + 1):
+                with pytest.raises(xui_api.XUIDeadlineError):
+                    client._request("GET", "panel/api/inbounds/list")
+        assert client._breaker.allow()
+
+    def test_nested_deadline_keeps_earliest(self):
+        """Test that an inner block cannot extend the outer deadline."""
+        with xui_api.with_deadline(1):
+            outer = xui_api._DEADLINE.get()
+            with xui_api.with_deadline(60):
+                assert xui_api._DEADLINE.get() == outer
+        assert xui_api._DEADLINE.get() is None
@@ -7,14 +7,19 @@ remains compatible with environments where it's not available.
 from __future__ import annotations
 
 from dataclasses import dataclass
+import functools
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 
-@dataclass
+@dataclass(frozen=True)
 class Settings:
-    """Configuration values required by the application."""
+    """Configuration values required by the application.
+
+    Instances are immutable so a single parsed copy can be shared by the
+    whole process.
+    """
 
     bot_token: str
     admin_pin: str
@@ -27,14 +32,62 @@ class Settings:
     receipt_upload_dir: str = "uploads/receipts"
     default_language: str = "fa"
     log_level: str = "INFO"
-
-
+    handler_workers: int = 8
+
+
+SUPPORTED_LANGUAGES = frozenset({"en", "fa"})
+
+
+def _parse_bool(raw: str) -> bool:
+    """Interpret any value other than an explicit false as enabled."""
+    return raw not in {"0", "false", "False"}
+
+
+# Optional settings: (field, environment variable, parser, default, strict).
+# A value that fails to parse falls back to the default, unless ``strict``,
+# in which case a RuntimeError is raised.
+_OPTIONAL_SETTINGS: Tuple[Tuple[str, str, Callable[[str], Any], Any, bool], ...] = (
+    ("database_path", "DB_PATH", str, "vpn_bot.sqlite3", False),
+    ("poll_interval", "POLL_INTERVAL", float, 1.0, True),
+    ("xui_verify_ssl", "XUI_VERIFY_SSL", _parse_bool, False, False),
+    ("rate_limit_per_min", "RATE_LIMIT_PER_MIN", int, 20, False),
+    ("max_receipt_size_mb", "MAX_RECEIPT_SIZE_MB", float, 5.0, False),
+    ("receipt_storage", "RECEIPT_STORAGE", str, "local", False),
+    ("receipt_upload_dir", "RECEIPT_UPLOAD_DIR", str, "uploads/receipts", False),
+    ("default_language", "DEFAULT_LANGUAGE", str, "fa", False),
+    ("log_level", "LOG_LEVEL", str, "INFO", False),
+    ("handler_workers", "HANDLER_WORKERS", int, 8, False),
+)
+
+
+def _read_optional_settings() -> Dict[str, Any]:
+    """Parse the optional settings from the environment."""
+    values: Dict[str, Any] = {}
+    for field, env_name, parse, default, strict in _OPTIONAL_SETTINGS:
+        raw = os.environ.get(env_name)
+        if raw is None:
+            values[field] = default
+            continue
+        try:
+            values[field] = parse(raw)
+        except ValueError as exc:
+            if strict:
+                raise RuntimeError(f"{env_name} must be a number") from exc
+            values[field] = default
+    return values
+
+
+@functools.lru_cache(maxsize=1)
 def load_settings() -> Settings:
     """Load settings from environment variables.
 
     Automatically loads .env file from VPN-Bot directory if python-dotenv is available.
     Environment variables take precedence over .env file values.
 
+    The environment is only parsed on the first call; later calls return the
+    same cached instance. Use ``load_settings.cache_clear()`` to force a
+    reload (e.g. in tests that modify the environment).
+
     Returns
     -------
     Settings
@@ -69,51 +122,8 @@ def load_settings() -> Settings:
     if not admin_pin:
         raise RuntimeError("BOT_ADMIN_PIN environment variable is required")
 
-    db_path = os.environ.get("DB_PATH", "vpn_bot.sqlite3")
-    
-    poll_interval_raw = os.environ.get("POLL_INTERVAL", "1.0")
-    try:
-        poll_interval = float(poll_interval_raw)
-    except ValueError as exc:  # pragma: no cover - defensive branch
-        raise RuntimeError("POLL_INTERVAL must be a number") from exc
-
-    verify_ssl = os.environ.get("XUI_VERIFY_SSL", "0") not in {"0", "false", "False"}
+    values = _read_optional_settings()
+    if values["default_language"] not in SUPPORTED_LANGUAGES:
+        values["default_language"] = "fa"
 
-    # Rate limiting
-    rate_limit_raw = os.environ.get("RATE_LIMIT_PER_MIN", "20")
-    try:
-        rate_limit = int(rate_limit_raw)
-    except ValueError:
-        rate_limit = 20
-
-    # Receipt handling
-    max_receipt_size_raw = os.environ.get("MAX_RECEIPT_SIZE_MB", "5.0")
-    try:
-        max_receipt_size = float(max_receipt_size_raw)
-    except ValueError:
-        max_receipt_size = 5.0
-
-    receipt_storage = os.environ.get("RECEIPT_STORAGE", "local")
-    receipt_upload_dir = os.environ.get("RECEIPT_UPLOAD_DIR", "uploads/receipts")
-
-    # Language settings
-    default_language = os.environ.get("DEFAULT_LANGUAGE", "fa")
-    if default_language not in ["en", "fa"]:
-        default_language = "fa"
-
-    # Logging
-    log_level = os.environ.get("LOG_LEVEL", "INFO")
-
-    return Settings(
-        bot_token=token,
-        admin_pin=admin_pin,
-        database_path=db_path,
-        poll_interval=poll_interval,
-        xui_verify_ssl=verify_ssl,
-        rate_limit_per_min=rate_limit,
-        max_receipt_size_mb=max_receipt_size,
-        receipt_storage=receipt_storage,
-        receipt_upload_dir=receipt_upload_dir,
-        default_language=default_language,
-        log_level=log_level,
-    )
+    return Settings(bot_token=token, admin_pin=admin_pin, **values)
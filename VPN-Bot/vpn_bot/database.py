@@ -5,10 +5,13 @@ machines that only ship with Python's standard library.
 """
 from __future__ import annotations
 
+import hashlib
 import sqlite3
+import threading
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from uuid import uuid4
 
 
 CREATE_STATEMENTS: List[str] = [
@@ -125,32 +128,186 @@ CREATE_STATEMENTS: List[str] = [
         created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
     )
     """,
+    # Serves the expiration worker's "active orders past expires_at" scan
+    # and, through its leading column, the pending-orders list by status
+    """
+    CREATE INDEX IF NOT EXISTS idx_orders_status_expires_at ON orders(status, expires_at)
+    """,
+    # Lookup columns used by the handlers; names match migration 001 where
+    # that migration already defines the index
+    """
+    CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_plans_server_id ON plans(server_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_inbounds_server_id ON inbounds(server_id)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_server_pricing_server_id ON server_pricing(server_id, updated_at)
+    """,
+]
+
+
+_SCHEMA_DDL = ";\n".join(CREATE_STATEMENTS)
+
+# Fingerprint of the schema, kept in PRAGMA user_version (a signed 32-bit
+# header field) so initialize() can skip the DDL when nothing changed
+_SCHEMA_VERSION = int(hashlib.sha256(_SCHEMA_DDL.encode("utf-8")).hexdigest()[:7], 16) or 1
+
+# CREATE_STATEMENTS as one atomic script, built once for initialize()
+_SCHEMA_SCRIPT = (
+    "BEGIN;\n" + _SCHEMA_DDL + f";\nPRAGMA user_version = {_SCHEMA_VERSION};\nCOMMIT;"
+)
+
+# Applied to every connection. WAL lets the expiration worker read while the
+# bot writes, and NORMAL sync is durable in WAL mode except on power loss.
+CONNECTION_PRAGMAS: List[str] = [
+    # Only takes effect on a new, empty file, and must precede the switch to
+    # WAL; lets run_maintenance() hand freed pages back to the filesystem.
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=134217728",  # 128 MiB
+    "PRAGMA cache_size=-20000",  # ~20 MiB page cache
+    "PRAGMA journal_size_limit=6144000",  # truncate the WAL back to ~6 MB after checkpoints
 ]
 
 
+# Prepared statements kept per connection. The handlers use about 40
+# distinct queries today; the headroom keeps them all cached as that grows.
+CACHED_STATEMENTS = 256
+
+# Free pages released per run_maintenance() call (4 MiB at 4 KiB pages)
+MAINTENANCE_VACUUM_PAGES = 1000
+
+# Bound parameters per statement on SQLite builds older than 3.32
+_MAX_BOUND_PARAMETERS = 999
+
+_LOCAL = threading.local()
+
+# Parent directories already created by this process
+_CREATED_DIRS: set = set()
+
+
+def memory_uri() -> str:
+    """Return the URI of a new, uniquely named in-memory database.
+
+    Every connection opened with the same URI (one per thread) sees the
+    same data, and the database lives until the last of them is closed.
+    The name is unique so unrelated databases in one process never meet.
+
+    Shared-cache connections lock whole tables against each other and
+    report a conflict as ``SQLITE_LOCKED`` ("database table is locked")
+    at once; the busy timeout that makes file-database writers wait does
+    not apply. Concurrent writers on an in-memory database must expect
+    that error.
+    """
+
+    return f"file:memdb-{uuid4().hex}?mode=memory&cache=shared"
+
+
 def connect(db_path: str) -> sqlite3.Connection:
     """Open a SQLite connection with sensible defaults."""
 
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    _ensure_parent_dir(db_path)
+    if db_path == ":memory:":
+        # A private database, as with plain sqlite3; share one via memory_uri()
+        db_path = memory_uri()
+    # isolation_level=None: the driver never opens transactions implicitly;
+    # transaction() begins them explicitly. The default 5 s timeout is the
+    # busy handler, so a second writer waits for the lock instead of failing.
+    conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        isolation_level=None,
+        uri=db_path.startswith("file:"),
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _ensure_parent_dir(db_path: str) -> None:
+    """Create the database's directory once per process."""
+
+    if db_path == ":memory:" or db_path.startswith("file:"):
+        return
+    parent = str(Path(db_path).parent)
+    if parent not in _CREATED_DIRS:
+        Path(parent).mkdir(parents=True, exist_ok=True)
+        _CREATED_DIRS.add(parent)
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Return the calling thread's connection to ``db_path``.
+
+    Each thread gets its own connection, opened on first use, so the bot
+    loop and the expiration worker never interleave statements inside one
+    another's transactions.
+    """
+
+    connections = getattr(_LOCAL, "connections", None)
+    if connections is None:
+        connections = _LOCAL.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
     return conn
 
 
 def initialize(conn: sqlite3.Connection) -> None:
     """Create tables if they do not exist."""
 
-    cursor = conn.cursor()
-    for statement in CREATE_STATEMENTS:
-        cursor.execute(statement)
-    conn.commit()
+    # A database already built from this exact schema needs no DDL at all
+    if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+        # executescript commits any pending transaction first; the script
+        # then applies the whole schema in one call and one transaction.
+        conn.executescript(_SCHEMA_SCRIPT)
+    # Refresh planner statistics where they are missing or stale so the
+    # indexes above are actually chosen; cheap when nothing changed.
+    conn.execute("PRAGMA optimize")
+
+
+def run_maintenance(conn: sqlite3.Connection, vacuum_pages: int = MAINTENANCE_VACUUM_PAGES) -> None:
+    """Release free pages and reset the WAL file.
+
+    Meant to run periodically from a background thread. Both steps are
+    incremental, so the bot never stalls behind a full ``VACUUM``.
+    """
+
+    conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
 
 
 @contextmanager
-def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
-    """Context manager that wraps a transaction."""
+def transaction(conn: sqlite3.Connection, write: bool = False) -> Iterator[sqlite3.Cursor]:
+    """Context manager that wraps a transaction.
+
+    By default the transaction is deferred: reads take no write lock, and
+    a block whose first statement writes waits for the lock through the
+    busy timeout. Pass ``write=True`` for a block that reads and then
+    writes; the write lock is then taken up front with ``BEGIN IMMEDIATE``,
+    so the block cannot fail with ``SQLITE_BUSY`` halfway through when
+    another thread has written since its read. Inside an already open
+    transaction the block simply joins it.
+    """
 
     cursor = conn.cursor()
+    if conn.in_transaction:
+        yield cursor
+        return
+    cursor.execute("BEGIN IMMEDIATE" if write else "BEGIN")
     try:
         yield cursor
     except Exception:
@@ -160,15 +317,108 @@ def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
         conn.commit()
 
 
+def bulk_insert(
+    cursor: sqlite3.Cursor,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    chunk_size: int = 100,
+) -> int:
+    """Insert many rows using multi-row ``VALUES`` statements.
+
+    Rows are sent ``chunk_size`` at a time as one ``INSERT ... VALUES
+    (...), (...)`` statement, so SQLite steps one statement per chunk
+    instead of one per row. ``table`` and ``columns`` are interpolated
+    into the SQL and must be trusted identifiers, never user input.
+    Returns the number of rows inserted.
+    """
+
+    width = len(columns)
+    # Stay under SQLITE_MAX_VARIABLE_NUMBER on older builds (999)
+    chunk_size = max(1, min(chunk_size, _MAX_BOUND_PARAMETERS // width))
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    row_sql = "(" + ", ".join("?" for _ in columns) + ")"
+
+    rows = list(rows)
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        params = [value for row in chunk for value in row]
+        # Full chunks share one SQL string, so the statement cache reuses it
+        cursor.execute(prefix + ", ".join([row_sql] * len(chunk)), params)
+        inserted += len(chunk)
+    return inserted
+
+
 def fetch_one(cursor: sqlite3.Cursor) -> Optional[Dict[str, str]]:
     """Convert a single row into a dictionary."""
 
-    row = cursor.fetchone()
-    return dict(row) if row else None
+    with _tuple_rows(cursor):
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(_column_names(cursor), row))
 
 
 def fetch_all(cursor: sqlite3.Cursor) -> List[Dict[str, str]]:
     """Convert rows into a list of dictionaries."""
 
-    rows = cursor.fetchall()
-    return [dict(row) for row in rows]
+    with _tuple_rows(cursor):
+        rows = cursor.fetchall()
+    if not rows:
+        return []
+    # Resolve column names once instead of per row
+    columns = _column_names(cursor)
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def fetch_columns(cursor: sqlite3.Cursor) -> Dict[str, List[Any]]:
+    """Return the result as one list per column.
+
+    Suits aggregate and report queries: ``sum(result["total_price"])``
+    walks a plain list instead of looking a key up in every row dict.
+    """
+
+    columns = _column_names(cursor)
+    with _tuple_rows(cursor):
+        rows = cursor.fetchall()
+    if not rows:
+        return {column: [] for column in columns}
+    return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+
+@contextmanager
+def _tuple_rows(cursor: sqlite3.Cursor) -> Iterator[None]:
+    """Fetch plain tuples from ``cursor`` for the duration of the block.
+
+    The helpers above copy each row into their own structure, so building
+    an ``sqlite3.Row`` first is wasted work. The cursor's factory is put
+    back afterwards for callers that keep using it.
+    """
+
+    row_factory = cursor.row_factory
+    cursor.row_factory = None
+    try:
+        yield
+    finally:
+        cursor.row_factory = row_factory
+
+
+def iter_rows(cursor: sqlite3.Cursor, arraysize: int = 200) -> Iterator[sqlite3.Row]:
+    """Yield result rows without building a list of dictionaries.
+
+    Rows are fetched ``arraysize`` at a time and support both ``row["name"]``
+    and ``row[0]`` access, which is all most single-pass callers need.
+    """
+
+    while True:
+        rows = cursor.fetchmany(arraysize)
+        if not rows:
+            return
+        yield from rows
+
+
+def _column_names(cursor: sqlite3.Cursor) -> List[str]:
+    """Return the result column names of the cursor's last query."""
+
+    return [column[0] for column in cursor.description]
@@ -6,20 +6,32 @@ SQLite and HTTP requests that are available in a default Python installation.
 from __future__ import annotations
 
 import base64
+import functools
 import json
 import logging
+import sqlite3
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
-from urllib.parse import quote, urlencode, urlparse
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, quote_plus, urlparse
+
+try:
+    # Optional faster parser for the JSON-in-JSON panel fields
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
 
 from .config import Settings
 from . import database
 from . import i18n
 from . import pricing
 from . import security
-from .telegram import TelegramAPIError, TelegramBot
-from .xui_api import XUIClient, XUIError
+from .telegram import LONG_POLL_TIMEOUT, MEDIA_GROUP_LIMIT, TelegramAPIError, TelegramBot
+from .xui_api import XUIClient, XUIError, with_deadline
 
 LOGGER = logging.getLogger(__name__)
 
@@ -29,12 +41,133 @@ ROLE_USER = "USER"
 
 STATUS_WAITING_RECEIPT = "WAITING_RECEIPT"
 STATUS_PENDING_REVIEW = "PENDING_REVIEW"
+# Claimed by one admin's approval while its panel client is being created
+STATUS_APPROVING = "APPROVING"
 STATUS_ACTIVE = "ACTIVE"
 STATUS_REJECTED = "REJECTED"
 STATUS_EXPIRED = "EXPIRED"
 
 # Constants
 DAYS_PER_MONTH = 30  # Approximate conversion for months to days
+BYTES_PER_GB = 1024 ** 3  # Panel traffic limits are in bytes
+# Upper bound on orders handled per expiration sweep; the rest are picked up
+# on the next tick since processed orders no longer match the query.
+EXPIRED_BATCH_SIZE = 500
+# Longest pause, in seconds, between getUpdates retries while Telegram is
+# unreachable; the pause doubles from POLL_INTERVAL up to this.
+MAX_POLL_BACKOFF = 60.0
+# Seconds allowed for reading back the new client after approval. The
+# lookup only adds the config link to the message, so it gives up sooner
+# than the panel's own retry budget.
+INBOUND_LOOKUP_DEADLINE = 15.0
+# Update types _process_update handles; Telegram does not send the others
+ALLOWED_UPDATES = ["message", "callback_query"]
+# How long the purchase menu (plan list and bank card) is served from memory.
+# Admin edits drop the cache at once; the TTL only bounds staleness from
+# changes made outside the bot.
+MENU_CACHE_TTL = 60.0  # seconds
+
+# Dashboard buttons per role as rows of (translation key, callback data)
+_DASHBOARD_LAYOUTS = {
+    ROLE_ADMIN: (
+        (("admin.add_server", "admin:add_server"), ("admin.list_servers", "admin:list_servers")),
+        (("admin.add_plan", "admin:add_plan"), ("admin.list_plans", "admin:list_plans")),
+        (("admin.assign_role", "admin:assign_role"), ("admin.accountants", "admin:list_accountants")),
+        (("admin.set_bank", "admin:set_bank"), ("admin.pending_receipts", "accountant:pending")),
+        (("common.language", "common:change_language"),),
+    ),
+    ROLE_ACCOUNTANT: (
+        (("accountant.pending_receipts", "accountant:pending"),),
+        (("accountant.view_plans", "user:buy"),),
+        (("accountant.my_orders", "user:status"),),
+        (("common.language", "common:change_language"),),
+    ),
+    ROLE_USER: (
+        (("user.buy_plan", "user:buy"),),
+        (("user.customize_plan", "user:customize"),),
+        (("user.order_status", "user:status"),),
+        (("common.language", "common:change_language"),),
+    ),
+}
+
+
+# Callback handlers as (app, chat_id, user) for fixed callback data ...
+_CALLBACK_ACTIONS = {
+    "admin:add_server": lambda app, chat_id, user: app._prompt_add_server(chat_id),
+    "admin:list_servers": lambda app, chat_id, user: app._list_servers(chat_id),
+    "admin:add_plan": lambda app, chat_id, user: app._prompt_add_plan(chat_id),
+    "admin:list_plans": lambda app, chat_id, user: app._list_plans(chat_id),
+    "admin:assign_role": lambda app, chat_id, user: app._prompt_assign_role(chat_id),
+    "admin:list_accountants": lambda app, chat_id, user: app._list_accountants(chat_id),
+    "admin:set_bank": lambda app, chat_id, user: app._prompt_bank_card(chat_id),
+    "accountant:pending": lambda app, chat_id, user: app._show_pending_orders(chat_id),
+    "user:buy": lambda app, chat_id, user: app._show_plans_for_purchase(chat_id),
+    "user:status": lambda app, chat_id, user: app._show_user_orders(chat_id),
+    "user:customize": lambda app, chat_id, user: app._start_custom_plan(chat_id, user),
+    "common:change_language": lambda app, chat_id, user: app._show_language_options(chat_id, user),
+    "common:back": lambda app, chat_id, user: app._send_dashboard(user, chat_id),
+}
+
+# ... and as (app, chat_id, user, argument) for "<prefix><argument>" data
+_CALLBACK_PREFIX_ACTIONS = (
+    ("admin:delete_server:", lambda app, chat_id, user, arg: app._delete_server(chat_id, int(arg))),
+    ("admin:delete_plan:", lambda app, chat_id, user, arg: app._delete_plan(chat_id, int(arg))),
+    ("accountant:approve:", lambda app, chat_id, user, arg: app._approve_order(chat_id, int(arg))),
+    ("accountant:reject:", lambda app, chat_id, user, arg: app._reject_order(chat_id, int(arg))),
+    ("user:buy:", lambda app, chat_id, user, arg: app._start_purchase(chat_id, int(arg))),
+    (
+        "user:customize_server:",
+        lambda app, chat_id, user, arg: app._custom_plan_select_volume(chat_id, user, int(arg)),
+    ),
+    ("user:customize_confirm:", lambda app, chat_id, user, arg: app._confirm_custom_plan(chat_id, user)),
+    ("common:set_language:", lambda app, chat_id, user, arg: app._set_user_language(chat_id, user, arg)),
+)
+
+
+def _update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Return the chat an update belongs to, if any."""
+
+    message = update.get("message") or update.get("callback_query", {}).get("message") or {}
+    return message.get("chat", {}).get("id")
+
+
+def _order_summary(row: sqlite3.Row) -> str:
+    """Format one order for the user's order list."""
+    # Custom plans have no plan row, so describe them by volume and duration
+    plan_name = row["name"] or f"Custom Plan ({row['volume_gb'] or 0}GB, {row['duration_days'] or 0} days)"
+    return (
+        f"Order #{row['id']} - {plan_name}\nStatus: {row['status']}\n"
+        f"Expires: {row['expires_at'] or '-'}\nUsed: {row['traffic_used']} GB"
+    )
+
+
+def _review_keyboard(orders: list) -> Dict:
+    """Approve/reject buttons, one row per ``(order_id, ...)`` entry."""
+
+    return {
+        "inline_keyboard": [
+            [
+                {"text": f"Approve #{order_id}", "callback_data": f"accountant:approve:{order_id}"},
+                {"text": f"Reject #{order_id}", "callback_data": f"accountant:reject:{order_id}"},
+            ]
+            for order_id, *_ in orders
+        ]
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _build_dashboard_keyboard(role: str, lang: str) -> Dict:
+    """Build a role's dashboard keyboard once per language.
+
+    The result is shared between calls and must not be mutated.
+    """
+
+    return {
+        "inline_keyboard": [
+            [{"text": i18n.get_text(key, lang=lang), "callback_data": data} for key, data in row]
+            for row in _DASHBOARD_LAYOUTS[role]
+        ]
+    }
 
 
 def _extract_payload(response: Dict[str, Any]) -> Dict[str, Any]:
@@ -56,7 +189,7 @@ def _as_dict(value: Any) -> Dict[str, Any]:
         return value
     if isinstance(value, str) and value:
         try:
-            parsed = json.loads(value)
+            parsed = orjson.loads(value) if orjson is not None else json.loads(value)
         except json.JSONDecodeError:
             return {}
         if isinstance(parsed, dict):
@@ -82,13 +215,29 @@ def _find_client(settings: Dict[str, Any], *, client_id: Optional[str], email: s
     return {}
 
 
-def _tls_parameters(stream_settings: Dict[str, Any], security: str) -> Dict[str, str]:
+@functools.lru_cache(maxsize=64)
+def _hostname(url: str) -> Optional[str]:
+    """Return the host of a server's base URL; there are only a handful."""
+
+    return urlparse(url).hostname
+
+
+def _query_string(params: Dict[str, Any]) -> str:
+    """Encode the non-empty ``params`` like ``urlencode`` in a single pass.
+
+    Keys are fixed ASCII parameter names and need no quoting.
+    """
+
+    return "&".join(f"{key}={quote_plus(str(value), safe='')}" for key, value in params.items() if value)
+
+
+def _tls_parameters(stream_settings: Dict[str, Any], stream_security: str) -> Dict[str, str]:
     """Collect TLS-related query parameters."""
 
     params: Dict[str, str] = {}
-    if security and security != "none":
-        params["security"] = security
-        tls_settings = stream_settings.get(f"{security}Settings")
+    if stream_security and stream_security != "none":
+        params["security"] = stream_security
+        tls_settings = stream_settings.get(f"{stream_security}Settings")
         if isinstance(tls_settings, dict):
             server_name = tls_settings.get("serverName")
             if server_name:
@@ -132,15 +281,96 @@ def _network_parameters(stream_settings: Dict[str, Any], network: str) -> Dict[s
         if isinstance(http_settings, dict):
             path = http_settings.get("path")
             if isinstance(path, list):
-                params["path"] = ",".join(path)
-            elif isinstance(path, str):
+                path = ",".join(path)
+            if isinstance(path, str) and path:
                 params["path"] = path
             host = http_settings.get("host")
-            if isinstance(host, list) and host:
-                params["host"] = ",".join(host)
-            elif isinstance(host, str):
+            if isinstance(host, list):
+                host = ",".join(host)
+            if isinstance(host, str) and host:
                 params["host"] = host
-    return {k: v for k, v in params.items() if v}
+    return params
+
+
+def _vless_link(
+    host: str,
+    port: Any,
+    remark: str,
+    client: Dict[str, Any],
+    stream_settings: Dict[str, Any],
+    network: str,
+    stream_security: str,
+) -> Optional[str]:
+    user_id = client.get("id") or client.get("uuid")
+    if not user_id:
+        return None
+    params = {"type": network, "encryption": "none"}
+    params.update(_tls_parameters(stream_settings, stream_security))
+    params.update(_network_parameters(stream_settings, network))
+    return f"vless://{user_id}@{host}:{port}?{_query_string(params)}#{quote(remark)}"
+
+
+def _vmess_link(
+    host: str,
+    port: Any,
+    remark: str,
+    client: Dict[str, Any],
+    stream_settings: Dict[str, Any],
+    network: str,
+    stream_security: str,
+) -> Optional[str]:
+    user_id = client.get("id") or client.get("uuid")
+    if not user_id:
+        return None
+    tls_params = _tls_parameters(stream_settings, stream_security)
+    net_params = _network_parameters(stream_settings, network)
+    vmess_config = {
+        "v": "2",
+        "ps": remark,
+        "add": host,
+        "port": str(port),
+        "id": user_id,
+        "aid": str(client.get("alterId") or client.get("aid") or 0),
+        "scy": client.get("security") or "auto",
+        "net": network,
+        "type": net_params.get("headerType", "none"),
+        "host": net_params.get("host", tls_params.get("sni", "")),
+        "path": net_params.get("path", ""),
+        "tls": "tls" if stream_security and stream_security != "none" else "",
+        "sni": tls_params.get("sni", ""),
+        "alpn": tls_params.get("alpn", ""),
+    }
+    encoded = base64.b64encode(json.dumps(vmess_config, separators=(",", ":")).encode()).decode()
+    return f"vmess://{encoded}"
+
+
+def _trojan_link(
+    host: str,
+    port: Any,
+    remark: str,
+    client: Dict[str, Any],
+    stream_settings: Dict[str, Any],
+    network: str,
+    stream_security: str,
+) -> Optional[str]:
+    password = client.get("password") or client.get("id") or client.get("uuid")
+    if not password:
+        return None
+    params = {"type": network}
+    params.update(_tls_parameters(stream_settings, stream_security))
+    params.update(_network_parameters(stream_settings, network))
+    query = _query_string(params)
+    if query:
+        query = f"?{query}"
+    return f"trojan://{password}@{host}:{port}{query}#{quote(remark)}"
+
+
+# Share-link builder per inbound protocol
+_LINK_BUILDERS = {
+    "vless": _vless_link,
+    "vmess": _vmess_link,
+    "trojan": _trojan_link,
+}
 
 
 def build_config_link(base_url: str, inbound: Dict[str, Any], client: Dict[str, Any]) -> Optional[str]:
@@ -148,92 +378,132 @@ def build_config_link(base_url: str, inbound: Dict[str, Any], client: Dict[str,
 
     if not inbound or not client:
         return None
-    host = urlparse(base_url).hostname or inbound.get("listen")
+    host = _hostname(base_url) or inbound.get("listen")
     port = inbound.get("port")
     protocol = inbound.get("protocol")
     if not host or not port or not protocol:
         return None
-    remark = inbound.get("remark") or client.get("email") or "VPN"
+    builder = _LINK_BUILDERS.get(protocol)
+    if builder is None:
+        return None
+    remark = str(inbound.get("remark") or client.get("email") or "VPN")
     stream_settings = _as_dict(inbound.get("streamSettings"))
     network = stream_settings.get("network", "tcp")
-    security = stream_settings.get("security", "none")
-    if protocol == "vless":
-        user_id = client.get("id") or client.get("uuid")
-        if not user_id:
-            return None
-        params = {"type": network, "encryption": "none"}
-        params.update(_tls_parameters(stream_settings, security))
-        params.update(_network_parameters(stream_settings, network))
-        query = urlencode({k: v for k, v in params.items() if v})
-        return f"vless://{user_id}@{host}:{port}?{query}#{quote(str(remark))}"
-    if protocol == "vmess":
-        user_id = client.get("id") or client.get("uuid")
-        if not user_id:
-            return None
-        tls_params = _tls_parameters(stream_settings, security)
-        net_params = _network_parameters(stream_settings, network)
-        vmess_config = {
-            "v": "2",
-            "ps": str(remark),
-            "add": host,
-            "port": str(port),
-            "id": user_id,
-            "aid": str(client.get("alterId") or client.get("aid") or 0),
-            "scy": client.get("security") or "auto",
-            "net": network,
-            "type": net_params.get("headerType", "none"),
-            "host": net_params.get("host", tls_params.get("sni", "")),
-            "path": net_params.get("path", ""),
-            "tls": "tls" if security and security != "none" else "",
-            "sni": tls_params.get("sni", ""),
-            "alpn": tls_params.get("alpn", ""),
-        }
-        encoded = base64.b64encode(json.dumps(vmess_config, separators=(",", ":")).encode()).decode()
-        return f"vmess://{encoded}"
-    if protocol == "trojan":
-        password = client.get("password") or client.get("id") or client.get("uuid")
-        if not password:
-            return None
-        params = {"type": network}
-        params.update(_tls_parameters(stream_settings, security))
-        params.update(_network_parameters(stream_settings, network))
-        query = urlencode({k: v for k, v in params.items() if v})
-        if query:
-            query = f"?{query}"
-        return f"trojan://{password}@{host}:{port}{query}#{quote(str(remark))}"
-    return None
+    stream_security = stream_settings.get("security", "none")
+    return builder(host, port, remark, client, stream_settings, network, stream_security)
 
 
 class BotApp:
     """Very small Telegram bot that processes updates sequentially."""
 
     def __init__(self, settings: Settings) -> None:
+        if settings.database_path == ":memory:":
+            # Named once here so every thread's connection opens the same database
+            settings = replace(settings, database_path=database.memory_uri())
         self.settings = settings
-        self.conn = database.connect(settings.database_path)
         database.initialize(self.conn)
-        self.bot = TelegramBot(settings.bot_token)
+        self._release_stale_claims()
+        self.stop_event = threading.Event()
+        # Flood-control pauses run on pool workers and end early on stop
+        self.bot = TelegramBot(settings.bot_token, stop_event=self.stop_event)
         self.states: Dict[int, Dict[str, object]] = {}
+        # True only while blocked in getUpdates, i.e. when the poll can be
+        # abandoned without losing work; dispatched updates finish on the pool.
+        self.waiting_for_updates = False
+        # Updates are handled on a pool so one slow panel call does not hold
+        # up other chats. Updates of one chat stay in order: they queue here
+        # and a single pool task drains each chat's queue.
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.handler_workers), thread_name_prefix="update-handler"
+        )
+        self._chat_queues: Dict[Optional[int], deque] = {}
+        self._chat_queues_lock = threading.Lock()
+        self._menu_cache: Dict[str, Tuple[float, Any]] = {}
+        # Bumped on every invalidation; a load that started before one is
+        # not stored, so a stale concurrent miss cannot refill the cache
+        self._menu_generation = 0
+        self._menu_cache_lock = threading.Lock()
+        # Panel clients shared by handlers and the expiration worker, so each
+        # panel keeps one session and its login cookies. Keyed by the server's
+        # current URL and credentials as well, so an edited server row never
+        # reuses a client (and its caches) built from the old values
+        self._clients: Dict[Tuple[int, str, str, str], XUIClient] = {}
+        self._clients_lock = threading.Lock()
+
+    def _release_stale_claims(self) -> None:
+        """Hand orders a previous run left mid-approval back for review."""
+        with database.transaction(self.conn) as cur:
+            cur.execute(
+                "UPDATE orders SET status = ? WHERE status = ?", (STATUS_PENDING_REVIEW, STATUS_APPROVING)
+            )
+            if cur.rowcount:
+                LOGGER.warning("returned %d interrupted approvals to review", cur.rowcount)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Database connection owned by the calling thread."""
+        return database.get_connection(self.settings.database_path)
 
     # ------------------------------------------------------------------
     # main loop
     # ------------------------------------------------------------------
+    def stop(self) -> None:
+        """Ask the polling loop (and anything sharing ``stop_event``) to exit."""
+        self.stop_event.set()
+
     def run(self) -> None:  # pragma: no cover - infinite loop
         LOGGER.info("bot started")
-        offset: Optional[int] = None
+        try:
+            offset: Optional[int] = None
+            failures = 0
+            while not self.stop_event.is_set():
+                self.waiting_for_updates = True
+                try:
+                    updates = self.bot.get_updates(
+                        offset=offset, timeout=LONG_POLL_TIMEOUT, allowed_updates=ALLOWED_UPDATES
+                    )
+                except Exception as exc:  # pragma: no cover - network error
+                    LOGGER.error("failed to fetch updates: %s", exc)
+                    failures += 1
+                    self.stop_event.wait(
+                        min(self.settings.poll_interval * 2 ** min(failures - 1, 10), MAX_POLL_BACKOFF)
+                    )
+                    continue
+                finally:
+                    self.waiting_for_updates = False
+                failures = 0
+                for update in updates:
+                    offset = update["update_id"] + 1
+                    self._dispatch(update)
+                # No pause here: getUpdates itself blocks until there is work
+        finally:
+            # Let dispatched updates finish, also when interrupted mid-poll
+            self._pool.shutdown(wait=True)
+        LOGGER.info("bot stopped")
+
+    def _dispatch(self, update: Dict) -> None:
+        chat_id = _update_chat_id(update)
+        with self._chat_queues_lock:
+            queue = self._chat_queues.get(chat_id)
+            if queue is not None:
+                # A task is already draining this chat; it will pick this up
+                queue.append(update)
+                return
+            self._chat_queues[chat_id] = deque([update])
+        self._pool.submit(self._drain_chat, chat_id)
+
+    def _drain_chat(self, chat_id: Optional[int]) -> None:
         while True:
+            with self._chat_queues_lock:
+                queue = self._chat_queues[chat_id]
+                if not queue:
+                    del self._chat_queues[chat_id]
+                    return
+                update = queue.popleft()
             try:
-                updates = self.bot.get_updates(offset=offset, timeout=25)
-            except Exception as exc:  # pragma: no cover - network error
-                LOGGER.error("failed to fetch updates: %s", exc)
-                time.sleep(self.settings.poll_interval)
-                continue
-            for update in updates:
-                offset = update["update_id"] + 1
-                try:
-                    self._process_update(update)
-                except Exception as exc:
-                    LOGGER.exception("unhandled error while processing update: %s", exc)
-            time.sleep(self.settings.poll_interval)
+                self._process_update(update)
+            except Exception as exc:
+                LOGGER.exception("unhandled error while processing update: %s", exc)
 
     # ------------------------------------------------------------------
     def _process_update(self, update: Dict) -> None:
@@ -270,84 +540,49 @@ class BotApp:
         if not user:
             return
         self.bot.answer_callback_query(callback["id"])
-        if data == "admin:add_server":
-            self._prompt_add_server(chat_id)
-        elif data == "admin:list_servers":
-            self._list_servers(chat_id)
-        elif data.startswith("admin:delete_server:"):
-            server_id = int(data.split(":")[-1])
-            self._delete_server(chat_id, server_id)
-        elif data == "admin:add_plan":
-            self._prompt_add_plan(chat_id)
-        elif data == "admin:list_plans":
-            self._list_plans(chat_id)
-        elif data.startswith("admin:delete_plan:"):
-            plan_id = int(data.split(":")[-1])
-            self._delete_plan(chat_id, plan_id)
-        elif data == "admin:assign_role":
-            self._prompt_assign_role(chat_id)
-        elif data == "admin:list_accountants":
-            self._list_accountants(chat_id)
-        elif data == "admin:set_bank":
-            self._prompt_bank_card(chat_id)
-        elif data == "accountant:pending":
-            self._show_pending_orders(chat_id)
-        elif data.startswith("accountant:approve:"):
-            order_id = int(data.split(":")[-1])
-            self._approve_order(chat_id, order_id)
-        elif data.startswith("accountant:reject:"):
-            order_id = int(data.split(":")[-1])
-            self._reject_order(chat_id, order_id)
-        elif data == "user:buy":
-            self._show_plans_for_purchase(chat_id)
-        elif data.startswith("user:buy:"):
-            plan_id = int(data.split(":")[-1])
-            self._start_purchase(chat_id, plan_id)
-        elif data == "user:status":
-            self._show_user_orders(chat_id)
-        elif data == "user:customize":
-            self._start_custom_plan(chat_id, user)
-        elif data.startswith("user:customize_server:"):
-            server_id = int(data.split(":")[-1])
-            self._custom_plan_select_volume(chat_id, user, server_id)
-        elif data.startswith("user:customize_confirm:"):
-            self._confirm_custom_plan(chat_id, user)
-        elif data == "common:change_language":
-            self._show_language_options(chat_id, user)
-        elif data.startswith("common:set_language:"):
-            lang = data.split(":")[-1]
-            self._set_user_language(chat_id, user, lang)
-        elif data == "common:back":
-            self._send_dashboard(user, chat_id)
-        else:
-            self._send_dashboard(user, chat_id)
+        action = _CALLBACK_ACTIONS.get(data)
+        if action is not None:
+            action(self, chat_id, user)
+            return
+        for prefix, action in _CALLBACK_PREFIX_ACTIONS:
+            if data.startswith(prefix):
+                action(self, chat_id, user, data[len(prefix):])
+                return
+        self._send_dashboard(user, chat_id)
 
     # ------------------------------------------------------------------
     def _ensure_user(self, message: Dict) -> Dict:
         chat = message["chat"]
         sender = message.get("from", {})
         telegram_id = str(chat["id"])
+        # Registered users, i.e. nearly every message, need one read and no
+        # write lock
+        row = database.fetch_one(
+            self.conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+        )
+        if row:
+            return row
         with database.transaction(self.conn) as cur:
-            cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-            row = database.fetch_one(cur)
-            if row:
-                return row
-            cur.execute("SELECT COUNT(*) AS admin_count FROM users WHERE role = ?", (ROLE_ADMIN,))
-            admin_count = cur.fetchone()[0]
-            role = ROLE_ADMIN if admin_count == 0 else ROLE_USER
+            # The first user to register becomes the admin. OR IGNORE covers
+            # a concurrent registration of the same chat.
             cur.execute(
-                "INSERT INTO users (telegram_id, username, first_name, role) VALUES (?, ?, ?, ?)",
+                "INSERT OR IGNORE INTO users (telegram_id, username, first_name, role) "
+                "SELECT ?, ?, ?, CASE WHEN EXISTS (SELECT 1 FROM users WHERE role = ?) THEN ? ELSE ? END",
                 (
                     telegram_id,
                     sender.get("username") or chat.get("username"),
                     sender.get("first_name") or chat.get("first_name"),
-                    role,
+                    ROLE_ADMIN,
+                    ROLE_USER,
+                    ROLE_ADMIN,
                 ),
             )
-        LOGGER.info("registered new user %s with role %s", telegram_id, role)
-        with database.transaction(self.conn) as cur:
+            registered = cur.rowcount == 1
             cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-            return database.fetch_one(cur) or {}
+            row = database.fetch_one(cur) or {}
+        if registered:
+            LOGGER.info("registered new user %s with role %s", telegram_id, row.get("role"))
+        return row
 
     # ------------------------------------------------------------------
     def _get_user_by_chat(self, chat_id: int) -> Optional[Dict]:
@@ -373,47 +608,9 @@ class BotApp:
 
     # ------------------------------------------------------------------
     def _dashboard_keyboard(self, role: str, lang: str = i18n.DEFAULT_LANGUAGE) -> Dict:
-        if role == ROLE_ADMIN:
-            return {
-                "inline_keyboard": [
-                    [
-                        {"text": i18n.get_text("admin.add_server", lang=lang), "callback_data": "admin:add_server"},
-                        {"text": i18n.get_text("admin.list_servers", lang=lang), "callback_data": "admin:list_servers"},
-                    ],
-                    [
-                        {"text": i18n.get_text("admin.add_plan", lang=lang), "callback_data": "admin:add_plan"},
-                        {"text": i18n.get_text("admin.list_plans", lang=lang), "callback_data": "admin:list_plans"},
-                    ],
-                    [
-                        {"text": i18n.get_text("admin.assign_role", lang=lang), "callback_data": "admin:assign_role"},
-                        {"text": i18n.get_text("admin.accountants", lang=lang), "callback_data": "admin:list_accountants"},
-                    ],
-                    [
-                        {"text": i18n.get_text("admin.set_bank", lang=lang), "callback_data": "admin:set_bank"},
-                        {"text": i18n.get_text("admin.pending_receipts", lang=lang), "callback_data": "accountant:pending"},
-                    ],
-                    [
-                        {"text": i18n.get_text("common.language", lang=lang), "callback_data": "common:change_language"},
-                    ],
-                ]
-            }
-        if role == ROLE_ACCOUNTANT:
-            return {
-                "inline_keyboard": [
-                    [{"text": i18n.get_text("accountant.pending_receipts", lang=lang), "callback_data": "accountant:pending"}],
-                    [{"text": i18n.get_text("accountant.view_plans", lang=lang), "callback_data": "user:buy"}],
-                    [{"text": i18n.get_text("accountant.my_orders", lang=lang), "callback_data": "user:status"}],
-                    [{"text": i18n.get_text("common.language", lang=lang), "callback_data": "common:change_language"}],
-                ]
-            }
-        return {
-            "inline_keyboard": [
-                [{"text": i18n.get_text("user.buy_plan", lang=lang), "callback_data": "user:buy"}],
-                [{"text": i18n.get_text("user.customize_plan", lang=lang), "callback_data": "user:customize"}],
-                [{"text": i18n.get_text("user.order_status", lang=lang), "callback_data": "user:status"}],
-                [{"text": i18n.get_text("common.language", lang=lang), "callback_data": "common:change_language"}],
-            ]
-        }
+        if role not in _DASHBOARD_LAYOUTS:
+            role = ROLE_USER
+        return _build_dashboard_keyboard(role, lang)
 
     # ------------------------------------------------------------------
     def _show_language_options(self, chat_id: int, user: Dict) -> None:
@@ -476,10 +673,7 @@ class BotApp:
         with database.transaction(self.conn) as cur:
             cur.execute("SELECT id, title, base_url FROM servers ORDER BY id")
             servers = database.fetch_all(cur)
-        if not servers:
-            text = "No servers stored."
-        else:
-            text = "\n".join(f"#{s['id']} - {s['title']} ({s['base_url']})" for s in servers)
+        text = "\n".join(f"#{s['id']} - {s['title']} ({s['base_url']})" for s in servers) or "No servers stored."
         keyboard = {
             "inline_keyboard": [
                 [
@@ -494,6 +688,9 @@ class BotApp:
     def _delete_server(self, chat_id: int, server_id: int) -> None:
         with database.transaction(self.conn) as cur:
             cur.execute("DELETE FROM servers WHERE id = ?", (server_id,))
+        self._invalidate_menus()
+        with self._clients_lock:
+            self._drop_clients(server_id)
         self.bot.send_message(chat_id, f"Server #{server_id} deleted.")
 
     # ------------------------------------------------------------------
@@ -531,6 +728,7 @@ class BotApp:
                 " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (server_id, name, country, inbound_id, volume, duration, multi, price),
             )
+        self._invalidate_menus()
         self.states.pop(chat_id, None)
         self.bot.send_message(chat_id, "Plan saved.")
 
@@ -546,25 +744,24 @@ class BotApp:
             text = "No plans configured."
             keyboard = self._dashboard_keyboard(ROLE_ADMIN)
         else:
-            lines = []
-            keyboard = {"inline_keyboard": []}
-            for plan in plans:
-                lines.append(
-                    (
-                        f"#{plan['id']} - {plan['name']} ({plan['country']}) - "
-                        f"{plan['volume_gb']}GB/{plan['duration_days']}d - ${plan['price']} on {plan['title']}"
-                    )
-                )
-                keyboard["inline_keyboard"].append(
+            text = "\n".join(
+                f"#{plan['id']} - {plan['name']} ({plan['country']}) - "
+                f"{plan['volume_gb']}GB/{plan['duration_days']}d - ${plan['price']} on {plan['title']}"
+                for plan in plans
+            )
+            keyboard = {
+                "inline_keyboard": [
                     [{"text": f"Delete #{plan['id']}", "callback_data": f"admin:delete_plan:{plan['id']}"}]
-                )
-            text = "\n".join(lines)
+                    for plan in plans
+                ]
+            }
         self.bot.send_message(chat_id, text, reply_markup=keyboard)
 
     # ------------------------------------------------------------------
     def _delete_plan(self, chat_id: int, plan_id: int) -> None:
         with database.transaction(self.conn) as cur:
             cur.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+        self._invalidate_menus()
         self.bot.send_message(chat_id, f"Plan #{plan_id} deleted.")
 
     # ------------------------------------------------------------------
@@ -584,13 +781,15 @@ class BotApp:
         if role not in {ROLE_ADMIN, ROLE_ACCOUNTANT}:
             self.bot.send_message(chat_id, "Role must be ADMIN or ACCOUNTANT.")
             return
-        with database.transaction(self.conn) as cur:
+        with database.transaction(self.conn, write=True) as cur:
             cur.execute("SELECT * FROM users WHERE username = ?", (username.lstrip("@"),))
             user = database.fetch_one(cur)
-            if not user:
-                self.bot.send_message(chat_id, "User not found. Ask them to /start the bot first.")
-                return
-            cur.execute("UPDATE users SET role = ? WHERE id = ?", (role, user["id"]))
+            if user:
+                cur.execute("UPDATE users SET role = ? WHERE id = ?", (role, user["id"]))
+        # Replies go out after the write lock is released
+        if not user:
+            self.bot.send_message(chat_id, "User not found. Ask them to /start the bot first.")
+            return
         self.states.pop(chat_id, None)
         self.bot.send_message(chat_id, f"Role updated for {username} -> {role}.")
 
@@ -598,11 +797,9 @@ class BotApp:
     def _list_accountants(self, chat_id: int) -> None:
         with database.transaction(self.conn) as cur:
             cur.execute("SELECT username, first_name FROM users WHERE role = ? ORDER BY id", (ROLE_ACCOUNTANT,))
-            users = database.fetch_all(cur)
-        if not users:
+            text = "\n".join(f"@{u['username'] or ''} - {u['first_name'] or ''}" for u in database.iter_rows(cur))
+        if not text:
             text = "No accountants assigned."
-        else:
-            text = "\n".join(f"@{u['username'] or ''} - {u['first_name'] or ''}" for u in users)
         self.bot.send_message(chat_id, text)
 
     # ------------------------------------------------------------------
@@ -618,6 +815,7 @@ class BotApp:
             return
         with database.transaction(self.conn) as cur:
             cur.execute("REPLACE INTO settings (key, value) VALUES ('bank_card', ?)", (card,))
+        self._invalidate_menus()
         self.states.pop(chat_id, None)
         self.bot.send_message(chat_id, "Bank card saved.")
 
@@ -635,6 +833,8 @@ class BotApp:
         if not rows:
             self.bot.send_message(chat_id, "No pending receipts.")
             return
+        receipts = []
+        without_receipt = []
         for row in rows:
             # Use plan name if available, otherwise show as custom plan
             plan_name = row.get("name")
@@ -644,23 +844,36 @@ class BotApp:
                 price = row.get('total_price') or 0
                 plan_name = f"Custom Plan ({volume}GB, {days} days, ${price:.2f})"
             caption = f"Order #{row['id']} from @{row['username']} for {plan_name}"
-            keyboard = {
-                "inline_keyboard": [
-                    [
-                        {"text": f"Approve #{row['id']}", "callback_data": f"accountant:approve:{row['id']}"},
-                        {"text": f"Reject #{row['id']}", "callback_data": f"accountant:reject:{row['id']}"},
-                    ]
-                ]
-            }
             file_id = row.get("receipt_file_id")
             if file_id:
-                self.bot.send_photo(chat_id, file_id, caption=caption, reply_markup=keyboard)
+                receipts.append((row["id"], caption, file_id))
             else:
-                self.bot.send_message(chat_id, caption, reply_markup=keyboard)
+                without_receipt.append((row["id"], caption, None))
+        # Receipts go out as albums of up to MEDIA_GROUP_LIMIT photos. Albums
+        # cannot carry buttons, so each is followed by one message holding
+        # the approve/reject buttons for its orders.
+        for start in range(0, len(receipts), MEDIA_GROUP_LIMIT):
+            batch = receipts[start:start + MEDIA_GROUP_LIMIT]
+            if len(batch) == 1:
+                order_id, caption, file_id = batch[0]
+                self.bot.send_photo(chat_id, file_id, caption=caption, reply_markup=_review_keyboard(batch))
+                continue
+            self.bot.send_media_group(
+                chat_id,
+                [{"type": "photo", "media": file_id, "caption": caption} for _, caption, file_id in batch],
+            )
+            self.bot.send_message(
+                chat_id, "\n".join(caption for _, caption, _ in batch), reply_markup=_review_keyboard(batch)
+            )
+        for start in range(0, len(without_receipt), MEDIA_GROUP_LIMIT):
+            batch = without_receipt[start:start + MEDIA_GROUP_LIMIT]
+            self.bot.send_message(
+                chat_id, "\n".join(caption for _, caption, _ in batch), reply_markup=_review_keyboard(batch)
+            )
 
     # ------------------------------------------------------------------
     def _approve_order(self, chat_id: int, order_id: int) -> None:
-        order = self._get_order(order_id)
+        order = self._get_order_bundle(order_id)
         if not order:
             self.bot.send_message(chat_id, "Order not found.")
             return
@@ -671,87 +884,110 @@ class BotApp:
         # Handle both prebuilt plans and custom plans
         if order.get("plan_id"):
             # Prebuilt plan
-            plan = self._get_plan(order["plan_id"])
-            if not plan:
+            if order["plan_row_id"] is None:
                 self.bot.send_message(chat_id, "Plan not found for order.")
                 return
-            server_id = plan["server_id"]
-            inbound_id = plan["inbound_id"]
-            duration_days = plan["duration_days"]
-            volume_gb = plan["volume_gb"]
-            multi_user = plan["multi_user"]
-            plan_name = plan["name"]
+            inbound_id = order["plan_inbound_id"]
+            duration_days = order["plan_duration_days"]
+            volume_gb = order["plan_volume_gb"]
+            multi_user = order["plan_multi_user"]
+            plan_name = order["plan_name"]
         else:
             # Custom plan
             if not order.get("server_id"):
                 self.bot.send_message(chat_id, "Server not found for custom order.")
                 return
-            server_id = order["server_id"]
             duration_days = order["duration_days"]
             volume_gb = order["volume_gb"]
             multi_user = order["multi_user"]
             plan_name = "Custom Plan"
             
-            # Get inbound_id from server - use the first available inbound
-            with database.transaction(self.conn) as cur:
-                cur.execute(
-                    "SELECT inbound_id FROM inbounds WHERE server_id = ? LIMIT 1",
-                    (server_id,),
-                )
-                inbound_row = database.fetch_one(cur)
-            if not inbound_row:
+            # Custom orders use the server's first configured inbound
+            inbound_id = order["server_inbound_id"]
+            if inbound_id is None:
                 self.bot.send_message(chat_id, "No inbound configured for this server.")
                 return
-            inbound_id = inbound_row["inbound_id"]
         
-        server = self._get_server(server_id)
-        if not server:
+        if order["server_row_id"] is None:
             self.bot.send_message(chat_id, "Server not found for plan.")
             return
+        server = {
+            "base_url": order["server_base_url"],
+            "username": order["server_username"],
+            "password": order["server_password"],
+        }
         
-        client = XUIClient(server["base_url"], server["username"], server["password"], verify_ssl=self.settings.xui_verify_ssl)
-        expires_at = datetime.utcnow() + timedelta(days=duration_days)
+        # Claim the order first, so a concurrent approval or rejection of the
+        # same order from another admin chat cannot also act on it
+        if not self._set_order_status(order_id, STATUS_PENDING_REVIEW, STATUS_APPROVING):
+            self.bot.send_message(chat_id, "Order is not waiting for approval.")
+            return
+        approved_at = datetime.utcnow()
+        expires_at = approved_at + timedelta(days=duration_days)
         config_payload = {
             "email": f"order-{order_id}",
             "expireTime": int(expires_at.timestamp() * 1000),
-            "totalGB": volume_gb * 1024 * 1024 * 1024,
+            "totalGB": volume_gb * BYTES_PER_GB,
             "limitIp": multi_user,
         }
+        config_id = None
+        settled = False
         try:
-            response = client.create_client(inbound_id, config_payload)
-            client_payload = _extract_payload(response)
-            config_id = (
-                client_payload.get("id")
-                or client_payload.get("clientId")
-                or client_payload.get("uuid")
-            )
+            client = self._client_for(order["server_row_id"], server)
+            try:
+                response = client.create_client(inbound_id, config_payload)
+                client_payload = _extract_payload(response)
+                config_id = (
+                    client_payload.get("id")
+                    or client_payload.get("clientId")
+                    or client_payload.get("uuid")
+                )
+                if config_id is not None:
+                    config_id = str(config_id)
+            except XUIError as exc:
+                self.bot.send_message(chat_id, f"Panel error: {exc}")
+                return
+            inbound_details: Dict[str, Any] = {}
+            client_entry: Dict[str, Any] = {}
+            try:
+                with with_deadline(INBOUND_LOOKUP_DEADLINE):
+                    inbound_response = client.get_inbound(inbound_id)
+                inbound_details = _extract_payload(inbound_response)
+                settings = _as_dict(inbound_details.get("settings"))
+                client_entry = _find_client(settings, client_id=config_id, email=config_payload["email"])
+            except XUIError as exc:
+                LOGGER.warning("failed to load inbound details for config: %s", exc)
+            except Exception as exc:  # pragma: no cover - defensive
+                LOGGER.warning("unexpected error while parsing inbound data: %s", exc)
+            with database.transaction(self.conn) as cur:
+                cur.execute(
+                    "UPDATE orders SET status = ?, approved_at = ?, expires_at = ?, config_id = ?"
+                    " WHERE id = ? AND status = ?",
+                    (
+                        STATUS_ACTIVE,
+                        approved_at.isoformat(),
+                        expires_at.isoformat(),
+                        config_id,
+                        order_id,
+                        STATUS_APPROVING,
+                    ),
+                )
+                claimed = cur.rowcount == 1
+            settled = True
+        finally:
+            if not settled:
+                # Whatever failed after the claim, hand the order back for
+                # review instead of leaving it stuck in APPROVING
+                if config_id is not None:
+                    self._remove_panel_client(client, inbound_id, config_id, order_id)
+                self._set_order_status(order_id, STATUS_APPROVING, STATUS_PENDING_REVIEW)
+        if not claimed:
+            # The claim was lost after all; do not leave an unpaid client behind
+            LOGGER.warning("order %s changed during approval; removing its panel client", order_id)
             if config_id is not None:
-                config_id = str(config_id)
-        except XUIError as exc:
-            self.bot.send_message(chat_id, f"Panel error: {exc}")
+                self._remove_panel_client(client, inbound_id, config_id, order_id)
+            self.bot.send_message(chat_id, "Order is not waiting for approval.")
             return
-        inbound_details: Dict[str, Any] = {}
-        client_entry: Dict[str, Any] = {}
-        try:
-            inbound_response = client.get_inbound(inbound_id)
-            inbound_details = _extract_payload(inbound_response)
-            settings = _as_dict(inbound_details.get("settings"))
-            client_entry = _find_client(settings, client_id=config_id, email=config_payload["email"])
-        except XUIError as exc:
-            LOGGER.warning("failed to load inbound details for config: %s", exc)
-        except Exception as exc:  # pragma: no cover - defensive
-            LOGGER.warning("unexpected error while parsing inbound data: %s", exc)
-        with database.transaction(self.conn) as cur:
-            cur.execute(
-                "UPDATE orders SET status = ?, approved_at = ?, expires_at = ?, config_id = ? WHERE id = ?",
-                (
-                    STATUS_ACTIVE,
-                    datetime.utcnow().isoformat(),
-                    expires_at.isoformat(),
-                    config_id,
-                    order_id,
-                ),
-            )
         self.bot.send_message(chat_id, f"Order #{order_id} approved.")
         # Notify user
         config_text = build_config_link(server["base_url"], inbound_details, client_entry)
@@ -776,36 +1012,84 @@ class BotApp:
         if not order:
             self.bot.send_message(chat_id, "Order not found.")
             return
-        with database.transaction(self.conn) as cur:
-            cur.execute("UPDATE orders SET status = ? WHERE id = ?", (STATUS_REJECTED, order_id))
+        if not self._set_order_status(order_id, STATUS_PENDING_REVIEW, STATUS_REJECTED):
+            self.bot.send_message(chat_id, "Order is not waiting for approval.")
+            return
         self.bot.send_message(chat_id, f"Order #{order_id} rejected.")
         try:
             self.bot.send_message(int(order["telegram_id"]), "Your payment receipt was rejected.")
         except TelegramAPIError as exc:
             LOGGER.warning("failed to notify about rejection: %s", exc)
 
+    def _remove_panel_client(self, client: XUIClient, inbound_id: int, config_id: str, order_id: int) -> None:
+        """Remove the panel client created for an approval that did not complete."""
+        try:
+            client.remove_client(inbound_id, config_id)
+        except XUIError as exc:
+            LOGGER.warning("failed to remove panel client for order %s: %s", order_id, exc)
+
+    def _set_order_status(self, order_id: int, expected: str, status: str) -> bool:
+        """Move an order from ``expected`` to ``status``; False if it was not in ``expected``."""
+        with database.transaction(self.conn) as cur:
+            cur.execute(
+                "UPDATE orders SET status = ? WHERE id = ? AND status = ?",
+                (status, order_id, expected),
+            )
+            return cur.rowcount == 1
+
     # ------------------------------------------------------------------
-    def _show_plans_for_purchase(self, chat_id: int) -> None:
+    def _cached(self, key: str, load):
+        """Return ``load()`` for ``key``, reusing it for ``MENU_CACHE_TTL`` seconds."""
+        with self._menu_cache_lock:
+            entry = self._menu_cache.get(key)
+            generation = self._menu_generation
+        if entry is not None and time.monotonic() < entry[0]:
+            return entry[1]
+        value = load()
+        with self._menu_cache_lock:
+            if self._menu_generation == generation:
+                self._menu_cache[key] = (time.monotonic() + MENU_CACHE_TTL, value)
+        return value
+
+    def _invalidate_menus(self) -> None:
+        """Drop cached menus after plans, servers or the bank card changed."""
+        with self._menu_cache_lock:
+            self._menu_generation += 1
+            self._menu_cache.clear()
+
+    def _load_purchase_plans(self) -> Tuple[str, Dict[str, Any]]:
         with database.transaction(self.conn) as cur:
             cur.execute("SELECT id, name, price, duration_days, volume_gb FROM plans ORDER BY id")
             plans = database.fetch_all(cur)
-        if not plans:
-            self.bot.send_message(chat_id, "No plans available right now.")
-            return
-        lines = []
-        keyboard = {"inline_keyboard": []}
-        for plan in plans:
-            lines.append(
-                f"#{plan['id']} - {plan['name']}: {plan['volume_gb']}GB / {plan['duration_days']} days - ${plan['price']}"
-            )
-            keyboard["inline_keyboard"].append(
-                [{"text": f"Buy #{plan['id']}", "callback_data": f"user:buy:{plan['id']}"}]
-            )
+        text = "\n".join(
+            f"#{plan['id']} - {plan['name']}: {plan['volume_gb']}GB / {plan['duration_days']} days - ${plan['price']}"
+            for plan in plans
+        )
+        keyboard = {
+            "inline_keyboard": [
+                [{"text": f"Buy #{plan['id']}", "callback_data": f"user:buy:{plan['id']}"}] for plan in plans
+            ]
+        }
+        return text, keyboard
+
+    def _load_bank_card(self) -> Optional[str]:
         with database.transaction(self.conn) as cur:
             cur.execute("SELECT value FROM settings WHERE key = 'bank_card'")
             card_row = database.fetch_one(cur)
-        card_text = f"\nPay to card: {card_row['value']}" if card_row else ""
-        self.bot.send_message(chat_id, "\n".join(lines) + card_text, reply_markup=keyboard)
+        return card_row["value"] if card_row else None
+
+    def _bank_card(self) -> Optional[str]:
+        return self._cached("bank_card", self._load_bank_card)
+
+    def _show_plans_for_purchase(self, chat_id: int) -> None:
+        # The keyboard is shared between users and must not be modified
+        text, keyboard = self._cached("plans", self._load_purchase_plans)
+        if not text:
+            self.bot.send_message(chat_id, "No plans available right now.")
+            return
+        card = self._bank_card()
+        card_text = f"\nPay to card: {card}" if card else ""
+        self.bot.send_message(chat_id, text + card_text, reply_markup=keyboard)
 
     # ------------------------------------------------------------------
     def _start_purchase(self, chat_id: int, plan_id: int) -> None:
@@ -816,12 +1100,12 @@ class BotApp:
         user = self._get_user_by_chat(chat_id)
         if not user:
             return
-        with database.transaction(self.conn) as cur:
-            cur.execute(
-                "INSERT INTO orders (user_id, plan_id, status) VALUES (?, ?, ?)",
-                (user["id"], plan_id, STATUS_WAITING_RECEIPT),
-            )
-            order_id = cur.lastrowid
+        # A lone INSERT commits by itself on the autocommit connection, so
+        # it needs no BEGIN/COMMIT pair around it
+        order_id = self.conn.execute(
+            "INSERT INTO orders (user_id, plan_id, status) VALUES (?, ?, ?)",
+            (user["id"], plan_id, STATUS_WAITING_RECEIPT),
+        ).lastrowid
         self.states[chat_id] = {"handler": self._handle_receipt_upload, "order_id": order_id}
         self.bot.send_message(chat_id, f"Send payment receipt photo for order #{order_id}.")
 
@@ -853,24 +1137,11 @@ class BotApp:
                 " FROM orders LEFT JOIN plans ON orders.plan_id = plans.id WHERE orders.user_id = ? ORDER BY orders.id DESC",
                 (user["id"],),
             )
-            rows = database.fetch_all(cur)
-        if not rows:
+            text = "\n\n".join(_order_summary(row) for row in database.iter_rows(cur))
+        if not text:
             self.bot.send_message(chat_id, "You have no orders yet.")
             return
-        lines = []
-        for row in rows:
-            expires = row.get("expires_at") or "-"
-            # Use plan name if available, otherwise show as custom plan
-            plan_name = row.get("name")
-            if not plan_name:
-                # For custom plans, add volume and duration info
-                volume = row.get('volume_gb') or 0
-                days = row.get('duration_days') or 0
-                plan_name = f"Custom Plan ({volume}GB, {days} days)"
-            lines.append(
-                f"Order #{row['id']} - {plan_name}\nStatus: {row['status']}\nExpires: {expires}\nUsed: {row['traffic_used']} GB"
-            )
-        self.bot.send_message(chat_id, "\n\n".join(lines))
+        self.bot.send_message(chat_id, text)
 
     # ------------------------------------------------------------------
     # Custom Plan Builder
@@ -1111,11 +1382,8 @@ class BotApp:
         self.states[chat_id] = {"handler": self._handle_receipt_upload, "order_id": order_id}
         
         # Get bank card info
-        with database.transaction(self.conn) as cur:
-            cur.execute("SELECT value FROM settings WHERE key = 'bank_card'")
-            card_row = database.fetch_one(cur)
-        
-        card_text = i18n.get_text("user.pay_to_card", lang=lang, card=card_row["value"]) if card_row else ""
+        card = self._bank_card()
+        card_text = i18n.get_text("user.pay_to_card", lang=lang, card=card) if card else ""
         
         text = i18n.get_text(
             "user.custom_plan_created",
@@ -1135,6 +1403,31 @@ class BotApp:
             )
             return database.fetch_one(cur)
 
+    def _get_order_bundle(self, order_id: int) -> Optional[Dict]:
+        """Load an order with its user, plan, server and fallback inbound.
+
+        Plan columns are ``plan_*`` and ``None`` for custom orders; the
+        server is the plan's for prebuilt orders and the order's own
+        otherwise.
+        """
+        with database.transaction(self.conn) as cur:
+            cur.execute(
+                "SELECT orders.*, users.telegram_id, plans.id AS plan_row_id, plans.name AS plan_name, "
+                "plans.inbound_id AS plan_inbound_id, plans.duration_days AS plan_duration_days, "
+                "plans.volume_gb AS plan_volume_gb, plans.multi_user AS plan_multi_user, "
+                "servers.id AS server_row_id, servers.base_url AS server_base_url, "
+                "servers.username AS server_username, servers.password AS server_password, "
+                "(SELECT inbound_id FROM inbounds WHERE inbounds.server_id = orders.server_id LIMIT 1)"
+                " AS server_inbound_id "
+                "FROM orders JOIN users ON orders.user_id = users.id "
+                "LEFT JOIN plans ON orders.plan_id = plans.id "
+                "LEFT JOIN servers ON servers.id = "
+                "CASE WHEN orders.plan_id IS NOT NULL THEN plans.server_id ELSE orders.server_id END "
+                "WHERE orders.id = ?",
+                (order_id,),
+            )
+            return database.fetch_one(cur)
+
     def _get_plan(self, plan_id: int) -> Optional[Dict]:
         with database.transaction(self.conn) as cur:
             cur.execute("SELECT * FROM plans WHERE id = ?", (plan_id,))
@@ -1149,38 +1442,64 @@ class BotApp:
     # Helpers for background worker
     # ------------------------------------------------------------------
     def fetch_expired_orders(self) -> list:
+        """Return expired active orders with what is needed to remove them.
+
+        Custom orders have no plan; like approval, they fall back to the
+        first inbound of the order's own server.
+        """
         with database.transaction(self.conn) as cur:
             cur.execute(
-                "SELECT id FROM orders WHERE status = ? AND expires_at IS NOT NULL AND expires_at <= ?",
-                (STATUS_ACTIVE, datetime.utcnow().isoformat()),
+                "SELECT orders.id, orders.config_id, users.telegram_id, "
+                "COALESCE(plans.inbound_id, "
+                "(SELECT inbound_id FROM inbounds WHERE inbounds.server_id = orders.server_id LIMIT 1))"
+                " AS inbound_id, "
+                "CASE WHEN orders.plan_id IS NOT NULL THEN plans.server_id ELSE orders.server_id END"
+                " AS server_id "
+                "FROM orders LEFT JOIN users ON orders.user_id = users.id "
+                "LEFT JOIN plans ON orders.plan_id = plans.id "
+                "WHERE orders.status = ? AND orders.expires_at IS NOT NULL AND orders.expires_at <= ? "
+                "ORDER BY orders.expires_at LIMIT ?",
+                (STATUS_ACTIVE, datetime.utcnow().isoformat(), EXPIRED_BATCH_SIZE),
             )
             return database.fetch_all(cur)
 
-    def mark_expired(self, order_id: int) -> None:
+    def mark_expired(self, order_ids: List[int]) -> None:
+        if not order_ids:
+            return
+        placeholders = ", ".join("?" for _ in order_ids)
         with database.transaction(self.conn) as cur:
             cur.execute(
-                "UPDATE orders SET status = ?, config_id = NULL WHERE id = ?",
-                (STATUS_EXPIRED, order_id),
+                f"UPDATE orders SET status = ?, config_id = NULL WHERE id IN ({placeholders})",
+                (STATUS_EXPIRED, *order_ids),
             )
 
-    def get_order_details(self, order_id: int) -> Dict:
-        with database.transaction(self.conn) as cur:
-            cur.execute(
-                "SELECT orders.id, orders.config_id, users.telegram_id, plans.inbound_id, plans.server_id"
-                " FROM orders JOIN users ON orders.user_id = users.id"
-                " JOIN plans ON orders.plan_id = plans.id WHERE orders.id = ?",
-                (order_id,),
-            )
-            row = database.fetch_one(cur)
-            return row or {}
+    def run_maintenance(self) -> None:
+        database.run_maintenance(self.conn)
 
     def make_client(self, server_id: int) -> XUIClient:
         server = self._get_server(server_id)
         if not server:
             raise RuntimeError("server not found")
-        return XUIClient(
-            server["base_url"],
-            server["username"],
-            server["password"],
-            verify_ssl=self.settings.xui_verify_ssl,
-        )
+        return self._client_for(server_id, server)
+
+    def _client_for(self, server_id: int, server: Dict) -> XUIClient:
+        """Return the cached panel client for ``server_id``, creating it from ``server``."""
+        key = (server_id, server["base_url"], server["username"], server["password"])
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                # Any older entry was built from credentials since edited
+                self._drop_clients(server_id)
+                client = self._clients[key] = XUIClient(
+                    server["base_url"],
+                    server["username"],
+                    server["password"],
+                    verify_ssl=self.settings.xui_verify_ssl,
+                    stop_event=self.stop_event,
+                )
+            return client
+
+    def _drop_clients(self, server_id: int) -> None:
+        """Forget the panel clients of ``server_id``; call with ``_clients_lock`` held."""
+        for key in [key for key in self._clients if key[0] == server_id]:
+            del self._clients[key]
@@ -6,22 +6,69 @@ from __future__ import annotations
 
 import json
 import logging
+import math
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 LOGGER = logging.getLogger(__name__)
 
 # Cache for loaded translations
 _TRANSLATIONS: Dict[str, Dict[str, Any]] = {}
 
+# Dotted-key index built from ``_TRANSLATIONS``, e.g.
+# ``("en", "admin.add_server") -> "Add Server"``. Section keys map to their
+# nested dictionaries so lookups behave exactly like walking the tree.
+_FLAT: Dict[Tuple[str, str], Any] = {}
+
 # Supported languages
 SUPPORTED_LANGUAGES = ["en", "fa"]
 DEFAULT_LANGUAGE = "fa"
 
 
+def _flatten(lang: str, tree: Dict[str, Any], prefix: str = "") -> None:
+    """Index every node of ``tree`` in ``_FLAT`` under its dotted key."""
+    for name, value in tree.items():
+        key = f"{prefix}{name}"
+        _FLAT[(lang, key)] = value
+        if isinstance(value, dict):
+            _flatten(lang, value, f"{key}.")
+
+
+# Argument types that are cached by value. Anything else (including objects
+# that hash by identity and may format differently once mutated) is
+# formatted on every call.
+_CACHEABLE_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+@lru_cache(maxsize=1024)
+def _format_cached(template: str, params: Tuple[Tuple[str, str, float, Any], ...]) -> str:
+    """Format ``template`` once per distinct set of parameters.
+
+    Menus re-render the same strings with the same arguments (role names,
+    counts, prices) on every update, so repeat calls become a cache hit.
+    Value type names are part of the key because ``1``, ``1.0`` and
+    ``True`` compare equal but format differently, and the sign of floats
+    is part of it because ``0.0`` and ``-0.0`` do too.
+    """
+    return template.format_map({name: value for name, _, _, value in params})
+
+
+def _format(template: str, params: Dict[str, Any]) -> str:
+    """Format ``template`` with ``params``, caching when all are plain values."""
+    if any(type(value) not in _CACHEABLE_TYPES for value in params.values()):
+        return template.format_map(params)
+    key = tuple(sorted(
+        (name, type(value).__name__, math.copysign(1.0, value) if type(value) is float else 1.0, value)
+        for name, value in params.items()
+    ))
+    return _format_cached(template, key)
+
+
 def load_translations() -> None:
     """Load all translation files into memory."""
     translations_dir = Path(__file__).parent.parent / "translations"
+    _FLAT.clear()
     
     for lang in SUPPORTED_LANGUAGES:
         file_path = translations_dir / f"{lang}.json"
@@ -35,6 +82,7 @@ def load_translations() -> None:
         except json.JSONDecodeError as exc:
             LOGGER.error("failed to parse translation file %s: %s", file_path, exc)
             _TRANSLATIONS[lang] = {}
+        _flatten(lang, _TRANSLATIONS[lang])
 
 
 def get_text(key: str, lang: str = DEFAULT_LANGUAGE, **kwargs) -> str:
@@ -61,17 +109,7 @@ def get_text(key: str, lang: str = DEFAULT_LANGUAGE, **kwargs) -> str:
     if lang not in _TRANSLATIONS:
         lang = DEFAULT_LANGUAGE
     
-    translations = _TRANSLATIONS.get(lang, {})
-    
-    # Navigate nested keys
-    parts = key.split(".")
-    value = translations
-    for part in parts:
-        if isinstance(value, dict):
-            value = value.get(part)
-        else:
-            value = None
-            break
+    value = _FLAT.get((lang, key))
     
     # If not found, try English as fallback
     if value is None and lang != "en":
@@ -85,7 +123,7 @@ def get_text(key: str, lang: str = DEFAULT_LANGUAGE, **kwargs) -> str:
     # Format the string with provided kwargs
     if isinstance(value, str) and kwargs:
         try:
-            return value.format(**kwargs)
+            return _format(value, kwargs)
         except KeyError as exc:
             LOGGER.warning("missing format parameter %s for key %s", exc, key)
             return value
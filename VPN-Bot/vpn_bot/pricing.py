@@ -5,13 +5,37 @@ This module handles both prebuilt package pricing and dynamic per-GB pricing.
 from __future__ import annotations
 
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 LOGGER = logging.getLogger(__name__)
 
 # Pricing constraints
 MAX_VOLUME_GB = 1000
 
+PriceFunction = Callable[[int, int, int], Tuple[float, Dict[str, float]]]
+
+# Compiled per-GB price functions keyed by the pricing values they use.
+# Keying by value rather than by row id keeps edited rows correct even when
+# updated_at is not touched.
+_PRICE_FN_CACHE: Dict[Tuple, PriceFunction] = {}
+_PRICE_FN_CACHE_SIZE = 64
+
+# Breakdown lines per language as (breakdown key, template) pairs
+_BREAKDOWN_TEMPLATES = {
+    "fa": (
+        ("base_volume", "قیمت پایه: {base_volume:.2f}"),
+        ("extra_months", "ماه‌های اضافی: {extra_months:.2f}"),
+        ("extra_users", "کاربران اضافی: {extra_users:.2f}"),
+        ("total", "━━━━━━━━━━━━\nجمع کل: {total:.2f}"),
+    ),
+    "en": (
+        ("base_volume", "Base volume: ${base_volume:.2f}"),
+        ("extra_months", "Extra months: ${extra_months:.2f}"),
+        ("extra_users", "Extra users: ${extra_users:.2f}"),
+        ("total", "━━━━━━━━━━━━\nTotal: ${total:.2f}"),
+    ),
+}
+
 
 def calculate_prebuilt_price(plan: Dict) -> float:
     """Calculate price for a prebuilt package.
@@ -53,48 +77,109 @@ def calculate_pergb_price(
     tuple
         (total_price, breakdown_dict)
     """
-    breakdown = {}
+    return compile_pergb_price(pricing)(volume_gb, duration_months, num_users)
+
+
+def compile_pergb_price(pricing: Dict) -> PriceFunction:
+    """Build a per-GB price function for one pricing record.
+    
+    The record's values are read and converted once; the returned function
+    only does the arithmetic. Functions are cached by those values, so
+    repeated previews for the same server reuse one function.
     
-    # Base price for first month
-    price_per_gb = float(pricing.get("price_per_gb", 0))
-    base_price = volume_gb * price_per_gb
-    breakdown["base_volume"] = base_price
+    Parameters
+    ----------
+    pricing : dict
+        Server pricing record from database
+        
+    Returns
+    -------
+    callable
+        ``f(volume_gb, duration_months, num_users)`` returning
+        ``(total_price, breakdown_dict)``
+    """
+    get = pricing.get
+    key = (
+        get("price_per_gb", 0),
+        get("extra_month_price_percent"),
+        get("extra_month_price_absolute"),
+        get("additional_user_price", 0),
+    )
+    price = _PRICE_FN_CACHE.get(key)
+    if price is not None:
+        return price
     
-    # Additional months pricing
-    extra_months = max(0, duration_months - 1)
-    extra_month_price = 0
+    price_per_gb, extra_percent, extra_absolute, additional_user_price = key
+    price_per_gb = float(price_per_gb)
+    additional_user_price = float(additional_user_price)
+    # Additional months: percentage takes precedence over absolute pricing,
+    # otherwise each extra month costs the same as the first
+    month_factor = float(extra_percent) / 100 if extra_percent is not None else None
+    month_price = float(extra_absolute) if extra_absolute is not None else None
     
-    if extra_months > 0:
-        # Check if percentage or absolute pricing is configured
-        extra_percent = pricing.get("extra_month_price_percent")
-        extra_absolute = pricing.get("extra_month_price_absolute")
+    def price(volume_gb: int, duration_months: int, num_users: int) -> Tuple[float, Dict[str, float]]:
+        # Base price for first month
+        base_price = volume_gb * price_per_gb
+        breakdown = {"base_volume": base_price}
+        total = base_price
         
-        if extra_percent is not None:
-            # Percentage-based pricing
-            extra_month_price = base_price * (float(extra_percent) / 100) * extra_months
-        elif extra_absolute is not None:
-            # Absolute pricing per extra month
-            extra_month_price = float(extra_absolute) * extra_months
-        else:
-            # Default: proportional pricing (same as first month)
-            extra_month_price = base_price * extra_months
+        extra_months = duration_months - 1
+        if extra_months > 0:
+            if month_factor is not None:
+                per_month = base_price * month_factor
+            elif month_price is not None:
+                per_month = month_price
+            else:
+                per_month = base_price
+            extra_month_price = per_month * extra_months
+            breakdown["extra_months"] = extra_month_price
+            total += extra_month_price
         
-        breakdown["extra_months"] = extra_month_price
-    
-    # Additional users pricing
-    extra_users = max(0, num_users - 1)
-    extra_users_price = 0
+        extra_users = num_users - 1
+        if extra_users > 0:
+            extra_users_price = additional_user_price * extra_users
+            breakdown["extra_users"] = extra_users_price
+            total += extra_users_price
+        
+        breakdown["total"] = total
+        return total, breakdown
     
-    if extra_users > 0:
-        additional_user_price = float(pricing.get("additional_user_price", 0))
-        extra_users_price = additional_user_price * extra_users
-        breakdown["extra_users"] = extra_users_price
+    if len(_PRICE_FN_CACHE) >= _PRICE_FN_CACHE_SIZE:
+        _PRICE_FN_CACHE.clear()
+    _PRICE_FN_CACHE[key] = price
+    return price
+
+
+def calculate_pergb_price_batch(
+    volumes: Sequence[int],
+    durations: Sequence[int],
+    users: Sequence[int],
+    pricing: Dict
+) -> List[float]:
+    """Calculate per-GB totals for many selections at once.
     
-    # Total
-    total = base_price + extra_month_price + extra_users_price
-    breakdown["total"] = total
+    Equivalent to calling :func:`calculate_pergb_price` for each
+    ``(volume, duration, users)`` triple and keeping only the total; the
+    pricing record is compiled once with :func:`compile_pergb_price`.
     
-    return total, breakdown
+    Parameters
+    ----------
+    volumes : sequence of int
+        Volumes in gigabytes
+    durations : sequence of int
+        Durations in months
+    users : sequence of int
+        Numbers of concurrent users
+    pricing : dict
+        Server pricing record from database
+        
+    Returns
+    -------
+    list of float
+        Total price for each selection, in input order
+    """
+    price = compile_pergb_price(pricing)
+    return [price(v, d, u)[0] for v, d, u in zip(volumes, durations, users)]
 
 
 def format_price_breakdown(breakdown: Dict[str, float], lang: str = "en") -> str:
@@ -112,30 +197,10 @@ def format_price_breakdown(breakdown: Dict[str, float], lang: str = "en") -> str
     str
         Formatted breakdown text
     """
-    lines = []
-    
-    if lang == "fa":
-        if "base_volume" in breakdown:
-            lines.append(f"قیمت پایه: {breakdown['base_volume']:.2f}")
-        if "extra_months" in breakdown:
-            lines.append(f"ماه‌های اضافی: {breakdown['extra_months']:.2f}")
-        if "extra_users" in breakdown:
-            lines.append(f"کاربران اضافی: {breakdown['extra_users']:.2f}")
-        if "total" in breakdown:
-            lines.append(f"━━━━━━━━━━━━")
-            lines.append(f"جمع کل: {breakdown['total']:.2f}")
-    else:
-        if "base_volume" in breakdown:
-            lines.append(f"Base volume: ${breakdown['base_volume']:.2f}")
-        if "extra_months" in breakdown:
-            lines.append(f"Extra months: ${breakdown['extra_months']:.2f}")
-        if "extra_users" in breakdown:
-            lines.append(f"Extra users: ${breakdown['extra_users']:.2f}")
-        if "total" in breakdown:
-            lines.append(f"━━━━━━━━━━━━")
-            lines.append(f"Total: ${breakdown['total']:.2f}")
-    
-    return "\n".join(lines)
+    templates = _BREAKDOWN_TEMPLATES["fa" if lang == "fa" else "en"]
+    return "\n".join(
+        template.format_map(breakdown) for key, template in templates if key in breakdown
+    )
 
 
 def validate_pricing_constraints(
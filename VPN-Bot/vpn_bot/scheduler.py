@@ -4,14 +4,22 @@ from __future__ import annotations
 import logging
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional
 
 from .telegram import TelegramAPIError, TelegramBot
-from .xui_api import XUIClient, XUIError
+from .xui_api import XUIClient
 
 LOGGER = logging.getLogger(__name__)
 
+# Upper bound on concurrent panel calls during one sweep, so a large batch of
+# expirations does not flood the panel with simultaneous requests.
+MAX_PARALLEL_REMOVALS = 8
+
+# Seconds between database maintenance runs
+MAINTENANCE_INTERVAL = 3600.0
+
 
 class ExpirationWorker(threading.Thread):
     """Simple polling worker that removes expired VPN accounts."""
@@ -21,49 +29,113 @@ class ExpirationWorker(threading.Thread):
         *,
         interval: float,
         fetch_expired: Callable[[], list],
-        mark_expired: Callable[[int], None],
-        get_order_details: Callable[[int], dict],
+        mark_expired: Callable[[List[int]], None],
         telegram_bot: TelegramBot,
         make_client: Callable[[int], XUIClient],
+        stop_event: Optional[threading.Event] = None,
+        max_parallel_removals: int = MAX_PARALLEL_REMOVALS,
+        maintenance: Optional[Callable[[], None]] = None,
+        maintenance_interval: float = MAINTENANCE_INTERVAL,
     ) -> None:
         super().__init__(daemon=True)
         self.interval = interval
         self.fetch_expired = fetch_expired
         self.mark_expired = mark_expired
-        self.get_order_details = get_order_details
         self.telegram_bot = telegram_bot
         self.make_client = make_client
-        self._stop = threading.Event()
+        self.max_parallel_removals = max(1, max_parallel_removals)
+        self.maintenance = maintenance
+        self.maintenance_interval = maintenance_interval
+        self._next_maintenance = time.monotonic() + maintenance_interval
+        # Sharing the bot's stop event lets a single ``set()`` shut down both
+        # the polling loop and this worker.
+        self._stop_event = stop_event or threading.Event()
 
     def stop(self) -> None:
-        self._stop.set()
+        self._stop_event.set()
 
     def run(self) -> None:  # pragma: no cover - background thread
         LOGGER.info("expiration worker started")
-        while not self._stop.is_set():
+        # Ticks start every ``interval`` seconds however long each one takes
+        started_at = time.monotonic()
+        while not self._stop_event.is_set():
             try:
                 self._tick()
             except Exception as exc:
                 LOGGER.exception("expiration worker tick failed: %s", exc)
-            self._stop.wait(self.interval)
+            self._maybe_run_maintenance()
+            started_at = self._next_start(started_at)
+            self._stop_event.wait(max(0.0, started_at - time.monotonic()))
         LOGGER.info("expiration worker stopped")
 
+    def _next_start(self, started_at: float) -> float:
+        """Return when the tick after one started at ``started_at`` should start.
+
+        A tick that overran its slot is followed at once, and the schedule
+        restarts from then instead of trying to catch up on missed slots.
+        """
+        next_start = started_at + self.interval
+        now = time.monotonic()
+        if next_start < now:
+            LOGGER.warning("expiration sweep overran its %.0fs interval by %.1fs", self.interval, now - next_start)
+            return now
+        return next_start
+
     def _tick(self) -> None:
+        # Each row already carries the config, inbound, server and chat id,
+        # so the sweep needs one query and one update however many expired.
         expired_orders = self.fetch_expired()
         if not expired_orders:
             return
         LOGGER.info("found %s expired orders", len(expired_orders))
+        try:
+            self._remove_configs(expired_orders)
+        finally:
+            # Orders are expired even when removing their configs failed, so a
+            # bad order cannot make the whole batch come back on every tick
+            self.mark_expired([order["id"] for order in expired_orders])
+            # Notify only once the orders are committed as expired
+            for order in expired_orders:
+                self._notify(order)
+
+    def _remove_configs(self, expired_orders: List[dict]) -> None:
+        clients: Dict[int, XUIClient] = {}
+        removals: Dict[int, tuple] = {}
         for order in expired_orders:
-            order_id = order["id"]
-            details = self.get_order_details(order_id)
             try:
-                if details.get("config_id") and details.get("inbound_id"):
-                    client = self.make_client(details["server_id"])
-                    client.remove_client(details["inbound_id"], details["config_id"])
-            except (XUIError, KeyError) as exc:
-                LOGGER.warning("failed to remove config for order %s: %s", order_id, exc)
-            self.mark_expired(order_id)
-            self._notify(details)
+                if order.get("config_id") and order.get("inbound_id"):
+                    server_id = order["server_id"]
+                    client = clients.get(server_id)
+                    if client is None:
+                        client = clients[server_id] = self.make_client(server_id)
+                    removals[order["id"]] = (client, order["inbound_id"], order["config_id"])
+            except Exception as exc:
+                LOGGER.warning("failed to remove config for order %s: %s", order["id"], exc)
+
+        # Only the panel calls, which dominate the sweep, run concurrently
+        if removals:
+            with ThreadPoolExecutor(
+                max_workers=min(self.max_parallel_removals, len(removals)),
+                thread_name_prefix="expire-removal",
+            ) as pool:
+                futures: Dict[int, Future] = {
+                    order_id: pool.submit(client.remove_client, inbound_id, config_id)
+                    for order_id, (client, inbound_id, config_id) in removals.items()
+                }
+                for order_id, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as exc:
+                        LOGGER.warning("failed to remove config for order %s: %s", order_id, exc)
+
+    def _maybe_run_maintenance(self) -> None:
+        if self.maintenance is None or time.monotonic() < self._next_maintenance:
+            return
+        self._next_maintenance = time.monotonic() + self.maintenance_interval
+        try:
+            self.maintenance()
+        except Exception as exc:
+            LOGGER.warning("database maintenance failed: %s", exc)
 
     def _notify(self, details: dict) -> None:
         user_id = details.get("telegram_id")
@@ -5,6 +5,7 @@ and secure file handling.
 """
 from __future__ import annotations
 
+import hmac
 import logging
 import os
 import re
@@ -18,13 +19,24 @@ LOGGER = logging.getLogger(__name__)
 MAX_STRING_LENGTH = 500
 MAX_NUMERIC_VALUE = 1000000
 MAX_FILENAME_LENGTH = 100
-ALLOWED_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+ALLOWED_IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
 MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024  # 5MB default
 
+# Validation patterns, compiled once at import time
+_USERNAME_RE = re.compile(r'^[a-zA-Z0-9_]{5,32}$')
+_URL_RE = re.compile(r'^https?://[^\s/$.?#].[^\s]*$', re.IGNORECASE)
+_FILENAME_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9._-]+')
+
+# str.translate table deleting C0 control characters except tab, LF and CR
+_CONTROL_CHARS = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
 
 def sanitize_string(value: str, max_length: int = MAX_STRING_LENGTH) -> str:
     """Sanitize user input by removing potentially dangerous characters.
     
+    Null bytes and other control characters (except tab and newlines) are
+    removed, then surrounding whitespace is stripped.
+    
     Parameters
     ----------
     value : str
@@ -40,16 +52,8 @@ def sanitize_string(value: str, max_length: int = MAX_STRING_LENGTH) -> str:
     if not isinstance(value, str):
         return ""
     
-    # Trim to max length
-    value = value[:max_length]
-    
-    # Remove any null bytes
-    value = value.replace("\x00", "")
-    
-    # Strip leading/trailing whitespace
-    value = value.strip()
-    
-    return value
+    # Trim first so oversized input costs no more than max_length to clean
+    return value[:max_length].translate(_CONTROL_CHARS).strip()
 
 
 def validate_numeric(value: str, min_value: int = 0, max_value: int = MAX_NUMERIC_VALUE) -> Tuple[bool, Optional[int]]:
@@ -124,8 +128,7 @@ def validate_username(username: str) -> bool:
     username = username.lstrip("@")
     
     # Telegram usernames: 5-32 chars, alphanumeric + underscore
-    pattern = r'^[a-zA-Z0-9_]{5,32}$'
-    return bool(re.match(pattern, username))
+    return bool(_USERNAME_RE.match(username))
 
 
 def validate_url(url: str) -> bool:
@@ -145,8 +148,7 @@ def validate_url(url: str) -> bool:
         return False
     
     # Basic URL validation
-    pattern = r'^https?://[^\s/$.?#].[^\s]*$'
-    return bool(re.match(pattern, url, re.IGNORECASE))
+    return bool(_URL_RE.match(url))
 
 
 def validate_file_extension(filename: str) -> bool:
@@ -165,7 +167,7 @@ def validate_file_extension(filename: str) -> bool:
     if not filename:
         return False
     
-    ext = Path(filename).suffix.lower()
+    ext = os.path.splitext(filename)[1].lower()
     return ext in ALLOWED_IMAGE_EXTENSIONS
 
 
@@ -187,45 +189,33 @@ def check_rate_limit(conn, user_id: int, limit_per_minute: int = 20) -> bool:
         True if within limit, False if exceeded
     """
     try:
+        now = datetime.utcnow()
+        now_str = now.isoformat()
         cursor = conn.cursor()
+        # Count the request and start a new window if the old one ran out,
+        # all in one statement. A user already at the limit matches no row,
+        # so nothing is written for rejected requests.
         cursor.execute(
-            "SELECT rate_limit_count, rate_limit_reset FROM users WHERE id = ?",
-            (user_id,)
+            "UPDATE users SET "
+            "rate_limit_count = CASE WHEN rate_limit_reset IS NULL OR rate_limit_reset <= ? "
+            "THEN 1 ELSE rate_limit_count + 1 END, "
+            "rate_limit_reset = CASE WHEN rate_limit_reset IS NULL OR rate_limit_reset <= ? "
+            "THEN ? ELSE rate_limit_reset END "
+            "WHERE id = ? AND (rate_limit_reset IS NULL OR rate_limit_reset <= ? OR rate_limit_count < ?)",
+            (now_str, now_str, (now + timedelta(minutes=1)).isoformat(), user_id, now_str, limit_per_minute)
         )
-        row = cursor.fetchone()
-        
-        if not row:
+        if cursor.rowcount:
+            conn.commit()
             return True
         
-        count = row[0] or 0
-        reset_time_str = row[1]
-        
-        now = datetime.utcnow()
-        
-        # Check if we need to reset the counter
-        if reset_time_str:
-            reset_time = datetime.fromisoformat(reset_time_str)
-            if now >= reset_time:
-                # Reset counter
-                count = 0
-                reset_time = now + timedelta(minutes=1)
-        else:
-            reset_time = now + timedelta(minutes=1)
-        
-        # Check limit
-        if count >= limit_per_minute:
-            LOGGER.warning("rate limit exceeded for user %s", user_id)
-            log_security_event(conn, user_id, "rate_limit_exceeded", f"Exceeded {limit_per_minute} requests/min")
-            return False
-        
-        # Increment counter
-        cursor.execute(
-            "UPDATE users SET rate_limit_count = ?, rate_limit_reset = ? WHERE id = ?",
-            (count + 1, reset_time.isoformat(), user_id)
-        )
-        conn.commit()
+        # No row updated: either the user is unknown or over the limit
+        cursor.execute("SELECT 1 FROM users WHERE id = ?", (user_id,))
+        if cursor.fetchone() is None:
+            return True
         
-        return True
+        LOGGER.warning("rate limit exceeded for user %s", user_id)
+        log_security_event(conn, user_id, "rate_limit_exceeded", f"Exceeded {limit_per_minute} requests/min")
+        return False
         
     except Exception as exc:
         LOGGER.error("failed to check rate limit: %s", exc)
@@ -278,13 +268,12 @@ def secure_filename(filename: str) -> str:
     filename = os.path.basename(filename)
     
     # Keep only alphanumeric, dots, dashes, and underscores
-    filename = re.sub(r'[^a-zA-Z0-9._-]', '', filename)
+    filename = _FILENAME_UNSAFE_RE.sub('', filename)
     
     # Limit length
     if len(filename) > MAX_FILENAME_LENGTH:
-        ext = Path(filename).suffix
-        name = Path(filename).stem[:MAX_FILENAME_LENGTH-len(ext)]
-        filename = name + ext
+        name, ext = os.path.splitext(filename)
+        filename = name[:MAX_FILENAME_LENGTH-len(ext)] + ext
     
     return filename or "unknown"
 
@@ -336,12 +325,5 @@ def validate_admin_pin(provided_pin: str, correct_pin: str) -> bool:
     if not provided_pin or not correct_pin:
         return False
     
-    # Constant-time comparison
-    if len(provided_pin) != len(correct_pin):
-        return False
-    
-    result = 0
-    for a, b in zip(provided_pin, correct_pin):
-        result |= ord(a) ^ ord(b)
-    
-    return result == 0
+    # Constant-time comparison; encode so non-ASCII input is accepted
+    return hmac.compare_digest(provided_pin.encode("utf-8"), correct_pin.encode("utf-8"))
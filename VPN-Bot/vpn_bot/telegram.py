@@ -1,13 +1,44 @@
 """Small wrapper around the Telegram Bot API using :mod:`requests`."""
 from __future__ import annotations
 
+import json
 import logging
-from typing import Any, Dict, Iterable, Optional
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    # Optional faster encoder for reply markups and media groups
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
 
 LOGGER = logging.getLogger(__name__)
 
+# ``getUpdates`` long-poll timeout in seconds. Telegram holds the request
+# open until an update arrives or this many seconds pass, so an idle bot
+# makes about one request per LONG_POLL_TIMEOUT instead of one per loop.
+LONG_POLL_TIMEOUT = 25
+# Extra time the HTTP client waits on top of the long-poll timeout.
+# Without it, the read timeout could fire before Telegram answers.
+LONG_POLL_READ_MARGIN = 5
+# Telegram accepts between 2 and this many items per sendMediaGroup call.
+MEDIA_GROUP_LIMIT = 10
+# Timeout for regular API calls, in seconds.
+REQUEST_TIMEOUT = 20
+# Transient statuses worth retrying, for getUpdates (the only GET) alone.
+# Every other call is a POST that may already have been acted on, so the
+# adapter retries it only when the connection could not be opened; a 429
+# on a POST is handled by _request from the reply body instead.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset({"GET"})
+# Longest flood-control pause honoured before a single resend, in seconds.
+MAX_RETRY_AFTER = 30
+
 
 class TelegramAPIError(RuntimeError):
     """Error raised when Telegram returns a failure."""
@@ -20,31 +51,75 @@ class TelegramBot:
     needs sending text, sending photos and acknowledging callback queries.
     """
 
-    def __init__(self, token: str) -> None:
+    def __init__(self, token: str, *, stop_event: Optional[threading.Event] = None) -> None:
         self.base_url = f"https://api.telegram.org/bot{token}/"
+        # When set, a flood-control pause is cut short so shutdown is not delayed
+        self._stop_event = stop_event
+        # A single session keeps the TLS connection to api.telegram.org
+        # alive between long polls and outgoing messages.
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": "application/json"})
+        # Retry-After is ignored: it is not capped by urllib3 and would stall
+        # the poll loop for as long as the server asks; the backoff applies
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            respect_retry_after_header=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry))
 
     def _request(self, method: str, *, params: Optional[Dict[str, Any]] = None, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        response = requests.post(self.base_url + method, params=params, data=data, timeout=20)
-        payload = response.json()
+        payload = self._post(method, params, data)
+        retry_after = payload.get("parameters", {}).get("retry_after")
+        if not payload.get("ok") and payload.get("error_code") == 429 and retry_after:
+            # Flood control: Telegram did not process the call, so waiting
+            # the requested time and sending it once more is safe
+            LOGGER.warning("telegram flood control on %s, retrying in %ss", method, retry_after)
+            delay = min(retry_after, MAX_RETRY_AFTER)
+            if self._stop_event is None:
+                time.sleep(delay)
+            elif self._stop_event.wait(delay):
+                # Shutting down: give up instead of resending
+                raise TelegramAPIError(str(payload))
+            payload = self._post(method, params, data)
         if not payload.get("ok"):
             raise TelegramAPIError(str(payload))
         return payload["result"]
 
-    def get_updates(self, *, offset: Optional[int] = None, timeout: int = 25) -> Iterable[Dict[str, Any]]:
+    def _post(self, method: str, params: Optional[Dict[str, Any]], data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        response = self.session.post(self.base_url + method, params=params, data=data, timeout=REQUEST_TIMEOUT)
+        return response.json()
+
+    def get_updates(
+        self,
+        *,
+        offset: Optional[int] = None,
+        timeout: int = LONG_POLL_TIMEOUT,
+        allowed_updates: Optional[List[str]] = None,
+    ) -> Iterable[Dict[str, Any]]:
         params: Dict[str, Any] = {"timeout": timeout}
         if offset is not None:
             params["offset"] = offset
-        response = requests.get(self.base_url + "getUpdates", params=params, timeout=timeout + 5)
+        if allowed_updates is not None:
+            # Telegram remembers the list until the next call that sets it
+            params["allowed_updates"] = json_dumps(allowed_updates)
+        response = self.session.get(
+            self.base_url + "getUpdates",
+            params=params,
+            timeout=timeout + LONG_POLL_READ_MARGIN,
+        )
         data = response.json()
         if not data.get("ok"):
             raise TelegramAPIError(str(data))
         return data.get("result", [])
 
     def send_message(self, chat_id: int, text: str, *, reply_markup: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        params: Dict[str, Any] = {"chat_id": chat_id, "text": text}
+        data: Dict[str, Any] = {"chat_id": chat_id, "text": text}
         if reply_markup is not None:
-            params["reply_markup"] = json_dumps(reply_markup)
-        return self._request("sendMessage", params=params)
+            data["reply_markup"] = json_dumps(reply_markup)
+        return self._request("sendMessage", data=data)
 
     def send_photo(
         self,
@@ -54,23 +129,26 @@ class TelegramBot:
         caption: Optional[str] = None,
         reply_markup: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        params: Dict[str, Any] = {"chat_id": chat_id, "photo": file_id}
+        data: Dict[str, Any] = {"chat_id": chat_id, "photo": file_id}
         if caption:
-            params["caption"] = caption
+            data["caption"] = caption
         if reply_markup is not None:
-            params["reply_markup"] = json_dumps(reply_markup)
-        return self._request("sendPhoto", params=params)
+            data["reply_markup"] = json_dumps(reply_markup)
+        return self._request("sendPhoto", data=data)
+
+    def send_media_group(self, chat_id: int, media: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        data = {"chat_id": chat_id, "media": json_dumps(media)}
+        return self._request("sendMediaGroup", data=data)
 
     def answer_callback_query(self, callback_query_id: str, *, text: Optional[str] = None) -> None:
-        params: Dict[str, Any] = {"callback_query_id": callback_query_id}
+        data: Dict[str, Any] = {"callback_query_id": callback_query_id}
         if text:
-            params["text"] = text
-        self._request("answerCallbackQuery", params=params)
-
-
-def json_dumps(value: Dict[str, Any]) -> str:
-    """A minimal JSON encoder that avoids importing :mod:`json` repeatedly."""
+            data["text"] = text
+        self._request("answerCallbackQuery", data=data)
 
-    import json
 
+def json_dumps(value: Any) -> str:
+    """Encode ``value`` as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
     return json.dumps(value, separators=(",", ":"))
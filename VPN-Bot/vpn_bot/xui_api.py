@@ -14,17 +14,31 @@ different 3x-ui panel versions.
 
 from __future__ import annotations
 
+import copy
 import json
 import logging
+import random
+import threading
 import time
-from typing import Any, Dict, List, Optional
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 from uuid import uuid4
 
 import requests
 import urllib3
-from requests.exceptions import ConnectionError, SSLError
-from urllib3.exceptions import InsecureRequestWarning
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout, SSLError
+from urllib3.exceptions import ConnectTimeoutError, InsecureRequestWarning
+
+try:
+    # Optional faster decoder for large inbound listings; its JSONDecodeError
+    # subclasses json.JSONDecodeError so existing handlers still apply.
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
 
 SUCCESS_STATUSES = {"success", True}
 
@@ -32,7 +46,211 @@ LOGGER = logging.getLogger(__name__)
 
 # Retry configuration
 MAX_RETRIES = 3
-RETRY_BACKOFF = 1.0  # seconds
+RETRY_BACKOFF = 1.0  # seconds, lower bound of each backoff
+RETRY_BACKOFF_CAP = 10.0  # seconds, upper bound of each backoff
+# Total time budget for one call's retries; no new attempt starts after it
+RETRY_DEADLINE_SECONDS = 30.0
+# Timeouts and server errors worth retrying; only for GETs, since the panel
+# may already have applied a POST such as addClient before failing. A POST
+# is resent after a connection error only if it never reached the panel
+RETRY_STATUSES = frozenset({408, 500, 502, 503, 504})
+# Rate limiting means the panel did not act on the call, so it is retried
+# for every method, after at least the panel's Retry-After delay
+RATE_LIMITED_STATUS = 429
+
+# How long a client reuses its last inbound listing (which embeds per-client
+# traffic in ``clientStats``) before asking the panel again
+INBOUNDS_CACHE_TTL = 3.0  # seconds
+# How long a single inbound's details (ports, stream settings, clients) are
+# reused when building configuration links
+INBOUND_DETAILS_TTL = 60.0  # seconds
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Upper bound on concurrent traffic lookups made by get_client_infos
+MAX_PARALLEL_LOOKUPS = 8
+
+# Client id or email -> (inbound, client) for one inbound listing
+_ClientIndex = Dict[Any, Tuple[Dict[str, Any], Dict[str, Any]]]
+
+# Connection pool shared by every client so repeated panel calls (one
+# XUIClient per operation in the handlers) reuse open TCP/TLS connections.
+# Retries are handled by the client itself, hence ``max_retries=0``.
+POOL_SIZE = 32
+_SHARED_ADAPTER = HTTPAdapter(
+    pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, pool_block=False, max_retries=0
+)
+
+# Session cookies are reused across clients for the same panel account so a
+# new XUIClient does not have to log in again. Entries expire before the
+# panel's own session would, and are dropped as soon as the panel rejects them.
+AUTH_CACHE_TTL = 55 * 60  # seconds
+_AUTH_CACHE: Dict[Tuple[str, str, str], Tuple[Dict[str, str], float]] = {}
+_AUTH_CACHE_LOCK = threading.Lock()
+# One lock per panel account, so concurrent logins collapse into one POST
+_LOGIN_LOCKS: Dict[Tuple[str, str, str], threading.Lock] = {}
+
+
+# Per-panel circuit breaker. After BREAKER_FAILURE_THRESHOLD calls in a row
+# fail to reach a panel, further calls fail at once for
+# BREAKER_RECOVERY_SECONDS; then a single probe call decides whether the
+# panel is back. Without it, every operation against a dead panel would sit
+# through the full retry budget on its own.
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RECOVERY_SECONDS = 30.0
+
+
+class _CircuitBreaker:
+    """Consecutive-failure breaker shared by all clients of one panel."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Return whether a call may be sent to the panel now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < BREAKER_RECOVERY_SECONDS:
+                return False
+            # Half-open: let exactly one probe through
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= BREAKER_FAILURE_THRESHOLD:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """End a probe that gave no verdict on the panel, without counting it."""
+        with self._lock:
+            self._probing = False
+
+
+_BREAKERS: Dict[str, _CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+# Monotonic time by which panel calls in the current context must finish;
+# set through with_deadline()
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("xui_deadline", default=None)
+
+
+@contextmanager
+def with_deadline(seconds: float) -> Iterator[None]:
+    """Bound all panel calls made inside the block to ``seconds`` in total.
+
+    Each attempt's timeout is cut to the time left and no retry starts after
+    the deadline. Nested blocks keep the earlier of the two deadlines.
+    """
+
+    deadline = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def clear_auth_cache() -> None:
+    """Forget all cached panel sessions."""
+
+    with _AUTH_CACHE_LOCK:
+        _AUTH_CACHE.clear()
+
+
+def reset_circuit_breakers() -> None:
+    """Close every panel circuit breaker and forget its failures."""
+
+    with _BREAKERS_LOCK:
+        _BREAKERS.clear()
+
+
+def _breaker_for(base_url: str) -> _CircuitBreaker:
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(base_url)
+        if breaker is None:
+            breaker = _BREAKERS[base_url] = _CircuitBreaker()
+        return breaker
+
+
+def _login_lock_for(auth_key: Tuple[str, str, str]) -> threading.Lock:
+    with _AUTH_CACHE_LOCK:
+        lock = _LOGIN_LOCKS.get(auth_key)
+        if lock is None:
+            lock = _LOGIN_LOCKS[auth_key] = threading.Lock()
+        return lock
+
+
+def _dumps(value: Any) -> str:
+    """Encode ``value`` as JSON text, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+def _encode_body(value: Any) -> bytes:
+    """Encode a request body as UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode()
+
+
+def _loads(text: str) -> Any:
+    """Decode JSON text, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _decode_json(response: requests.Response) -> Any:
+    """Decode a response body, preferring orjson when it is installed.
+
+    HTML pages (a login form or a proxy's error page) are rejected from
+    the Content-Type alone instead of being run through the JSON parser.
+    """
+    content_type = response.headers.get("Content-Type")
+    if isinstance(content_type, str) and "html" in content_type.lower():
+        raise json.JSONDecodeError(f"expected JSON, got {content_type}", "", 0)
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _retry_after(response: Any) -> float:
+    """Return the response's Retry-After delay in seconds, or 0 if unusable."""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        # Missing header, or the HTTP-date form, which the panel does not send
+        return 0.0
+
+
+def _never_sent(exc: Exception) -> bool:
+    """Return True if ``exc`` was raised before the request reached the panel.
+
+    Only a failed connect or TLS handshake qualifies; a connection reset
+    or aborted response may come after the body was sent.
+    """
+    if isinstance(exc, (ConnectTimeout, SSLError)):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    # Also covers NewConnectionError (refused, DNS failure), a subclass
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class _TransientStatusError(requests.HTTPError):
+    """A 429 or 5xx reply that is worth retrying after a pause."""
 
 
 class XUIError(RuntimeError):
@@ -43,6 +261,10 @@ class XUIConnectionError(XUIError):
     """Raised when a connection to the panel fails."""
 
 
+class XUIDeadlineError(XUIConnectionError):
+    """Raised when the caller's deadline passes before the panel answered."""
+
+
 class XUIClient:
     """Very small wrapper around the JSON API.
 
@@ -61,6 +283,8 @@ class XUIClient:
         *,
         verify_ssl: bool = False,
         timeout: int = 20,
+        stop_event: Optional[threading.Event] = None,
+        pool_maxsize: Optional[int] = None,
     ) -> None:
         # Store original URL with trailing slash
         self.base_url = base_url.rstrip("/") + "/"
@@ -74,10 +298,35 @@ class XUIClient:
         self.password = password
         self.verify_ssl = verify_ssl
         self.timeout = timeout
+        # When set, retry backoff is cut short so shutdown is not delayed
+        self._stop_event = stop_event
         self.session = requests.Session()
+        # Cookies stay per client; only the underlying connections are shared.
+        # A custom pool size gets its own adapter instead of the shared one.
+        if pool_maxsize is None:
+            adapter = _SHARED_ADAPTER
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         # Set Accept header for better compatibility with different panel versions
         self.session.headers.update({"Accept": "application/json"})
+        # Set only with the account's login lock held
         self._authenticated = False
+        # Bumped whenever the session changes, so a request rejected with an
+        # old session does not throw away the one another thread just made
+        self._session_generation = 0
+        # One client serves every thread of the bot, so the caches below are
+        # read and replaced under this lock (never held across a request)
+        self._cache_lock = threading.Lock()
+        self._inbounds_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        self._inbound_details: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        # Client lookup index, tied to the inbound listing it was built from
+        self._client_index: Optional[Tuple[List[Dict[str, Any]], _ClientIndex]] = None
+        # Password is part of the key so changed credentials never reuse a session
+        self._auth_key = (self._login_url, username, password)
+        self._login_lock = _login_lock_for(self._auth_key)
+        self._breaker = _breaker_for(self.base_url)
         if not verify_ssl:
             urllib3.disable_warnings(InsecureRequestWarning)
 
@@ -102,9 +351,14 @@ class XUIClient:
         return base_url
 
     def _build_url(self, path: str) -> str:
-        """Return an absolute panel URL while preserving nested paths."""
+        """Return an absolute panel URL while preserving nested paths.
+
+        API paths are always relative to the panel base, so plain
+        concatenation is enough; a leading slash is ignored rather than
+        resolving against the host root as ``urljoin`` would.
+        """
 
-        return urljoin(self._api_base_url, path)
+        return self._api_base_url + path.lstrip("/")
 
     @staticmethod
     def _is_ssl_error(exc: Exception) -> bool:
@@ -139,6 +393,68 @@ class XUIClient:
         # Generic connection error
         raise XUIConnectionError(f"{base_msg}: {exc}") from exc
 
+    def _retry_deadline(self) -> float:
+        """Return when retries must stop: the retry budget or the caller's deadline."""
+        deadline = time.monotonic() + RETRY_DEADLINE_SECONDS
+        caller_deadline = _DEADLINE.get()
+        return deadline if caller_deadline is None else min(deadline, caller_deadline)
+
+    def _attempt_timeout(self) -> float:
+        """Return the timeout for one attempt, cut to the caller's deadline."""
+        caller_deadline = _DEADLINE.get()
+        if caller_deadline is None:
+            return self.timeout
+        remaining = caller_deadline - time.monotonic()
+        if remaining <= 0:
+            raise XUIDeadlineError(f"Deadline exceeded before calling panel at {self.base_url}")
+        return min(self.timeout, remaining)
+
+    @staticmethod
+    def _next_backoff(previous: float) -> float:
+        """Return the next retry delay using decorrelated jitter.
+
+        Randomising the delay keeps many clients from reconnecting in lockstep
+        after a panel restart, while still growing roughly exponentially.
+        """
+        return min(RETRY_BACKOFF_CAP, random.uniform(RETRY_BACKOFF, max(RETRY_BACKOFF, previous * 3)))
+
+    def _wait_before_retry(
+        self, what: str, attempt: int, exc: Exception, delay: float, deadline: float
+    ) -> bool:
+        """Log a failed attempt and back off before the next one.
+
+        Retries live here rather than in urllib3's ``Retry`` so that POSTs
+        such as ``addClient`` are resent only when they never reached the
+        panel, and so the SSL hint can be attached to the final attempt.
+
+        Returns:
+            True if another attempt should be made, False if the retries or
+            the time budget are exhausted.
+        """
+        hint = ""
+        if self._is_ssl_error(exc) and attempt == MAX_RETRIES - 1:
+            hint = " Hint: Try changing the server URL from https:// to http://"
+        LOGGER.warning(
+            "%s attempt %d/%d failed: %s%s",
+            what,
+            attempt + 1,
+            MAX_RETRIES,
+            exc,
+            hint,
+        )
+        if attempt >= MAX_RETRIES - 1:
+            return False
+        if time.monotonic() + delay > deadline:
+            LOGGER.warning("giving up on %s retries: %.0fs budget exhausted", what, RETRY_DEADLINE_SECONDS)
+            return False
+        if self._stop_event is None:
+            time.sleep(delay)
+        elif self._stop_event.wait(delay):
+            raise XUIConnectionError(
+                f"Failed to connect to panel at {self.base_url}: shutting down"
+            ) from exc
+        return True
+
     def _try_login_request(self, use_json: bool = True) -> Optional[Dict[str, Any]]:
         """Attempt a single login request.
 
@@ -154,7 +470,7 @@ class XUIClient:
                 response = self.session.post(
                     self._login_url,
                     json=credentials,
-                    timeout=self.timeout,
+                    timeout=self._attempt_timeout(),
                     verify=self.verify_ssl,
                 )
             else:
@@ -162,11 +478,14 @@ class XUIClient:
                 response = self.session.post(
                     self._login_url,
                     data=credentials,
-                    timeout=self.timeout,
+                    timeout=self._attempt_timeout(),
                     verify=self.verify_ssl,
                 )
+            if response.status_code == RATE_LIMITED_STATUS or response.status_code in RETRY_STATUSES:
+                # Logging in again is harmless, so let _login back off and retry
+                raise _TransientStatusError(f"server error {response.status_code}", response=response)
             response.raise_for_status()
-            return response.json()
+            return _decode_json(response)
         except json.JSONDecodeError as exc:
             # Log partial response for debugging but don't fail yet
             response_text = response.text[:200] if response else "No response"
@@ -176,7 +495,7 @@ class XUIClient:
                 response_text,
             )
             return None
-        except (SSLError, ConnectionError):
+        except (SSLError, ConnectionError, _TransientStatusError):
             raise  # Re-raise for retry handling
         except requests.exceptions.RequestException as exc:
             LOGGER.warning("Login request failed: %s", exc)
@@ -207,8 +526,9 @@ class XUIClient:
         # Cookie-agnostic session detection (from AlamorVPN_Bot)
         # If ANY cookie is set, we consider it a successful session
         if self.session.cookies:
-            cookie_names = "; ".join(c.name for c in self.session.cookies)
-            LOGGER.debug("Login successful. Session cookies set: %s", cookie_names)
+            if LOGGER.isEnabledFor(logging.DEBUG):
+                cookie_names = "; ".join(c.name for c in self.session.cookies)
+                LOGGER.debug("Login successful. Session cookies set: %s", cookie_names)
             return True
 
         # Some panels may return success with token in response body instead
@@ -223,20 +543,82 @@ class XUIClient:
         # Still consider it successful if the API said so
         return True
 
+    def _restore_cached_session(self) -> bool:
+        """Load still-valid session cookies from the shared auth cache."""
+        with _AUTH_CACHE_LOCK:
+            entry = _AUTH_CACHE.get(self._auth_key)
+            if entry is None:
+                return False
+            cookies, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del _AUTH_CACHE[self._auth_key]
+                return False
+        self.session.cookies.update(cookies)
+        self._mark_authenticated()
+        LOGGER.debug("Reusing cached panel session for %s", self.base_url)
+        return True
+
+    def _store_session(self) -> None:
+        """Share the current session cookies with other clients."""
+        cookies = self.session.cookies.get_dict()
+        if not cookies:
+            # Token-in-body logins have nothing reusable to cache
+            return
+        with _AUTH_CACHE_LOCK:
+            _AUTH_CACHE[self._auth_key] = (cookies, time.monotonic() + AUTH_CACHE_TTL)
+
+    def _mark_authenticated(self) -> None:
+        """Record that the session now holds a new login; call with the login lock held."""
+        self._authenticated = True
+        self._session_generation += 1
+
+    def _renew_session(self, rejected_generation: int) -> None:
+        """Replace a session the panel rejected, at most once per rejected session.
+
+        Threads whose requests failed with the same session all arrive here;
+        only the first drops it and logs in, and the others reuse the new
+        session. The shared cache entry is dropped only if it still holds the
+        rejected cookies, not a session another client stored since.
+        """
+        with self._login_lock:
+            if self._session_generation == rejected_generation:
+                self._authenticated = False
+                rejected = self.session.cookies.get_dict()
+                with _AUTH_CACHE_LOCK:
+                    entry = _AUTH_CACHE.get(self._auth_key)
+                    if entry is not None and entry[0] == rejected:
+                        del _AUTH_CACHE[self._auth_key]
+            if not self._authenticated and not self._restore_cached_session():
+                self._login_with_retries()
+
     def _login(self) -> None:
         """Authenticate and populate the session cookies.
 
-        Tries both JSON and form data login methods for better compatibility
-        with different 3x-ui panel versions.
+        Reuses a cached session for the same panel account when available.
+        Otherwise tries both JSON and form data login methods for better
+        compatibility with different 3x-ui panel versions.
+
+        Logins for one panel account are serialised; a caller that waited
+        for another thread's login reuses the session it stored.
         """
+        with self._login_lock:
+            if self._authenticated or self._restore_cached_session():
+                return
+            self._login_with_retries()
+
+    def _login_with_retries(self) -> None:
+        """Log in to the panel, retrying connection and transient errors."""
         last_exc: Optional[Exception] = None
+        deadline = self._retry_deadline()
+        delay = 0.0
 
         for attempt in range(MAX_RETRIES):
             try:
                 # Try JSON first (most common)
                 data = self._try_login_request(use_json=True)
                 if self._validate_login_response(data):
-                    self._authenticated = True
+                    self._mark_authenticated()
+                    self._store_session()
                     LOGGER.info("Successfully logged in to panel using JSON")
                     return
 
@@ -244,28 +626,19 @@ class XUIClient:
                 LOGGER.debug("JSON login failed or incomplete, trying form data")
                 data = self._try_login_request(use_json=False)
                 if self._validate_login_response(data):
-                    self._authenticated = True
+                    self._mark_authenticated()
+                    self._store_session()
                     LOGGER.info("Successfully logged in to panel using form data")
                     return
 
                 # Both methods failed
                 raise XUIError(f"Login failed: {data}")
 
-            except (SSLError, ConnectionError) as exc:
+            except (SSLError, ConnectionError, _TransientStatusError) as exc:
                 last_exc = exc
-                hint = ""
-                if self._is_ssl_error(exc) and attempt == MAX_RETRIES - 1:
-                    hint = " Hint: Try changing the server URL from https:// to http://"
-                LOGGER.warning(
-                    "connection attempt %d/%d failed: %s%s",
-                    attempt + 1,
-                    MAX_RETRIES,
-                    exc,
-                    hint,
-                )
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_BACKOFF * (attempt + 1))
-                continue
+                delay = max(self._next_backoff(delay), _retry_after(exc.response))
+                if not self._wait_before_retry("connection", attempt, exc, delay, deadline):
+                    break
 
         # All retries exhausted
         if last_exc is not None:
@@ -277,15 +650,65 @@ class XUIClient:
         path: str,
         *,
         json_body: Optional[Dict[str, Any]] = None,
-        retry: bool = True,
+    ) -> Dict[str, Any]:
+        """Make an authenticated API request, guarded by the panel's breaker.
+
+        Raises:
+            XUIConnectionError: At once, without any HTTP traffic, while the
+                panel's circuit breaker is open.
+        """
+        if not self._breaker.allow():
+            raise XUIConnectionError(
+                f"Panel at {self.base_url} is unavailable; not retrying for up to "
+                f"{BREAKER_RECOVERY_SECONDS:.0f}s"
+            )
+        try:
+            payload = self._send_request(method, path, json_body=json_body)
+        except XUIDeadlineError:
+            # The caller ran out of time; says nothing about the panel, but a
+            # half-open probe must not stay claimed
+            self._breaker.release_probe()
+            raise
+        except XUIConnectionError:
+            self._breaker.record_failure()
+            raise
+        except requests.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
+            raise
+        except requests.RequestException:
+            # Read timeouts and other transport errors that were not retried
+            self._breaker.record_failure()
+            raise
+        except XUIError:
+            # The panel answered, even if the answer was an error
+            self._breaker.record_success()
+            raise
+        except Exception:
+            # Not a verdict on the panel either way
+            self._breaker.release_probe()
+            raise
+        self._breaker.record_success()
+        return payload
+
+    def _send_request(
+        self,
+        method: str,
+        path: str,
+        *,
+        json_body: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """Make an authenticated API request to the panel.
 
+        A rejected session is renewed at most once per call, and the request
+        is then resent within the same retry budget.
+
         Args:
             method: HTTP method (GET, POST, etc.)
             path: API path relative to base URL
             json_body: Optional JSON payload for POST requests
-            retry: Whether to retry on authentication failure
 
         Returns:
             Response data as dictionary
@@ -297,28 +720,35 @@ class XUIClient:
         if not self._authenticated:
             self._login()
         url = self._build_url(path)
+        # Encoded once here rather than by requests on every attempt
+        body = None if json_body is None else _encode_body(json_body)
         last_exc: Optional[Exception] = None
         response: Optional[requests.Response] = None
+        deadline = self._retry_deadline()
+        delay = 0.0
+        reauthenticated = False
 
         for attempt in range(MAX_RETRIES):
             try:
-                response = self.session.request(
-                    method,
-                    url,
-                    json=json_body,
-                    timeout=self.timeout,
-                    verify=self.verify_ssl,
-                )
+                generation = self._session_generation
+                response = self._send(method, url, body)
                 # Handle authentication errors (401 or 403)
                 # Some panels return 403 instead of 401 for session expiry
-                if response.status_code in (401, 403) and retry:
+                if response.status_code in (401, 403) and not reauthenticated:
                     LOGGER.debug(
                         "Session expired (status %d), re-authenticating",
                         response.status_code,
                     )
-                    self._authenticated = False
-                    self._login()
-                    return self._request(method, path, json_body=json_body, retry=False)
+                    self._renew_session(generation)
+                    reauthenticated = True
+                    response = self._send(method, url, body)
+
+                status = response.status_code
+                if status == RATE_LIMITED_STATUS or (status in RETRY_STATUSES and method.upper() == "GET"):
+                    delay = max(self._next_backoff(delay), _retry_after(response))
+                    server_error = _TransientStatusError(f"server error {status}", response=response)
+                    if self._wait_before_retry("request", attempt, server_error, delay, deadline):
+                        continue
 
                 response.raise_for_status()
 
@@ -328,7 +758,7 @@ class XUIClient:
                     return {"success": True}
 
                 try:
-                    payload = response.json()
+                    payload = _decode_json(response)
                 except json.JSONDecodeError as exc:
                     # Log partial response for debugging
                     response_preview = response.text[:200] if response.text else "empty"
@@ -346,19 +776,13 @@ class XUIClient:
 
             except (SSLError, ConnectionError) as exc:
                 last_exc = exc
-                hint = ""
-                if self._is_ssl_error(exc) and attempt == MAX_RETRIES - 1:
-                    hint = " Hint: Try changing the server URL from https:// to http://"
-                LOGGER.warning(
-                    "request attempt %d/%d failed: %s%s",
-                    attempt + 1,
-                    MAX_RETRIES,
-                    exc,
-                    hint,
-                )
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_BACKOFF * (attempt + 1))
-                continue
+                if method.upper() != "GET" and not _never_sent(exc):
+                    # The panel may have applied it; replaying could do it twice
+                    LOGGER.warning("request attempt %d/%d failed: %s", attempt + 1, MAX_RETRIES, exc)
+                    break
+                delay = self._next_backoff(delay)
+                if not self._wait_before_retry("request", attempt, exc, delay, deadline):
+                    break
 
         # All retries exhausted
         if last_exc is not None:
@@ -366,72 +790,250 @@ class XUIClient:
         # Unreachable: _handle_connection_error always raises, but this satisfies type checkers
         raise XUIConnectionError(f"Failed to connect to panel at {self.base_url}")  # pragma: no cover
 
+    def _send(self, method: str, url: str, body: Optional[bytes]) -> requests.Response:
+        """Send one request attempt with the session cookies."""
+        return self.session.request(
+            method,
+            url,
+            data=body,
+            headers=None if body is None else _JSON_HEADERS,
+            timeout=self._attempt_timeout(),
+            verify=self.verify_ssl,
+        )
+
     def create_client(self, inbound_id: int, config: Dict[str, Any]) -> Dict[str, Any]:
         """Create a client on the provided inbound using ``addClient`` endpoint."""
+        client_entry = self._build_client_entry(config)
+        response = self._add_clients(inbound_id, [client_entry])
+        response.setdefault("client", client_entry)
+        return response
+
+    def create_clients(self, inbound_id: int, configs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Create several clients on one inbound with a single ``addClient`` call.
+
+        Args:
+            inbound_id: The inbound to add the clients to
+            configs: One config per client, as accepted by create_client()
+
+        Returns:
+            API response, with the submitted entries under ``clients``
+        """
+        client_entries = [self._build_client_entry(config) for config in configs]
+        response = self._add_clients(inbound_id, client_entries)
+        response.setdefault("clients", client_entries)
+        return response
+
+    @staticmethod
+    def _build_client_entry(config: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the panel's client entry from a loosely keyed config."""
+        get = config.get
         # Extract client ID from various possible config keys
         uid = (
-            config.get("id")
-            or config.get("uuid")
-            or config.get("client_id")
-            or config.get("email")
+            get("id")
+            or get("uuid")
+            or get("client_id")
+            or get("email")
             or str(uuid4())
         )
         uid = str(uid)
-        email = str(config.get("email") or uid)
-        expiry_time = int(config.get("expireTime") or config.get("expiryTime") or 0)
+        email = str(get("email") or uid)
+        expiry_time = int(get("expireTime") or get("expiryTime") or 0)
         if expiry_time and expiry_time < 10**12:
             # API expects milliseconds.
             expiry_time *= 1000
-        total_bytes = int(config.get("totalGB") or config.get("total_bytes") or 0)
-        limit_ip = int(config.get("limitIp") or config.get("concurrent") or 1)
-        client_entry = {
+        total_bytes = int(get("totalGB") or get("total_bytes") or 0)
+        limit_ip = int(get("limitIp") or get("concurrent") or 1)
+        return {
             "id": uid,
-            "flow": config.get("flow", ""),
+            "flow": get("flow", ""),
             "email": email,
             "limitIp": limit_ip,
             "totalGB": total_bytes,
             "expiryTime": expiry_time,
             "enable": True,
-            "tgId": str(config.get("tgId") or ""),
-            "subId": str(config.get("subId") or uid[:10]),
-            "reset": int(config.get("reset") or 0),
+            "tgId": str(get("tgId") or ""),
+            "subId": str(get("subId") or uid[:10]),
+            "reset": int(get("reset") or 0),
         }
+
+    def _add_clients(self, inbound_id: int, client_entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Post client entries to ``addClient`` and keep the caches in step."""
         payload = {
             "id": int(inbound_id),
-            "settings": json.dumps({"clients": [client_entry]}),
+            "settings": _dumps({"clients": client_entries}),
         }
+        self._drop_cached_inbounds()
         response = self._request("POST", "panel/api/inbounds/addClient", json_body=payload)
-        response.setdefault("client", client_entry)
+        self._record_added_clients(int(inbound_id), client_entries)
         return response
 
     def remove_client(self, inbound_id: int, client_id: str) -> Dict[str, Any]:
         """Remove a client identified by ``client_id`` using ``delClient``."""
 
         payload = {"id": int(inbound_id), "clientIds": [client_id]}
+        self._drop_cached_inbounds(inbound_id)
         return self._request("POST", "panel/api/inbounds/delClient", json_body=payload)
 
     def get_client_traffic(self, inbound_id: int, client_id: str) -> Dict[str, Any]:
         """Return the traffic statistics for a client."""
 
-        path = f"panel/api/inbounds/getClientTraffics/{int(inbound_id)}?clientId={client_id}"
+        path = f"panel/api/inbounds/getClientTraffics/{int(inbound_id)}?clientId={quote(str(client_id), safe='')}"
         return self._request("GET", path)
 
     def get_inbound(self, inbound_id: int) -> Dict[str, Any]:
-        """Fetch inbound details used to build configuration links."""
+        """Fetch inbound details used to build configuration links.
 
-        return self._request("GET", f"panel/api/inbounds/get/{int(inbound_id)}")
+        The reply is reused for ``INBOUND_DETAILS_TTL`` seconds. Clients added
+        through this client are recorded in the cached reply, and removing a
+        client drops it, so callers still see their own changes. Each caller
+        gets its own copy; the cached reply is never handed out.
+        """
+        inbound_id = int(inbound_id)
+        with self._cache_lock:
+            cached = self._inbound_details.get(inbound_id)
+        if cached is not None and time.monotonic() < cached[0]:
+            return copy.deepcopy(cached[1])
+        response = self._request("GET", f"panel/api/inbounds/get/{inbound_id}")
+        with self._cache_lock:
+            self._inbound_details[inbound_id] = (time.monotonic() + INBOUND_DETAILS_TTL, response)
+        return copy.deepcopy(response)
+
+    def _drop_cached_inbounds(self, inbound_id: Optional[int] = None) -> None:
+        """Drop the inbound listing and, if given, one inbound's cached reply."""
+        with self._cache_lock:
+            self._inbounds_cache = None
+            if inbound_id is not None:
+                self._inbound_details.pop(int(inbound_id), None)
+
+    def _record_added_clients(self, inbound_id: int, client_entries: List[Dict[str, Any]]) -> None:
+        """Add new clients to the cached ``get_inbound`` reply, or drop the reply.
+
+        Ports and stream settings do not change when clients are added, so
+        the cached reply stays usable once the clients are appended to it.
+        The reply is replaced rather than edited, and ``settings`` keeps the
+        form the panel sent it in.
+        """
+        with self._cache_lock:
+            self._append_cached_clients(inbound_id, client_entries)
+
+    def _append_cached_clients(self, inbound_id: int, client_entries: List[Dict[str, Any]]) -> None:
+        """Body of ``_record_added_clients``; call with ``_cache_lock`` held."""
+        cached = self._inbound_details.get(inbound_id)
+        if cached is None:
+            return
+        expires_at, reply = cached
+        inbound = reply.get("obj")
+        raw = inbound.get("settings") if isinstance(inbound, dict) else None
+        settings = None
+        try:
+            settings = _loads(raw) if isinstance(raw, str) else raw
+        except json.JSONDecodeError:
+            pass
+        clients = settings.get("clients") if isinstance(settings, dict) else None
+        if not isinstance(clients, list):
+            self._inbound_details.pop(inbound_id, None)
+            return
+        settings = dict(settings, clients=clients + list(client_entries))
+        if isinstance(raw, str):
+            settings = _dumps(settings)
+        updated = dict(reply, obj=dict(inbound, settings=settings))
+        self._inbound_details[inbound_id] = (expires_at, updated)
 
     def list_inbounds(self) -> List[Dict[str, Any]]:
         """List all inbounds configured on the panel.
 
+        The listing is reused for ``INBOUNDS_CACHE_TTL`` seconds and dropped
+        whenever this client adds or removes a panel client. Callers get
+        their own list of their own inbound dicts, so changing them does not
+        touch the cache; nested values such as ``settings`` are shared.
+
         Returns:
             List of inbound configurations.
         """
+        return [dict(inbound) for inbound in self._inbound_listing()]
+
+    def _inbound_listing(self) -> List[Dict[str, Any]]:
+        """Return the cached inbound listing itself, fetching it when stale.
+
+        Internal lookups use this so the client index, which is tied to
+        the listing object, is reused across calls.
+        """
+        cached = self._cached_inbounds()
+        if cached is not None:
+            return cached
         response = self._request("GET", "panel/api/inbounds/list")
         inbounds = response.get("obj", [])
-        if isinstance(inbounds, list):
+        if not isinstance(inbounds, list):
+            return []
+        with self._cache_lock:
+            self._inbounds_cache = (time.monotonic() + INBOUNDS_CACHE_TTL, inbounds)
+        return inbounds
+
+    def _cached_inbounds(self) -> Optional[List[Dict[str, Any]]]:
+        """Return the inbound listing if it is still fresh."""
+        with self._cache_lock:
+            if self._inbounds_cache is None:
+                return None
+            expires_at, inbounds = self._inbounds_cache
+            if time.monotonic() >= expires_at:
+                self._inbounds_cache = None
+                return None
             return inbounds
-        return []
+
+    @staticmethod
+    def _inbound_clients(inbound: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Return the client entries from an inbound's settings.
+
+        The panel sends ``settings`` as a JSON string. The inbound itself is
+        left as the panel sent it; the decoded clients live in the client
+        index, which is built once per cached listing.
+        """
+        settings = inbound.get("settings")
+        if isinstance(settings, str):
+            settings = _loads(settings)
+        clients = settings.get("clients", []) if isinstance(settings, dict) else []
+        return [client for client in clients if isinstance(client, dict)]
+
+    def _clients_by_key(self, inbounds: List[Dict[str, Any]]) -> _ClientIndex:
+        """Map each client id and email to its ``(inbound, client)`` pair.
+
+        The index is rebuilt only when ``inbounds`` is a different listing,
+        so it expires together with the inbound cache. It is built under the
+        cache lock, since building it decodes each inbound's settings in place.
+        """
+        with self._cache_lock:
+            if self._client_index is not None and self._client_index[0] is inbounds:
+                return self._client_index[1]
+            index = self._index_clients(inbounds)
+            self._client_index = (inbounds, index)
+            return index
+
+    def _index_clients(self, inbounds: List[Dict[str, Any]]) -> _ClientIndex:
+        """Build the lookup index for ``_clients_by_key``."""
+        index: _ClientIndex = {}
+        for inbound in inbounds:
+            try:
+                clients = self._inbound_clients(inbound)
+            except (json.JSONDecodeError, TypeError) as exc:
+                LOGGER.warning(
+                    "Error parsing settings for inbound %s: %s",
+                    inbound.get("id", "unknown"),
+                    exc,
+                )
+                continue
+            for client in clients:
+                for key in (client.get("id"), client.get("email")):
+                    if key is not None:
+                        index.setdefault(key, (inbound, client))
+        return index
+
+    @staticmethod
+    def _inbound_client_stats(inbound: Dict[str, Any], email: Any) -> Optional[Dict[str, Any]]:
+        """Return the ``clientStats`` traffic entry for ``email``, if present."""
+        for stats in inbound.get("clientStats") or []:
+            if isinstance(stats, dict) and stats.get("email") == email:
+                return stats
+        return None
 
     def delete_client_by_path(self, inbound_id: int, client_id: str) -> Dict[str, Any]:
         """Remove a client using the path-based endpoint format.
@@ -446,7 +1048,8 @@ class XUIClient:
         Returns:
             API response
         """
-        path = f"panel/api/inbounds/{int(inbound_id)}/delClient/{client_id}"
+        path = f"panel/api/inbounds/{int(inbound_id)}/delClient/{quote(str(client_id), safe='')}"
+        self._drop_cached_inbounds(inbound_id)
         return self._request("POST", path)
 
     def get_client_traffic_by_id(self, client_id: str) -> Optional[Dict[str, Any]]:
@@ -461,8 +1064,19 @@ class XUIClient:
         Returns:
             Traffic statistics or None if not found
         """
+        # A fresh inbound listing already carries the traffic counters
+        cached = self._cached_inbounds()
+        entry = self._clients_by_key(cached).get(client_id) if cached else None
+        if entry is not None and entry[1].get("id") == client_id:
+            inbound, client = entry
+            stats = self._inbound_client_stats(inbound, client.get("email"))
+            if stats is not None:
+                return stats
+
         try:
-            response = self._request("GET", f"panel/api/inbounds/getClientTrafficsById/{client_id}")
+            response = self._request(
+                "GET", f"panel/api/inbounds/getClientTrafficsById/{quote(str(client_id), safe='')}"
+            )
             obj = response.get("obj")
             if isinstance(obj, list) and len(obj) > 0:
                 return obj[0]
@@ -483,38 +1097,53 @@ class XUIClient:
         Returns:
             Client info dict or None if not found
         """
-        inbounds = self.list_inbounds()
-        if not inbounds:
-            return None
+        return self.get_client_infos([client_id])[client_id]
 
-        for inbound in inbounds:
-            try:
-                settings = inbound.get("settings")
-                if isinstance(settings, str):
-                    settings = json.loads(settings)
+    def get_client_infos(self, client_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get client information for several clients from one inbound listing.
 
-                clients = settings.get("clients", []) if isinstance(settings, dict) else []
+        Traffic missing from the listing is fetched from the panel
+        concurrently, at most ``MAX_PARALLEL_LOOKUPS`` requests at a time.
 
-                for client in clients:
-                    if not isinstance(client, dict):
-                        continue
-                    if client.get("id") == client_id or client.get("email") == client_id:
-                        # Return a copy to avoid modifying the original inbound data
-                        result = client.copy()
-                        # Try to add traffic info
-                        traffic = self.get_client_traffic_by_id(client_id)
-                        if traffic:
-                            result.update(traffic)
-                        return result
-            except (json.JSONDecodeError, TypeError) as exc:
-                LOGGER.warning(
-                    "Error parsing settings for inbound %s: %s",
-                    inbound.get("id", "unknown"),
-                    exc,
-                )
-                continue
+        Args:
+            client_ids: Client UUIDs or emails
 
-        return None
+        Returns:
+            Mapping of each requested id to its client info, or None if not found
+        """
+        inbounds = self._inbound_listing()
+        index = self._clients_by_key(inbounds) if inbounds else {}
+        infos: Dict[str, Optional[Dict[str, Any]]] = {}
+        missing: Dict[str, Dict[str, Any]] = {}
+        for client_id in client_ids:
+            entry = index.get(client_id)
+            if entry is None:
+                infos[client_id] = None
+                continue
+            inbound, client = entry
+            # Return a copy to avoid modifying the original inbound data
+            result = infos[client_id] = client.copy()
+            # Traffic usually comes with the listing; ask the panel otherwise
+            traffic = self._inbound_client_stats(inbound, client.get("email"))
+            if traffic is None:
+                missing[client_id] = result
+            else:
+                result.update(traffic)
+
+        if len(missing) == 1:
+            traffics = [self.get_client_traffic_by_id(next(iter(missing)))]
+        elif missing:
+            with ThreadPoolExecutor(
+                max_workers=min(MAX_PARALLEL_LOOKUPS, len(missing)),
+                thread_name_prefix="xui-traffic",
+            ) as pool:
+                traffics = list(pool.map(self.get_client_traffic_by_id, missing))
+        else:
+            traffics = []
+        for result, traffic in zip(missing.values(), traffics):
+            if traffic:
+                result.update(traffic)
+        return infos
 
     def check_connection(self) -> bool:
         """Verify connection to the panel is working.